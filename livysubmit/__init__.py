@@ -0,0 +1 @@
+from .api import Livy, Session, Statement, StatementResult, LivyError, StatementError
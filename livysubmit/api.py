@@ -0,0 +1,308 @@
+"""
+Programmatic interface to Livy. Nothing is printed, every call returns its
+result or raises a LivyError:
+
+    from livysubmit import Livy
+
+    with Livy('https://edgenode:8998', username='me', password='secret') as livy:
+        with livy.create_session(name='my job', executorMemory='8g') as session:
+            result = session.run('print(1)')
+            result.raise_for_error()
+            print(result.text)
+"""
+
+from .client import LivyClient
+from .polling import PollScheduler
+from .resources import FINISHED_SESSION_STATES, fetch_statement, iter_sessions
+
+
+class LivyError(Exception):
+    pass
+
+
+class StatementError(LivyError):
+    """
+    Raised by StatementResult.raise_for_error for a statement that failed
+    @params:
+        result  - Required  : the result of the statement (StatementResult)
+    """
+    def __init__(self, result):
+        self.result = result
+        if result.error is not None:
+            message = 'Statement {} failed with {}: {}'.format( result.statement_id, result.error[0], result.error[1] )
+        else:
+            message = 'Statement {} ended in state {}'.format( result.statement_id, result.state )
+        super(StatementError, self).__init__( message )
+
+
+class StatementResult(object):
+    """
+    Final status of a statement as returned by Livy
+    @params:
+        status  - Required  : the statement json of Livy (Dict)
+    """
+    def __init__(self, status):
+        self.status = status
+        self.statement_id = status['id']
+        self.state = status['state']
+        self.output = status.get('output')
+
+    @property
+    def ok(self):
+        return self.state == 'available' and self.output is not None and self.output.get('status') == 'ok'
+
+    @property
+    def data(self):
+        # Output data per mime type, the values are None when the output was
+        # written to a file
+        if not self.ok:
+            return {}
+        return self.output.get( 'data', {} )
+
+    @property
+    def text(self):
+        return self.data.get('text/plain')
+
+    @property
+    def error(self):
+        # (ename, evalue) of a statement that raised an exception
+        if self.output is None or self.output.get('status') != 'error':
+            return None
+        return ( self.output.get('ename'), self.output.get('evalue') )
+
+    @property
+    def traceback(self):
+        if self.output is None:
+            return None
+        return ''.join( self.output.get( 'traceback', [] ))
+
+    def raise_for_error(self):
+        if not self.ok:
+            raise StatementError( self )
+        return self
+
+
+class Statement(object):
+    """
+    A statement that was submitted to a session
+    @params:
+        session         - Required  : the session of the statement (Session)
+        statement_id    - Required  : id of the statement (Int)
+    """
+    def __init__(self, session, statement_id):
+        self.session = session
+        self.id = statement_id
+
+    @property
+    def path(self):
+        return '/sessions/{}/statements/{}'.format( self.session.id, self.id )
+
+    def get_status(self, output_writer=None, from_cache=False):
+        # With an output_writer, the output data is passed to it while the
+        # response is parsed instead of being kept in memory. With from_cache
+        # a statement that is in the statement cache is not asked from Livy
+        livy = self.session.livy
+        status_code, status = fetch_statement( livy.client, self.session.id, self.id, data_writer=output_writer
+                                               , cache=livy.statement_cache, identities=livy.session_identities, from_cache=from_cache )
+        if status_code == 404:
+            raise LivyError( 'Statement {} of session {} does not exist'.format( self.id, self.session.id ))
+        return status
+
+    def status(self, from_cache=False):
+        return self.get_status( from_cache=from_cache )
+
+    def wait(self, timeout=17200, output_file=None, compress=False, callback=None):
+        """
+        Wait until the statement is no longer waiting or running and return
+        its StatementResult. The output is written to output_file (gzipped if
+        compress is set) if one is given, callback is called with the status
+        of every poll.
+        """
+        output_writer = None
+        if output_file is not None:
+            from .streaming import OutputWriter
+            output_writer = OutputWriter( output_file, compress=compress )
+
+        status = None
+        poller = self.session.livy.make_poller( timeout )
+        for i in poller:
+            status = self.get_status( output_writer=output_writer )
+            poller.observe( (status['state'], status['progress']) )
+            if callback is not None:
+                callback( status )
+
+            if status['state'] not in [ 'waiting', 'running' ]:
+                break
+        else:
+            raise LivyError( 'Statement {} of session {} did not finish within {} seconds'.format( self.id, self.session.id, timeout ))
+
+        result = StatementResult( status )
+        if output_writer is not None and result.ok:
+            output_writer.close()
+        return result
+
+    def cancel(self):
+        result = self.session.livy.client.post( self.path + '/cancel' )
+        return result.status_code == 200
+
+
+class Session(object):
+    """
+    An interactive session. Used as a context manager the session is deleted
+    at the end of the with block.
+    @params:
+        livy        - Required  : the Livy server of the session (Livy)
+        session_id  - Required  : id of the session (Int)
+    """
+    def __init__(self, livy, session_id):
+        self.livy = livy
+        self.id = session_id
+
+    def state(self):
+        # None if the session does not exist (anymore)
+        result = self.livy.client.get( '/sessions/{}/state'.format( self.id ))
+        if result.status_code == 404:
+            return None
+        return result.json()['state']
+
+    def info(self):
+        result = self.livy.client.get( '/sessions/{}'.format( self.id ))
+        if result.status_code == 404:
+            raise LivyError( 'Session {} does not exist'.format( self.id ))
+        return result.json()
+
+    def wait_until_idle(self, timeout=3600):
+        state = None
+        poller = self.livy.make_poller( timeout )
+        for i in poller:
+            state = self.state()
+            poller.observe( state )
+            if state == 'idle':
+                return self
+            if state is None or state in FINISHED_SESSION_STATES:
+                raise LivyError( 'Session {} ended in state {}'.format( self.id, state ))
+
+        raise LivyError( 'Session {} did not become idle within {} seconds (state {})'.format( self.id, timeout, state ))
+
+    def submit(self, code):
+        result = self.livy.client.post( '/sessions/{}/statements'.format( self.id ), { 'code' : code })
+        if result.status_code not in [ 200, 201 ]:
+            raise LivyError( 'Livy did not accept the statement (status {}): {}'.format( result.status_code, result.text ))
+        return Statement( self, result.json()['id'] )
+
+    def run(self, code, timeout=17200, output_file=None, compress=False):
+        # Submit the code and wait for its StatementResult
+        return self.submit( code ).wait( timeout=timeout, output_file=output_file, compress=compress )
+
+    def statements(self):
+        result = self.livy.client.get( '/sessions/{}/statements'.format( self.id ))
+        if result.status_code == 404:
+            raise LivyError( 'Session {} does not exist'.format( self.id ))
+        return [ Statement( self, s['id'] ) for s in result.json().get( 'statements', [] ) ]
+
+    def log(self, offset=0, size=100):
+        result = self.livy.client.get( '/sessions/{}/log'.format( self.id ), params={ 'from' : offset, 'size' : size })
+        if result.status_code == 404:
+            raise LivyError( 'Session {} does not exist'.format( self.id ))
+        return result.json().get( 'log', [] )
+
+    def delete(self):
+        # Returns False if the session did not exist (anymore)
+        result = self.livy.client.delete( '/sessions/{}'.format( self.id ))
+        return result.status_code != 404
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.delete()
+
+
+class Livy(object):
+    """
+    Connection to a Livy server
+    @params:
+        url                 - Required  : url of the Livy server (Str)
+        username            - Optional  : user name, also used as proxy user of new sessions (Str)
+        password            - Optional  : password for basic authentication (Str)
+        token               - Optional  : token for bearer authentication (Str)
+        auth                - Optional  : 'kerberos' or any auth accepted by requests, overrides password and token
+        poll_min_interval   - Optional  : minimum number of seconds between two status requests (Float)
+        poll_max_interval   - Optional  : maximum number of seconds between two status requests (Float)
+        statement_cache     - Optional  : stores the finished statements, shared with livy_submit (StatementCache)
+        client_options      - Optional  : passed on to LivyClient, e.g. pool_size, retries or timeout
+    """
+    def __init__(self, url, username=None, password=None, token=None, auth=None,
+                 poll_min_interval=1.0, poll_max_interval=15.0, statement_cache=None, **client_options):
+        if auth == 'kerberos':
+            from .credentials import kerberos_auth
+            auth = kerberos_auth()
+        elif auth is None and token is not None:
+            from .credentials import BearerAuth
+            auth = BearerAuth( token )
+        elif auth is None and password is not None:
+            auth = ( username, password )
+
+        headers = { 'Content-Type' : 'application/json', 'X-Requested-By' : username or 'livysubmit' }
+        headers.update( client_options.pop( 'headers', None ) or {} )
+
+        self.username = username
+        self.poll_min_interval = poll_min_interval
+        self.poll_max_interval = poll_max_interval
+        self.statement_cache = statement_cache
+        # Identities of the sessions in the statement cache
+        self.session_identities = {}
+        self.client = LivyClient( url, auth=auth, headers=headers, **client_options )
+
+    def make_poller(self, timeout):
+        return PollScheduler( min_interval=self.poll_min_interval, max_interval=self.poll_max_interval, timeout=timeout )
+
+    def sessions(self, page_size=100):
+        # Iterate over the json of all sessions, fetching them page by page
+        return iter_sessions( self.client, page_size )
+
+    def session(self, session_id):
+        return Session( self, session_id )
+
+    def create_session(self, name=None, kind='pyspark', wait=True, timeout=3600, **settings):
+        """
+        Start a new session and (unless wait is False) wait until it is idle.
+        The settings are the fields of the Livy session request, e.g.
+        executorMemory='8g' or conf={ 'spark.dynamicAllocation.enabled' : 'true' }
+        """
+        data = { 'kind' : kind }
+        if name is not None:
+            data['name'] = name
+        if self.username is not None:
+            data['proxyUser'] = self.username
+        data.update( settings )
+
+        result = self.client.post( '/sessions', data )
+        if result.status_code not in [ 200, 201 ]:
+            raise LivyError( 'Livy did not accept the session (status {}): {}'.format( result.status_code, result.text ))
+
+        session = Session( self, result.json()['id'] )
+
+        # Cached statements of an earlier session with the same id belong to a
+        # session that no longer exists
+        livy_url = self.client.owner( 'sessions', session.id )
+        self.session_identities.pop( ( livy_url, session.id ), None )
+        if self.statement_cache is not None:
+            self.statement_cache.forget_session( livy_url, session.id )
+
+        if wait:
+            try:
+                session.wait_until_idle( timeout=timeout )
+            except LivyError:
+                session.delete()
+                raise
+        return session
+
+    def close(self):
+        self.client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
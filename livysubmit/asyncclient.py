@@ -0,0 +1,128 @@
+import asyncio
+import functools
+import sys
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .livysubmit import make_poller, print_request_count
+from .polling import PollScheduler
+
+
+class AsyncLivyClient(object):
+    """
+    asyncio interface on top of a LivyClient. The requests themselves are
+    executed by a pool of threads sharing the pooled connections of the
+    LivyClient, so at most `concurrency` requests are in flight at the same
+    time while any number of coroutines can be waiting for their turn.
+    @params:
+        client          - Required  : the LivyClient used for the requests (LivyClient)
+        concurrency     - Optional  : maximum number of concurrent requests (Int)
+    """
+    def __init__(self, client, concurrency=10):
+        self.client = client
+        self.executor = ThreadPoolExecutor( max_workers=concurrency )
+
+    async def request(self, method, path, **kwargs):
+        # get_event_loop is deprecated inside coroutines; Python 3.6 only has it
+        loop = getattr( asyncio, 'get_running_loop', asyncio.get_event_loop )()
+        return await loop.run_in_executor( self.executor, functools.partial( self.client.request, method, path, **kwargs ))
+
+    async def get_statement(self, session_id, statement_id):
+        result = await self.request( 'GET', '/sessions/{}/statements/{}'.format( session_id, statement_id ))
+        if result.status_code == 404:
+            return None
+
+        return result.json()
+
+    async def get_session_state(self, session_id):
+        result = await self.request( 'GET', '/sessions/{}/state'.format(session_id) )
+        if result.status_code == 404:
+            return None
+
+        return result.json()['state']
+
+    async def get_session(self, session_id):
+        result, result_statements = await asyncio.gather( self.request( 'GET', '/sessions/{}'.format(session_id) )
+                                                          , self.request( 'GET', '/sessions/{}/statements'.format(session_id) ))
+
+        if result.status_code == 404:
+            return None
+
+        result_object = result.json()
+        if result_statements.status_code == 200:
+            result_object['statements'] = result_statements.json()
+        else:
+            result_object['statements'] = { 'statements' : [] }
+
+        return result_object
+
+    async def wait_for_statement(self, session_id, statement_id, poller=None, callback=None):
+        # Wait until the statement is no longer waiting or running. Returns the
+        # last statement status, callback is called with the status for every poll
+        if poller is None:
+            poller = PollScheduler( timeout=17200 )
+
+        statement_status = None
+        async for i in poller:
+            statement_status = await self.get_statement( session_id, statement_id )
+            if statement_status is None:
+                break
+
+            poller.observe( ( statement_status['state'], statement_status['progress'] ))
+            if callback is not None:
+                callback( statement_status )
+
+            if statement_status['state'] not in [ 'running', 'waiting' ]:
+                break
+
+        return statement_status
+
+    def close(self):
+        self.executor.shutdown( wait=False )
+
+
+async def watch_statements_async(parsed_arguments, client, pairs):
+    # Every change is passed to the renderer as soon as it is seen; the
+    # renderer only writes when the state or progress of a statement changed
+    renderer = parsed_arguments['renderer']
+    statements = { (session_id, statement_id) : { 'id' : statement_id, 'state' : 'unknown', 'progress' : 0.0 } for session_id, statement_id in pairs }
+
+    def make_callback(key):
+        def callback(statement_status):
+            statements[key] = statement_status
+            renderer.statements_wait( statements )
+        return callback
+
+    if renderer.inline:
+        renderer.statements_wait( statements )
+    results = await asyncio.gather( *[ client.wait_for_statement( session_id, statement_id
+                                                                , poller=make_poller( parsed_arguments, timeout=17200 )
+                                                                , callback=make_callback( (session_id, statement_id) ))
+                                        for session_id, statement_id in pairs ] )
+
+    for key, statement_status in zip( pairs, results ):
+        if statement_status is None:
+            statements[key] = { 'id' : key[1], 'state' : 'not found', 'progress' : 0.0 }
+
+    renderer.statements_done( statements )
+
+
+def watch_statements(parsed_arguments):
+    values = parsed_arguments['watch']
+    if len(values) % 2 != 0:
+        print('ERROR: --watch expects pairs of SESSION_ID STATEMENT_ID')
+        sys.exit(1)
+
+    pairs = list( zip( values[0::2], values[1::2] ))
+
+    client = AsyncLivyClient( parsed_arguments['client'], concurrency=parsed_arguments['max_concurrent_requests'] )
+
+    print("Watching {} statements".format( len(pairs) ))
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete( watch_statements_async( parsed_arguments, client, pairs ))
+    finally:
+        loop.close()
+        client.close()
+
+    print_request_count( parsed_arguments )
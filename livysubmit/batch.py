@@ -0,0 +1,99 @@
+import os
+import sys
+
+from .livysubmit import make_session_data, make_upload_store, tail_session_log, follow_session_log, trace_phase, print_request_count
+from .storage import stage_file
+
+
+def batch_file(parsed_arguments):
+    # Livy reads the script of a batch itself, so a local script has to be
+    # uploaded to a location the cluster can access first
+    path = parsed_arguments['batch']
+    if not os.path.exists( path ):
+        return path
+
+    if parsed_arguments['upload_store'] is None:
+        print("ERROR: {} is a local file, use --upload-store to upload it to a location that is accessible by the cluster".format( path ))
+        sys.exit(1)
+
+    store = make_upload_store( parsed_arguments )
+    return stage_file( store, path )
+
+
+def make_batch_data(parsed_arguments):
+    # Same resources as an interactive session, but a file to execute instead of a kind
+    data = make_session_data( parsed_arguments, parsed_arguments['task_name'] )
+    del data['kind']
+
+    data['file'] = batch_file( parsed_arguments )
+    if parsed_arguments['batch_args']:
+        data['args'] = parsed_arguments['batch_args']
+
+    return data
+
+
+def get_batch(parsed_arguments, batch_id):
+    result = parsed_arguments['client'].get( '/batches/{}'.format(batch_id))
+
+    if result.status_code == 404:
+        return None
+
+    return result.json()
+
+
+def batch_submit(parsed_arguments):
+    result = parsed_arguments['client'].post( '/batches', make_batch_data( parsed_arguments ))
+
+    if result.status_code not in [ 200, 201 ]:
+        print("ERROR: Livy did not accept the batch (status {}): {}".format( result.status_code, result.text ))
+        sys.exit(1)
+
+    batch = result.json()
+    trace_phase( parsed_arguments, 'create', 'batch-{}'.format( batch['id'] ))
+
+    print("Submitted batch with id = {} (state: {})".format( batch['id'], batch['state'] ))
+    print("Use --batch-status {0}, --batch-log {0} or --batch-kill {0} to follow up on the batch".format( batch['id'] ))
+
+    if not parsed_arguments['filename_session_id'] is None:
+        with open( parsed_arguments['filename_session_id'], 'w' ) as f:
+            f.write( str(batch['id']) )
+
+    print_request_count( parsed_arguments )
+
+
+def batch_status(parsed_arguments):
+    batch = get_batch( parsed_arguments, parsed_arguments['batch_status'] )
+    if batch is None:
+        print("Batch {} does not exist".format( parsed_arguments['batch_status'] ))
+        sys.exit(1)
+
+    app_info = batch.get('appInfo') or {}
+    print("Information for batch {}:".format( batch['id'] ))
+    print("    Name       : {}".format( batch.get('name') ))
+    print("    User       : {}".format( batch.get('proxyUser') ))
+    print("    State      : {}".format( batch['state'] ))
+    print("    Application: {}".format( batch.get('appId') ))
+    print("    Spark UI   : {}".format( app_info.get('sparkUiUrl') ))
+    print("    Driver log : {}".format( app_info.get('driverLogUrl') ))
+
+
+def batch_log(parsed_arguments):
+    if get_batch( parsed_arguments, parsed_arguments['batch_log'] ) is None:
+        print("Batch {} does not exist".format( parsed_arguments['batch_log'] ))
+        sys.exit(1)
+
+    if parsed_arguments['follow']:
+        follow_session_log( parsed_arguments, parsed_arguments['batch_log'], resource='batches' )
+    else:
+        tail_session_log( parsed_arguments, parsed_arguments['batch_log'], [], sys.stdout, resource='batches' )
+
+
+def batch_kill(parsed_arguments):
+    result = parsed_arguments['client'].delete( '/batches/{}'.format( parsed_arguments['batch_kill'] ))
+
+    if result.status_code == 404:
+        print("Cannot kill batch {} because it does not exist".format( parsed_arguments['batch_kill'] ))
+        sys.exit(1)
+
+    trace_phase( parsed_arguments, 'deleted', 'batch-{}'.format( parsed_arguments['batch_kill'] ))
+    print("Killed batch {}".format( parsed_arguments['batch_kill'] ))
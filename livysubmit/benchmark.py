@@ -0,0 +1,228 @@
+import argparse
+import collections
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from .mockserver import MockLivyServer
+
+
+def scenario_list_sessions(server, options, directory):
+    for i in range( options.sessions ):
+        server.add_session({ 'name' : 'LivySubmit - benchmark {}'.format(i), 'proxyUser' : 'benchmark', 'kind' : 'pyspark' })
+    return [ '-l' ]
+
+
+def scenario_information(server, options, directory):
+    session_id = server.add_session({ 'name' : 'LivySubmit - information', 'proxyUser' : 'benchmark', 'kind' : 'pyspark' })
+    for i in range(10):
+        server.add_statement( session_id, 'print({})'.format(i), completed=True )
+    return [ '-i', str(session_id) ]
+
+
+def scenario_delete(server, options, directory):
+    session_id = server.add_session({ 'name' : 'LivySubmit - delete', 'proxyUser' : 'benchmark', 'kind' : 'pyspark' })
+    return [ '-d', str(session_id) ]
+
+
+def scenario_task_status(server, options, directory):
+    session_id = server.add_session({ 'name' : 'LivySubmit - task status', 'proxyUser' : 'benchmark', 'kind' : 'pyspark' })
+    statement_id = server.add_statement( session_id, 'print(1)' )
+    return [ '-t', str(session_id), str(statement_id) ]
+
+
+def scenario_retrieve_output(server, options, directory):
+    session_id = server.add_session({ 'name' : 'LivySubmit - retrieve output', 'proxyUser' : 'benchmark', 'kind' : 'pyspark' })
+    statement_id = server.add_statement( session_id, 'print(1)', completed=True )
+    return [ '-r', str(session_id), str(statement_id), '-o', os.path.join( directory, 'retrieve_output.txt' ) ]
+
+
+def scenario_submit(server, options, directory):
+    script = os.path.join( directory, 'benchmark_submit.py' )
+    with open( script, 'w' ) as f:
+        f.write( 'print(1)\n' )
+    return [ '-s', script, '-o', os.path.join( directory, 'submit_output.txt' ) ]
+
+
+SCENARIOS = collections.OrderedDict([
+    ( 'list-sessions', scenario_list_sessions )
+    , ( 'information', scenario_information )
+    , ( 'delete', scenario_delete )
+    , ( 'task-status', scenario_task_status )
+    , ( 'retrieve-output', scenario_retrieve_output )
+    , ( 'submit', scenario_submit )
+])
+
+
+# On Linux the peak memory of a process includes the peak memory of its parent
+# at the moment it was forked, so the command is started from this small
+# wrapper process instead of from the benchmark (which holds the mock server)
+MEASURE_WRAPPER = """
+import os, sys
+pid = os.fork()
+if pid == 0:
+    os.execv(sys.argv[1], sys.argv[1:])
+pid, status, rusage = os.wait4(pid, 0)
+sys.stderr.write('\\n{} {}\\n'.format(status, rusage.ru_maxrss))
+"""
+
+
+def run_command(arguments, env):
+    # Run livy_submit in a separate process and return its exit code, wall
+    # time and peak resident memory in kilobytes
+    start = time.time()
+    result = subprocess.run( [ sys.executable, '-c', MEASURE_WRAPPER, sys.executable, '-m', 'livysubmit' ] + arguments, env=env
+                             , stdout=subprocess.DEVNULL, stderr=subprocess.PIPE )
+    wall_time = time.time() - start
+
+    stderr, measurement = result.stderr.decode('utf-8', 'replace').rstrip('\n').rsplit('\n', 1)
+    status, peak_rss = [ int(value) for value in measurement.split() ]
+    returncode = os.WEXITSTATUS( status ) if os.WIFEXITED( status ) else -os.WTERMSIG( status )
+
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    if sys.platform == 'darwin':
+        peak_rss = peak_rss // 1024
+
+    return returncode, wall_time, peak_rss, stderr
+
+
+def run_scenario(name, options, directory):
+    server = MockLivyServer( latency=options.latency, startup_time=options.startup_time
+                             , statement_time=options.statement_time, output_size=options.output_size )
+    with server:
+        arguments = SCENARIOS[name]( server, options, directory )
+        arguments += [ '-u', 'benchmark', '-p', 'benchmark'
+                       , '--poll-min-interval', str(options.poll_min_interval)
+                       , '--poll-max-interval', str(options.poll_max_interval) ]
+
+        env = dict( os.environ )
+        env['LIVY_SUBMIT_URL'] = server.url
+
+        server.reset_stats()
+        returncode, wall_time, peak_rss, stderr = run_command( arguments, env )
+
+        return {
+            'scenario' : name
+            , 'returncode' : returncode
+            , 'requests' : server.request_count
+            , 'wall_time' : wall_time
+            , 'bytes_sent' : server.bytes_sent
+            , 'bytes_received' : server.bytes_received
+            , 'peak_rss_kb' : peak_rss
+            , 'requests_per_url' : dict( server.requests )
+            , 'stderr' : stderr
+        }
+
+
+# Commands timed by --cold-start, the interpreter alone is the floor for the others
+COLD_START_COMMANDS = collections.OrderedDict([
+    ( 'python', [ '-c', 'pass' ] )
+    , ( 'import livysubmit', [ '-c', 'import livysubmit' ] )
+    , ( 'livy_submit -l', [ '-m', 'livysubmit', '-l', '-u', 'benchmark', '-p', 'benchmark' ] )
+])
+
+
+def measure_cold_start(options):
+    # Best wall time of options.runs runs of each command, against an empty
+    # server so the time is spent on starting up rather than on the response
+    results = collections.OrderedDict()
+    with MockLivyServer() as server:
+        env = dict( os.environ )
+        env['LIVY_SUBMIT_URL'] = server.url
+
+        for name, arguments in COLD_START_COMMANDS.items():
+            times = []
+            for i in range( options.runs ):
+                start = time.time()
+                subprocess.run( [ sys.executable ] + arguments, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True )
+                times.append( time.time() - start )
+            results[name] = min( times )
+
+    return results
+
+
+def print_cold_start(results):
+    print( '{:<20} {:>10}'.format( 'COMMAND', 'WALL' ))
+    print('-' * 31)
+    for name, wall_time in results.items():
+        print( '{:<20} {:>8.1f}ms'.format( name, wall_time * 1000 ))
+
+
+def print_results(results, verbose=False):
+    print_format = '{:<18} {:>8} {:>9} {:>12} {:>12} {:>12} {}'
+
+    print( print_format.format( 'SCENARIO', 'REQUESTS', 'WALL', 'SENT', 'RECEIVED', 'PEAK RSS', '' ))
+    print('-' * 80)
+    for result in results:
+        print( print_format.format( result['scenario']
+                                    , result['requests']
+                                    , '{:.2f}s'.format( result['wall_time'] )
+                                    , result['bytes_sent']
+                                    , result['bytes_received']
+                                    , '{} KB'.format( result['peak_rss_kb'] )
+                                    , '' if result['returncode'] == 0 else 'FAILED ({})'.format( result['returncode'] )))
+        if verbose:
+            for url, count in sorted( result['requests_per_url'].items() ):
+                print( '    {:<50} {:>6}'.format( url, count ))
+        if result['returncode'] != 0 and result['stderr'].strip() != '':
+            print( result['stderr'] )
+
+
+def make_parser():
+    parser = argparse.ArgumentParser( description='Benchmark livy_submit commands against a mock Livy server' )
+    parser.prog = 'python -m livysubmit.benchmark'
+
+    parser.add_argument( 'scenarios', nargs='*', metavar='SCENARIO'
+                         , help='Scenarios to run: {} (Default: all)'.format( ', '.join( SCENARIOS.keys() )))
+    parser.add_argument( '--sessions', type=int, default=1000, help='Number of sessions on the server for list-sessions (Default: 1000)' )
+    parser.add_argument( '--latency', type=float, default=0.0, help='Seconds added to every response of the server (Default: 0)' )
+    parser.add_argument( '--startup-time', type=float, default=2.0, help='Seconds before a new session becomes idle (Default: 2)' )
+    parser.add_argument( '--statement-time', type=float, default=3.0, help='Seconds a statement runs (Default: 3)' )
+    parser.add_argument( '--output-size', type=int, default=1024 * 1024, help='Number of bytes of output of a statement (Default: 1048576)' )
+    parser.add_argument( '--poll-min-interval', type=float, default=1.0, help='Passed on to livy_submit (Default: 1)' )
+    parser.add_argument( '--poll-max-interval', type=float, default=15.0, help='Passed on to livy_submit (Default: 15)' )
+    parser.add_argument( '--cold-start', action='store_true', help='Only measure the start up time of livy_submit' )
+    parser.add_argument( '--runs', type=int, default=10, help='Number of runs of --cold-start, the best one is reported (Default: 10)' )
+    parser.add_argument( '-v', '--verbose', action='store_true', help='Show the number of requests per url' )
+    parser.add_argument( '--json', action='store_true', help='Print the results as json' )
+
+    return parser
+
+
+def main():
+    parser = make_parser()
+    options = parser.parse_args()
+    scenarios = options.scenarios if len( options.scenarios ) > 0 else list( SCENARIOS.keys() )
+    for name in scenarios:
+        if name not in SCENARIOS:
+            parser.error( 'unknown scenario {}, choose from {}'.format( name, ', '.join( SCENARIOS.keys() )))
+
+    if options.cold_start:
+        results = measure_cold_start( options )
+        if options.json:
+            print( json.dumps( results, indent=2 ))
+        else:
+            print_cold_start( results )
+        return
+
+    directory = tempfile.mkdtemp()
+    try:
+        results = [ run_scenario( name, options, directory ) for name in scenarios ]
+    finally:
+        shutil.rmtree( directory )
+
+    if options.json:
+        print( json.dumps( results, indent=2 ))
+    else:
+        print_results( results, verbose=options.verbose )
+
+    if any( result['returncode'] != 0 for result in results ):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+import ast
+import base64
+import hashlib
+import io
+import json
+import os
+import zipfile
+
+
+DEFAULT_BUNDLE_DIRECTORY = os.path.join( os.path.expanduser('~'), '.livysubmit', 'bundles' )
+
+# Part of the content hash, so bundles are rebuilt when the preamble changes
+BUNDLE_VERSION = 1
+
+# Prepended to the script. The zip is written once per driver and put in front
+# of sys.path (zipimport), and shipped to the executors with addPyFile so the
+# modules can also be used in UDFs. Modules of an earlier bundle are unloaded
+# first, so a reused session does not keep running old code.
+PREAMBLE = '''def _livysubmit_bundle(digest, modules, data):
+    import base64, os, sys, tempfile
+    path = os.path.join(tempfile.gettempdir(), 'livysubmit-bundle-%s.zip' % digest)
+    if not os.path.exists(path):
+        with open(path + '.%d' % os.getpid(), 'wb') as f:
+            f.write(base64.b64decode(data))
+        os.replace(path + '.%d' % os.getpid(), path)
+    for name in modules:
+        sys.modules.pop(name, None)
+    sys.path[:] = [p for p in sys.path if 'livysubmit-bundle-' not in p]
+    sys.path.insert(0, path)
+    if globals().get('sc') is not None:
+        globals()['sc'].addPyFile(path)
+_livysubmit_bundle({digest!r}, {modules!r}, {data!r})
+del _livysubmit_bundle
+'''
+
+
+def module_file(root, module_name):
+    # Returns the source file of module_name below root, or None
+    path = os.path.join( root, *module_name.split('.') )
+    for candidate in [ path + '.py', os.path.join( path, '__init__.py' ) ]:
+        if os.path.isfile( candidate ):
+            return candidate
+    return None
+
+
+def imported_names(tree, module_name, is_package):
+    # Names of the modules that might be imported by the module, both absolute
+    # and resolved relative imports. For "from a import b", b can be a
+    # module as well.
+    package = module_name if is_package else module_name.rpartition('.')[0]
+    names = []
+    for node in ast.walk( tree ):
+        if isinstance( node, ast.Import ):
+            names.extend( alias.name for alias in node.names )
+        elif isinstance( node, ast.ImportFrom ):
+            if node.level > 0:
+                parts = package.split('.') if package != '' else []
+                if node.level - 1 > len(parts):
+                    continue
+                base = '.'.join( parts[:len(parts) - (node.level - 1)] + ( [node.module] if node.module else [] ))
+            else:
+                base = node.module
+            if base:
+                names.append( base )
+            names.extend( '{}.{}'.format( base, alias.name ) if base else alias.name for alias in node.names if alias.name != '*' )
+    return names
+
+
+def find_local_modules(script, roots):
+    # Returns { archive name : file } of all modules below the roots that the
+    # script imports, directly or through other local modules. The packages
+    # that contain a module are included as well.
+    modules = {}
+    queue = [ ( script, '__main__', False ) ]
+    while len(queue) > 0:
+        filename, module_name, is_package = queue.pop()
+        with open( filename, 'rb' ) as f:
+            tree = ast.parse( f.read(), filename=filename )
+
+        for name in imported_names( tree, module_name, is_package ):
+            parts = name.split('.')
+            for i in range( 1, len(parts) + 1 ):
+                prefix = '.'.join( parts[:i] )
+                for root in roots:
+                    path = module_file( root, prefix )
+                    if path is None:
+                        continue
+                    arcname = os.path.relpath( path, root ).replace( os.sep, '/' )
+                    if arcname not in modules and os.path.abspath( path ) != os.path.abspath( script ):
+                        modules[arcname] = path
+                        queue.append( ( path, prefix, arcname.endswith('/__init__.py') ) )
+                    break
+
+    return modules
+
+
+def module_names(arcnames):
+    names = []
+    for arcname in arcnames:
+        name = arcname[:-len('.py')].replace( '/', '.' )
+        if name.endswith('.__init__'):
+            name = name[:-len('.__init__')]
+        names.append( name )
+    return sorted( names )
+
+
+def build_zip(modules):
+    # Fixed timestamps and order, so the same sources give the same zip
+    buffer = io.BytesIO()
+    with zipfile.ZipFile( buffer, 'w', zipfile.ZIP_DEFLATED ) as z:
+        for arcname in sorted( modules ):
+            info = zipfile.ZipInfo( arcname, date_time=(1980, 1, 1, 0, 0, 0) )
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with open( modules[arcname], 'rb' ) as f:
+                z.writestr( info, f.read() )
+    return buffer.getvalue()
+
+
+def prepend(preamble, code):
+    # Puts the preamble in front of the code, after its docstring and its
+    # "from __future__" imports, as those have to come first in a module.
+    # Raises ValueError if the code continues on the line of such an import
+    try:
+        tree = ast.parse( code )
+    except SyntaxError:
+        return preamble + code
+
+    body = tree.body
+    leading = 1 if ast.get_docstring( tree, clean=False ) is not None else 0
+    while leading < len(body) and isinstance( body[leading], ast.ImportFrom ) and body[leading].module == '__future__':
+        leading += 1
+    if leading == 0 or not isinstance( body[leading - 1], ast.ImportFrom ):
+        return preamble + code
+
+    lines = code.splitlines( True )
+    if leading == len(body):
+        split = len(lines)
+    else:
+        # The decorators of a function or class come before its line
+        split = min( [ body[leading].lineno ] + [ d.lineno for d in getattr( body[leading], 'decorator_list', [] ) ] ) - 1
+        if split < body[leading - 1].lineno:
+            raise ValueError( "the code continues on the line of its last __future__ import (line {})".format( body[leading - 1].lineno ))
+
+    header = ''.join( lines[:split] )
+    if header != '' and not header.endswith('\n'):
+        header += '\n'
+    return header + preamble + ''.join( lines[split:] )
+
+
+def make_preamble(script, roots, directory=DEFAULT_BUNDLE_DIRECTORY):
+    """
+    Returns (preamble, info) for the local modules imported by script, or
+    (None, info) if it imports none. info holds the number of modules, the size
+    of the preamble and whether it came from the cache. The preamble is cached
+    in directory by the hash of the sources, so it is only rebuilt when one of
+    the modules changes.
+    @params:
+        script      - Required  : the script that is submitted (Str)
+        roots       - Required  : directories in which the imported modules are looked for (List)
+        directory   - Optional  : directory of the cached preambles (Str)
+    """
+    modules = find_local_modules( script, roots )
+    if len(modules) == 0:
+        return None, { 'modules' : 0, 'size' : 0, 'cached' : False }
+
+    digest = hashlib.sha256()
+    digest.update( str(BUNDLE_VERSION).encode('utf-8') )
+    for arcname in sorted( modules ):
+        with open( modules[arcname], 'rb' ) as f:
+            content = f.read()
+        digest.update( json.dumps( [ arcname, len(content) ] ).encode('utf-8') )
+        digest.update( content )
+    digest = digest.hexdigest()
+
+    cache_file = os.path.join( directory, digest + '.py' )
+    if os.path.exists( cache_file ):
+        with open( cache_file, 'r' ) as f:
+            preamble = f.read()
+        return preamble, { 'modules' : len(modules), 'size' : len(preamble), 'cached' : True }
+
+    data = base64.b64encode( build_zip( modules )).decode('ascii')
+    preamble = PREAMBLE.format( digest=digest[:16], modules=module_names( modules ), data=data )
+
+    if not os.path.isdir( directory ):
+        os.makedirs( directory, mode=0o700 )
+    with open( cache_file + '.{}'.format( os.getpid() ), 'w' ) as f:
+        f.write( preamble )
+    os.replace( cache_file + '.{}'.format( os.getpid() ), cache_file )
+
+    return preamble, { 'modules' : len(modules), 'size' : len(preamble), 'cached' : False }
@@ -0,0 +1,249 @@
+import copy
+import gzip
+import hashlib
+import json
+import os
+import time
+
+from .locking import locked_json
+
+
+DEFAULT_CACHE_DIRECTORY = os.path.join( os.path.expanduser('~'), '.livysubmit', 'cache' )
+
+# Megabytes of statements kept in the cache (Default of --cache-size)
+DEFAULT_CACHE_SIZE = 256
+
+# States after which a statement can no longer change
+FINISHED_STATEMENT_STATES = [ 'available', 'error', 'cancelled' ]
+
+
+def cache_key(livy_url, session_id, statement_id, session=None):
+    # Livy starts numbering sessions at 0 again after a restart, so the key
+    # ends with the identity of the session (see session_identity)
+    key = '{}/sessions/{}/statements/{}'.format( livy_url.rstrip('/'), session_id, statement_id )
+    if session is not None:
+        key += '#' + session
+    return key
+
+
+def session_identity(session):
+    # Identifies a session across restarts of Livy: the id of its Spark
+    # application, or the details it was created with while it has none
+    if session.get('appId'):
+        return session['appId']
+    return json.dumps( [ session.get('name'), session.get('owner'), session.get('proxyUser'), session.get('kind') ] )
+
+
+class CacheWriter(object):
+    """
+    Records the output data of a statement in a cache file while it is being
+    parsed and passes it on to the data_writer (if any). The file is only
+    created when the first data arrives. Recording stops as soon as the
+    compressed file grows beyond max_size, as it could never be cached.
+    @params:
+        filename    - Required  : temporary file to record to (Str)
+        data_writer - Optional  : called with every fragment as well, see streaming.OutputWriter
+        max_size    - Optional  : maximum number of bytes of the compressed file (Int)
+    """
+    def __init__(self, filename, data_writer=None, max_size=None):
+        self.filename = filename
+        self.data_writer = data_writer
+        self.max_size = max_size
+        self.f = None
+        self.too_large = False
+
+    def __call__(self, key, fragment):
+        if not self.too_large:
+            if self.f is None:
+                self.f = gzip.open( self.filename, 'wt', encoding='utf-8' )
+            self.f.write( json.dumps( [ key, fragment ] ) + '\n' )
+            # Bytes the compressor has written to the file so far
+            if self.max_size is not None and self.f.buffer.fileobj.tell() > self.max_size:
+                self.discard()
+                self.too_large = True
+        if self.data_writer is not None:
+            self.data_writer( key, fragment )
+
+    def discard(self):
+        if self.f is not None:
+            self.f.close()
+            os.remove( self.filename )
+            self.f = None
+
+
+class StatementCache(object):
+    """
+    On-disk cache of finished statements, shared by all livy_submit processes
+    of the user. Every statement is stored in its own gzipped file: a json line
+    with the statement without its output data, followed by a json line per
+    fragment of the output data, so a large output is never held in memory.
+    index.json holds the task name, state, completion time, size and last use
+    of every statement; the least recently used statements are removed when
+    the cache grows beyond max_size bytes.
+    @params:
+        directory   - Optional  : directory of the cache (Str)
+        max_size    - Optional  : maximum number of bytes of the cached statements (Int)
+    """
+    def __init__(self, directory=DEFAULT_CACHE_DIRECTORY, max_size=DEFAULT_CACHE_SIZE * 1024 * 1024):
+        self.directory = directory
+        self.max_size = max_size
+
+    def filename(self, key):
+        return os.path.join( self.directory, hashlib.sha256( key.encode('utf-8') ).hexdigest() + '.jsonl.gz' )
+
+    def index(self):
+        # index.json of the cache, locked while it is changed
+        return locked_json( os.path.join( self.directory, 'index.json' ), indent=2 )
+
+    def get(self, key, data_writer=None):
+        # Returns the cached statement, or None. The output data is passed to
+        # the data_writer instead of being returned if one is given (just like
+        # livysubmit.get_statement does)
+        filename = self.filename( key )
+        if not os.path.exists( filename ):
+            return None
+
+        try:
+            with gzip.open( filename, 'rt', encoding='utf-8' ) as f:
+                statement_status = json.loads( f.readline() )
+                data = {}
+                for line in f:
+                    data_key, fragment = json.loads( line )
+                    if data_writer is not None:
+                        data_writer( data_key, fragment )
+                    elif fragment is not None:
+                        data[data_key] = data.get( data_key, '' ) + fragment
+        except (OSError, ValueError):
+            # Removed by another process in the meantime, or damaged
+            return None
+
+        if data_writer is None and statement_status.get('output') is not None and 'data' in statement_status['output']:
+            statement_status['output']['data'].update( data )
+
+        with self.index() as entries:
+            if key in entries:
+                entries[key]['last_used'] = time.time()
+
+        return statement_status
+
+    def writer(self, key, data_writer=None):
+        # Writer that records the output data of the statement while it is
+        # being fetched, to be passed to put afterwards
+        if not os.path.isdir( self.directory ):
+            os.makedirs( self.directory, mode=0o700 )
+        return CacheWriter( '{}.{}.tmp'.format( self.filename( key ), os.getpid() ), data_writer, self.max_size )
+
+    def put(self, key, statement_status, info, cache_writer=None):
+        # Stores a finished statement. Without a cache_writer, the output data
+        # is taken from statement_status itself. info holds the fields of the
+        # index entry: livy_url, session_id, statement_id and task_name.
+        # A statement larger than the whole cache is not stored at all,
+        # instead of evicting everything else for it
+        if statement_status['state'] not in FINISHED_STATEMENT_STATES:
+            if cache_writer is not None:
+                cache_writer.discard()
+            return
+
+        if cache_writer is None:
+            cache_writer = self.writer( key )
+            output = statement_status.get('output') or {}
+            for data_key, value in ( output.get('data') or {} ).items():
+                cache_writer( data_key, value )
+                cache_writer( data_key, None )
+
+        if cache_writer.too_large:
+            return
+
+        # The data is in the following lines of the file
+        stripped = copy.deepcopy( statement_status )
+        if stripped.get('output') is not None and stripped['output'].get('data') is not None:
+            stripped['output']['data'] = { data_key : None for data_key in stripped['output']['data'] }
+
+        filename = self.filename( key )
+        temporary_filename = '{}.{}.part'.format( filename, os.getpid() )
+        data_filename = cache_writer.filename
+        with gzip.open( temporary_filename, 'wt', encoding='utf-8' ) as f:
+            f.write( json.dumps( stripped ) + '\n' )
+            if cache_writer.f is not None:
+                cache_writer.f.close()
+                with gzip.open( data_filename, 'rt', encoding='utf-8' ) as data:
+                    for line in data:
+                        f.write( line )
+                os.remove( data_filename )
+        if os.path.getsize( temporary_filename ) > self.max_size:
+            os.remove( temporary_filename )
+            return
+        os.replace( temporary_filename, filename )
+
+        output = statement_status.get('output') or {}
+        entry = dict( info )
+        entry.update({
+            'state' : statement_status['state']
+            , 'status' : output.get('status')
+            , 'completed' : ( statement_status.get('completed') or 0 ) / 1000.0 or time.time()
+            , 'file' : os.path.basename( filename )
+            , 'size' : os.path.getsize( filename )
+            , 'last_used' : time.time()
+        })
+
+        with self.index() as entries:
+            entries[key] = entry
+            self.evict( entries )
+
+    def evict(self, entries):
+        total = sum( entry['size'] for entry in entries.values() )
+        for key in sorted( entries, key=lambda k: entries[k]['last_used'] ):
+            if total <= self.max_size:
+                break
+            total -= entries[key]['size']
+            self.remove_file( entries.pop( key )['file'] )
+
+    def remove_file(self, name):
+        filename = os.path.join( self.directory, name )
+        if os.path.exists( filename ):
+            os.remove( filename )
+
+    def latest(self, key):
+        # The most recently completed of the cached statements with key,
+        # whatever session they belonged to (key made without session)
+        if not os.path.isdir( self.directory ):
+            return None
+
+        with self.index() as entries:
+            keys = [ k for k in entries if k == key or k.startswith( key + '#' ) ]
+            if len(keys) == 0:
+                return None
+            return max( keys, key=lambda k: entries[k]['completed'] )
+
+    def forget_session(self, livy_url, session_id):
+        # Livy starts numbering sessions at 0 again after a restart, so the
+        # statements of an earlier session with the same id are dropped
+        prefix = cache_key( livy_url, session_id, '' )
+        if not os.path.isdir( self.directory ):
+            return
+
+        with self.index() as entries:
+            for key in [ k for k in entries if k.startswith( prefix ) ]:
+                self.remove_file( entries.pop( key )['file'] )
+
+    def search(self, name=None, states=None, since=None, until=None):
+        # Index entries, most recent first. name is a pattern for the task
+        # name, states match the state of the statement or of its output
+        import fnmatch
+
+        if not os.path.isdir( self.directory ):
+            return []
+
+        with self.index() as entries:
+            results = list( entries.values() )
+
+        if name is not None:
+            results = [ e for e in results if fnmatch.fnmatchcase( e.get('task_name') or '', name ) ]
+        if states is not None:
+            results = [ e for e in results if e['state'] in states or e['status'] in states ]
+        if since is not None:
+            results = [ e for e in results if e['completed'] >= since ]
+        if until is not None:
+            results = [ e for e in results if e['completed'] < until ]
+
+        return sorted( results, key=lambda e: e['completed'], reverse=True )
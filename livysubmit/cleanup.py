@@ -0,0 +1,110 @@
+import sys
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .livysubmit import iter_sessions, session_matches, trace_phase, print_request_count
+
+
+def session_idle_time(parsed_arguments, session_id, now, endpoint=None):
+    # Seconds since the last statement of the session completed, 0 if a
+    # statement is still executing and None if no statement completed yet
+    result = parsed_arguments['client'].get( '/sessions/{}/statements'.format(session_id), endpoint=endpoint )
+    if result.status_code == 404:
+        return None
+
+    statements = result.json().get( 'statements', [] )
+    if any( s['state'] in [ 'waiting', 'running' ] for s in statements ):
+        return 0
+
+    completed = max( [ s.get('completed') or 0 for s in statements ] + [0] )
+    if completed == 0:
+        return None
+
+    return now - completed / 1000.0
+
+
+def cleanup_session(parsed_arguments, session, now):
+    # Returns what happened to the session
+    if parsed_arguments['idle_for'] is not None:
+        idle_time = session_idle_time( parsed_arguments, session['id'], now, endpoint=session.get('endpoint') )
+        if idle_time is None or idle_time < parsed_arguments['idle_for']:
+            return 'skipped'
+
+    if parsed_arguments['dry_run']:
+        return 'selected'
+
+    # Session ids are only unique per Livy server, so the session is deleted on
+    # the server it was listed on
+    result = parsed_arguments['client'].delete( '/sessions/{}'.format( session['id'] ), endpoint=session.get('endpoint') )
+    if result.status_code == 404:
+        return 'gone'
+    result.raise_for_status()
+
+    trace_phase( parsed_arguments, 'deleted', session['id'] )
+    return 'deleted'
+
+
+def session_cleanup(parsed_arguments):
+    if all( parsed_arguments[key] is None for key in [ 'filter_user', 'filter_state', 'filter_name', 'idle_for' ] ):
+        print("ERROR: --cleanup needs at least one of --filter-user, --filter-state, --filter-name or --idle-for")
+        sys.exit(1)
+
+    # All pages are fetched before deleting, because deleting sessions shifts
+    # the pages that are still to come
+    start = time.time()
+    sessions = [ s for s in iter_sessions( parsed_arguments ) if session_matches( parsed_arguments, s ) ]
+
+    if len(sessions) == 0:
+        print("No livy sessions match the filters")
+        print_request_count( parsed_arguments )
+        return
+
+    print("Checking {} sessions with {} parallel requests{}".format( len(sessions), parsed_arguments['parallel'], ' (dry run)' if parsed_arguments['dry_run'] else '' ))
+
+    print_lock = threading.Lock()
+    counts = {}
+    now = time.time()
+
+    def process(session):
+        try:
+            result = cleanup_session( parsed_arguments, session, now )
+        except Exception as e:
+            result = 'failed'
+            error = str(e)
+        else:
+            error = None
+
+        with print_lock:
+            counts[result] = counts.get( result, 0 ) + 1
+            if result != 'skipped':
+                message = {
+                    'selected' : 'Would delete'
+                    , 'deleted' : 'Deleted'
+                    , 'gone' : 'Already gone'
+                    , 'failed' : 'Failed to delete'
+                }[result]
+                print("{} session {:<6} {:<15} {:<14} {}".format( message, session['id'], session.get('proxyUser') or '', session['state'], session.get('name') or '' ))
+                if error is not None:
+                    print("    {}".format( error ))
+            sys.stdout.flush()
+
+    with ThreadPoolExecutor( max_workers=parsed_arguments['parallel'] ) as executor:
+        for session in sessions:
+            executor.submit( process, session )
+
+    duration = time.time() - start
+    print()
+    if parsed_arguments['dry_run']:
+        print("Would delete {} of {} matching sessions".format( counts.get('selected', 0), len(sessions) ))
+    else:
+        print("Deleted {} of {} matching sessions in {:.1f}s ({:.1f} sessions/s)".format(
+            counts.get('deleted', 0), len(sessions), duration, counts.get('deleted', 0) / duration if duration > 0 else 0.0 ))
+    if counts.get('skipped', 0) > 0:
+        print("Skipped {} sessions that were not idle for {:g} seconds".format( counts['skipped'], parsed_arguments['idle_for'] ))
+    print_request_count( parsed_arguments )
+
+    if counts.get('failed', 0) > 0:
+        print("Failed to delete {} sessions".format( counts['failed'] ))
+        sys.exit(1)
@@ -0,0 +1,271 @@
+import json
+import re
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Status codes for which an idempotent request is retried. These are the
+# responses a gateway in front of Livy returns while Livy itself is restarting
+# or overloaded.
+RETRY_STATUS_CODES = ( 502, 503, 504 )
+
+# Paths of a single session or batch, which are routed to the endpoint that owns it
+OWNED_PATH = re.compile( r'^/(sessions|batches)/([^/?]+)' )
+
+# Paths that create a session or batch on the least loaded endpoint
+CREATE_PATHS = ( '/sessions', '/batches' )
+
+
+class AmbiguousOwnerError(Exception):
+    """
+    Raised when a session or batch id exists on more than one of the Livy
+    servers, so it is not known which one is meant
+    @params:
+        resource    - Required  : 'sessions' or 'batches' (Str)
+        object_id   - Required  : id of the session or batch
+        matches     - Required  : (endpoint, json) of every server that has the id (List)
+    """
+    def __init__(self, resource, object_id, matches):
+        self.resource = resource
+        self.object_id = object_id
+        self.matches = matches
+        super(AmbiguousOwnerError, self).__init__( '{} {} exists on {} Livy servers: {}'.format(
+            resource[:-1].capitalize(), object_id, len(matches), ', '.join( endpoint for endpoint, info in matches )))
+
+
+class LivyClient(object):
+    """
+    Holds one pooled requests.Session that is used for every call to Livy.
+    With several Livy servers, new sessions and batches are created on the
+    healthy server with the fewest sessions (and then the lowest latency), and
+    every later request for a session or batch goes to the server that owns it.
+    @params:
+        livy_url        - Required  : base url of the Livy server, or a comma separated list of urls (Str)
+        auth            - Optional  : auth passed to requests, e.g. (user, password) tuple
+        headers         - Optional  : headers sent with every request (Dict)
+        pool_size       - Optional  : number of keep-alive connections kept in the pool (Int)
+        retries         - Optional  : number of retries for failed idempotent requests (Int)
+        backoff_factor  - Optional  : backoff factor between retries in seconds (Float)
+        timeout         - Optional  : (connect, read) timeout in seconds (Tuple)
+        verify          - Optional  : verify the TLS certificate of the server (Bool)
+        tracer          - Optional  : records every request, see tracing.Tracer (Tracer)
+        health_timeout  - Optional  : timeout in seconds of the health check of a server (Float)
+        health_interval - Optional  : seconds after which the health of the servers is checked again (Float)
+        rate_limiter    - Optional  : limits the number of requests per second, see ratelimit.RateLimiter (RateLimiter)
+    """
+    def __init__(self, livy_url, auth=None, headers=None, pool_size=10, retries=3,
+                 backoff_factor=0.5, timeout=(10, 60), verify=False, tracer=None,
+                 health_timeout=2, health_interval=30, rate_limiter=None):
+        # requests takes long to import, so it is only imported once a client
+        # is needed
+        import requests
+        import urllib3
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        # Livy is usually reached on an edge node with a self-signed certificate
+        if not verify:
+            urllib3.disable_warnings( urllib3.exceptions.InsecureRequestWarning )
+
+        self.endpoints = [ url.strip().rstrip('/') for url in livy_url.split(',') if url.strip() != '' ]
+        if len(self.endpoints) == 0:
+            raise ValueError( 'No Livy url given' )
+        self.livy_url = self.endpoints[0]
+        self.timeout = timeout
+        self.tracer = tracer
+        self.rate_limiter = rate_limiter
+        self.request_count = 0
+        self.lock = threading.Lock()
+
+        self.session = requests.Session()
+        self.session.auth = auth
+        self.session.verify = verify
+        if headers is not None:
+            self.session.headers.update( headers )
+
+        # POST is not in the default list of methods that are retried, so a
+        # statement is never submitted twice because of a retry
+        retry = Retry( total=retries, connect=retries, read=retries, status=retries
+                       , backoff_factor=backoff_factor, status_forcelist=RETRY_STATUS_CODES
+                       , raise_on_status=False )
+
+        adapter = HTTPAdapter( pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry )
+        self.session.mount( 'http://', adapter )
+        self.session.mount( 'https://', adapter )
+
+        self.requests = requests
+        self.health_timeout = health_timeout
+        self.health_interval = health_interval
+        self.health_checked = None
+        self.health_lock = threading.Lock()
+        self.healthy = list( self.endpoints )
+        self.load = {}
+        self.latency = {}
+        self.owners = {}
+
+    def url(self, path, endpoint=None):
+        return '{}{}'.format( endpoint or self.livy_url, path )
+
+    def probe(self, endpoint):
+        # Returns (number of sessions, latency) of the endpoint, or None if it
+        # does not respond. Not retried, so a server that is down is skipped fast
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire( endpoint )
+
+        start = time.time()
+        try:
+            response = self.requests.get( self.url( '/sessions', endpoint ), params={ 'from' : 0, 'size' : 0 }
+                                          , auth=self.session.auth, headers=self.session.headers, verify=self.session.verify
+                                          , timeout=( self.health_timeout, self.health_timeout ))
+        except self.requests.RequestException:
+            return None
+        if response.status_code != 200:
+            return None
+        return response.json().get( 'total', 0 ), time.time() - start
+
+    def check_health(self):
+        with ThreadPoolExecutor( max_workers=len(self.endpoints) ) as executor:
+            results = list( executor.map( self.probe, self.endpoints ))
+
+        with self.lock:
+            self.healthy = []
+            for endpoint, result in zip( self.endpoints, results ):
+                if result is not None:
+                    self.healthy.append( endpoint )
+                    self.load[endpoint], self.latency[endpoint] = result
+            self.health_checked = time.time()
+
+    def candidates(self):
+        # Healthy endpoints, least loaded first. All endpoints if none responds,
+        # so the request fails with the error of the server itself
+        with self.health_lock:
+            if self.health_checked is None or time.time() - self.health_checked > self.health_interval:
+                self.check_health()
+
+        with self.lock:
+            healthy = sorted( self.healthy, key=lambda e: ( self.load.get( e, 0 ), self.latency.get( e, 0 )))
+        return healthy or list( self.endpoints )
+
+    def live_endpoints(self):
+        # Endpoints that respond, in the order in which they were given
+        if len(self.endpoints) == 1:
+            return list( self.endpoints )
+        healthy = self.candidates()
+        return [ endpoint for endpoint in self.endpoints if endpoint in healthy ]
+
+    def set_owner(self, resource, object_id, endpoint):
+        with self.lock:
+            self.owners[( resource, str(object_id) )] = endpoint
+
+    def owner(self, resource, object_id):
+        # Endpoint of a session or batch. A session that was not created or
+        # listed by this client is looked up on all endpoints, as ids are only
+        # unique per server. Raises AmbiguousOwnerError if more than one has it
+        key = ( resource, str(object_id) )
+        with self.lock:
+            if key in self.owners or len(self.endpoints) == 1:
+                return self.owners.get( key, self.livy_url )
+
+        path = '/{}/{}'.format( resource, object_id )
+        endpoints = self.live_endpoints()
+        with ThreadPoolExecutor( max_workers=len(endpoints) ) as executor:
+            responses = list( executor.map( lambda endpoint: self.send( 'GET', path, endpoint ), endpoints ))
+
+        matches = [ ( endpoint, response.json() ) for endpoint, response in zip( endpoints, responses ) if response.status_code == 200 ]
+        if len(matches) > 1:
+            raise AmbiguousOwnerError( resource, object_id, matches )
+        if len(matches) == 0:
+            return self.livy_url
+
+        self.set_owner( resource, object_id, matches[0][0] )
+        return matches[0][0]
+
+    def create(self, method, path, **kwargs):
+        # Try the endpoints from least to most loaded. Only a failed connection
+        # moves on to the next one, so a session is never created twice
+        candidates = self.candidates()
+        for i, endpoint in enumerate( candidates ):
+            try:
+                response = self.send( method, path, endpoint, **kwargs )
+            except self.requests.ConnectionError:
+                if i + 1 == len(candidates):
+                    raise
+                with self.lock:
+                    if endpoint in self.healthy:
+                        self.healthy.remove( endpoint )
+                continue
+
+            if response.status_code in ( 200, 201 ):
+                self.set_owner( path.strip('/'), response.json()['id'], endpoint )
+                with self.lock:
+                    self.load[endpoint] = self.load.get( endpoint, 0 ) + 1
+            return response
+
+    def request(self, method, path, endpoint=None, **kwargs):
+        # The endpoint is chosen by path, unless one is given
+        if endpoint is None and len(self.endpoints) > 1:
+            if method == 'POST' and path in CREATE_PATHS:
+                return self.create( method, path, **kwargs )
+
+            match = OWNED_PATH.match( path )
+            if match is not None:
+                endpoint = self.owner( match.group(1), match.group(2) )
+
+        return self.send( method, path, endpoint or self.livy_url, **kwargs )
+
+    def send(self, method, path, endpoint, **kwargs):
+        kwargs.setdefault( 'timeout', self.timeout )
+        with self.lock:
+            self.request_count += 1
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire( endpoint )
+        if self.tracer is None and len(self.endpoints) == 1:
+            return self.session.request( method, self.url( path, endpoint ), **kwargs )
+
+        start = time.time()
+        try:
+            response = self.session.request( method, self.url( path, endpoint ), **kwargs )
+        except Exception:
+            if self.tracer is not None:
+                self.tracer.record_request( method, path, None, time.time() - start, len( kwargs.get('data') or '' ), None )
+            raise
+
+        # Recent latency of the endpoint, used to choose between equally loaded endpoints
+        latency = time.time() - start
+        with self.lock:
+            self.latency[endpoint] = 0.8 * self.latency.get( endpoint, latency ) + 0.2 * latency
+        if self.tracer is None:
+            return response
+
+        # The body of a streamed response is not read yet, so its size is only
+        # known when the server sends a Content-Length
+        if kwargs.get('stream'):
+            response_bytes = response.headers.get( 'Content-Length' )
+            response_bytes = int(response_bytes) if response_bytes is not None else None
+        else:
+            response_bytes = len( response.content )
+        self.tracer.record_request( method, path, response.status_code, latency
+                                    , len( kwargs.get('data') or '' ), response_bytes )
+        return response
+
+    def get(self, path, **kwargs):
+        return self.request( 'GET', path, **kwargs )
+
+    def post(self, path, data=None, **kwargs):
+        if data is not None:
+            kwargs['data'] = json.dumps( data )
+        return self.request( 'POST', path, **kwargs )
+
+    def delete(self, path, **kwargs):
+        return self.request( 'DELETE', path, **kwargs )
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
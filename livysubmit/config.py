@@ -0,0 +1,58 @@
+import os
+
+
+DEFAULT_CONFIG_FILE = os.path.join( os.path.expanduser('~'), '.livysubmit.toml' )
+
+# Names in a profile that differ from the option they set
+PROFILE_KEYS = {
+    'conf' : 'profile_conf'
+    , 'exe_env' : 'spark_executor_var'
+}
+
+
+def load_config(filename):
+    # Returns the parsed config file, or an empty config if it does not exist
+    if not os.path.exists( filename ):
+        return {}
+
+    try:
+        import tomllib
+    except ModuleNotFoundError:
+        try:
+            import toml
+        except ModuleNotFoundError:
+            raise Exception("Reading {} needs python 3.11 or the toml library".format( filename ))
+
+        with open( filename, 'r' ) as f:
+            return toml.load( f )
+
+    with open( filename, 'rb' ) as f:
+        return tomllib.load( f )
+
+
+def get_profile(config, name, filename=DEFAULT_CONFIG_FILE):
+    # Returns the settings of the profile with their option names, e.g.
+    # { 'driver_memory' : '4g', 'profile_conf' : { ... } }. A profile can
+    # extend another profile, whose settings it overrides. Raises a ValueError
+    # for an unknown profile or a profile that extends itself.
+    profiles = config.get( 'profiles', {} )
+    settings = {}
+    seen = []
+
+    while name is not None:
+        if name not in profiles:
+            raise ValueError("profile {} is not defined in {}".format( name, filename ))
+        if name in seen:
+            raise ValueError("profile {} in {} extends itself through {}".format( name, filename, ' -> '.join( seen + [ name ] )))
+        seen.append( name )
+
+        profile = profiles[name]
+        for key, value in profile.items():
+            key = key.replace( '-', '_' )
+            key = PROFILE_KEYS.get( key, key )
+            if key != 'extends' and key not in settings:
+                settings[key] = value
+
+        name = profile.get('extends')
+
+    return settings
@@ -0,0 +1,217 @@
+import json
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+
+DEFAULT_AGENT_SOCKET = os.path.join( os.path.expanduser('~'), '.livysubmit', 'agent.sock' )
+
+# Seconds a credential stays in the agent after it was last stored (Default of --credential-ttl)
+DEFAULT_AGENT_TTL = 900
+
+# Credentials resolved by this process, so every lookup is done at most once
+_resolved = {}
+_resolved_lock = threading.Lock()
+
+
+class BearerAuth(object):
+    """
+    Sends a token in the Authorization header of every request (requests
+    accepts any callable as auth)
+    @params:
+        token   - Required  : the token (Str)
+    """
+    def __init__(self, token):
+        self.token = token
+
+    def __call__(self, request):
+        request.headers['Authorization'] = 'Bearer {}'.format( self.token )
+        return request
+
+
+def kerberos_auth():
+    # Uses the ticket of the current user (kinit), so there is nothing to cache
+    try:
+        from requests_kerberos import HTTPKerberosAuth, OPTIONAL
+        return HTTPKerberosAuth( mutual_authentication=OPTIONAL )
+    except ModuleNotFoundError:
+        pass
+
+    try:
+        from requests_gssapi import HTTPSPNEGOAuth, OPTIONAL
+        return HTTPSPNEGOAuth( mutual_authentication=OPTIONAL )
+    except ModuleNotFoundError:
+        pass
+
+    raise Exception("Kerberos authentication needs the requests_kerberos or requests_gssapi library")
+
+
+def agent_request(socket_path, request, timeout=2):
+    # Returns the response of the agent, or None if no agent is listening
+    try:
+        with socket.socket( socket.AF_UNIX, socket.SOCK_STREAM ) as s:
+            s.settimeout( timeout )
+            s.connect( socket_path )
+            s.sendall( json.dumps( request ).encode('utf-8') + b'\n' )
+            response = b''
+            while not response.endswith( b'\n' ):
+                data = s.recv( 4096 )
+                if data == b'':
+                    break
+                response += data
+    except (OSError, socket.timeout):
+        return None
+
+    if response.strip() == b'':
+        return None
+    return json.loads( response.decode('utf-8') )
+
+
+def start_agent(socket_path, ttl):
+    # The agent runs detached from this process, so it outlives it
+    import subprocess
+
+    subprocess.Popen( [ sys.executable, '-m', 'livysubmit.credentials', socket_path, '--ttl', str(ttl) ]
+                      , stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+                      , start_new_session=True, close_fds=True )
+
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        if agent_request( socket_path, { 'op' : 'ping' } ) is not None:
+            return True
+        time.sleep( 0.05 )
+    return False
+
+
+def resolve_credential(key, lookup, agent_socket=None, ttl=DEFAULT_AGENT_TTL):
+    # Returns the credential for key. It is looked up in this process first,
+    # then in the agent (if agent_socket is given) and only then by calling
+    # lookup(), which is the slow part (e.g. a keyring backed by D-Bus)
+    with _resolved_lock:
+        if key in _resolved:
+            return _resolved[key]
+
+        value = None
+        if agent_socket is not None:
+            response = agent_request( agent_socket, { 'op' : 'get', 'key' : key } )
+            if response is not None:
+                value = response.get('value')
+
+        if value is None:
+            value = lookup()
+            if value is not None and agent_socket is not None:
+                request = { 'op' : 'put', 'key' : key, 'value' : value, 'ttl' : ttl }
+                if agent_request( agent_socket, request ) is None and start_agent( agent_socket, ttl ):
+                    agent_request( agent_socket, request )
+
+        _resolved[key] = value
+        return value
+
+
+def peer_uid(connection):
+    # User id of the process on the other end of the socket, None if the
+    # platform cannot tell
+    if not hasattr( socket, 'SO_PEERCRED' ):
+        return None
+    credentials = connection.getsockopt( socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i') )
+    pid, uid, gid = struct.unpack( '3i', credentials )
+    return uid
+
+
+class CredentialAgent(object):
+    """
+    Keeps credentials in memory for ttl seconds and hands them out over a unix
+    socket that only the current user can access, so concurrent livy_submit
+    processes do not all have to query the keyring. The agent stops when all
+    credentials are expired.
+    @params:
+        socket_path - Required  : path of the unix socket (Str)
+        ttl         - Optional  : seconds a credential is kept after it was stored (Int)
+    """
+    def __init__(self, socket_path, ttl=DEFAULT_AGENT_TTL):
+        self.socket_path = socket_path
+        self.ttl = ttl
+        self.entries = {}
+        self.expires = time.time() + ttl
+
+    def handle(self, request):
+        now = time.time()
+        if request.get('op') == 'get':
+            value, expires = self.entries.get( request.get('key'), (None, 0) )
+            return { 'value' : value if expires > now else None }
+
+        if request.get('op') == 'put':
+            expires = now + min( self.ttl, request.get( 'ttl', self.ttl ))
+            self.entries[ request['key'] ] = ( request['value'], expires )
+            self.expires = max( self.expires, expires )
+            return { 'ok' : True }
+
+        return { 'ok' : True }
+
+    def serve(self):
+        directory = os.path.dirname( self.socket_path )
+        if directory != '' and not os.path.isdir( directory ):
+            os.makedirs( directory, mode=0o700 )
+
+        # Another agent is already running for this socket
+        if agent_request( self.socket_path, { 'op' : 'ping' } ) is not None:
+            return
+        if os.path.exists( self.socket_path ):
+            os.unlink( self.socket_path )
+
+        server = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+        old_umask = os.umask( 0o077 )
+        try:
+            server.bind( self.socket_path )
+        finally:
+            os.umask( old_umask )
+        os.chmod( self.socket_path, 0o600 )
+        server.listen( 16 )
+        server.settimeout( 1 )
+
+        try:
+            while time.time() < self.expires:
+                try:
+                    connection, _ = server.accept()
+                except socket.timeout:
+                    continue
+
+                with connection:
+                    uid = peer_uid( connection )
+                    if uid is not None and uid != os.getuid():
+                        continue
+
+                    connection.settimeout( 2 )
+                    request = b''
+                    try:
+                        while not request.endswith( b'\n' ):
+                            data = connection.recv( 4096 )
+                            if data == b'':
+                                break
+                            request += data
+                        response = self.handle( json.loads( request.decode('utf-8') ))
+                        connection.sendall( json.dumps( response ).encode('utf-8') + b'\n' )
+                    except (OSError, ValueError):
+                        continue
+        finally:
+            server.close()
+            if os.path.exists( self.socket_path ):
+                os.unlink( self.socket_path )
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser( description='Run the livy_submit credential agent' )
+    parser.add_argument( 'socket_path', nargs='?', default=DEFAULT_AGENT_SOCKET )
+    parser.add_argument( '--ttl', type=int, default=DEFAULT_AGENT_TTL, help='Seconds a credential is kept (Default: {})'.format( DEFAULT_AGENT_TTL ))
+    args = parser.parse_args()
+
+    CredentialAgent( args.socket_path, ttl=args.ttl ).serve()
+
+
+if __name__ == '__main__':
+    main()
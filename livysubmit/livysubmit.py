@@ -1,60 +1,48 @@
-import requests
 import json
 
-import pprint
 import time
 
 
 import argparse
+import contextlib
+import fnmatch
 import getpass
+import importlib.util
 import sys
 import os
 
-import urllib3
-urllib3.disable_warnings()
+# Libraries that take long to import (requests, keyring, pprint, the upload
+# store) are only imported when they are used, so short commands start fast
 
+from .bundle import DEFAULT_BUNDLE_DIRECTORY
+from .cache import DEFAULT_CACHE_DIRECTORY, DEFAULT_CACHE_SIZE, StatementCache
+from .client import AmbiguousOwnerError, LivyClient
+from .config import DEFAULT_CONFIG_FILE, load_config, get_profile
+from .credentials import DEFAULT_AGENT_SOCKET, DEFAULT_AGENT_TTL, BearerAuth, kerberos_auth, resolve_credential
+from .polling import PollScheduler
+from .ratelimit import DEFAULT_RATE_LIMIT_FILE, RateLimiter
+from .registry import DEFAULT_REGISTRY_FILE, SessionRegistry, profile_key
+from .submission import DEFAULT_STATE_DIRECTORY, default_state_file, save_state, load_state, remove_state
+from .tracing import Tracer
+from .render import make_renderer
+from .resources import fetch_statement, iter_sessions as iter_session_pages
+from .streaming import OutputWriter
 
-try:
-    import keyring
-except ModuleNotFoundError:
-    pass
+# Number of log lines that are requested at once when tailing the log
+LOG_PAGE_SIZE = 100
 
-ROTATING_CURSOR = '|/-\\|/-\\'
-
-
-# Print iterations progress
-def print_progress(percentage, finished=False, prefix='', suffix='', decimals=1, bar_length=100):
-    """
-    Call in a loop to create terminal progress bar
-    @params:
-        iteration   - Required  : current iteration (Int)
-        total       - Required  : total iterations (Int)
-        prefix      - Optional  : prefix string (Str)
-        suffix      - Optional  : suffix string (Str)
-        decimals    - Optional  : positive number of decimals in percent complete (Int)
-        bar_length  - Optional  : character length of bar (Int)
-    """
-    str_format = "{0:." + str(decimals) + "f}"
-    percents = str_format.format(  percentage )
-    filled_length = int(round(bar_length * (percentage/100.0)))
-    bar = '#' * filled_length + '-' * (bar_length - filled_length)
-
-    sys.stdout.write('\r%s |%s| %s%s %s    ' % (prefix, bar, percents, '%', suffix)),
-
-    if finished:
-        sys.stdout.write('\n')
-    sys.stdout.flush()
 
 class AssignKeyValue(argparse.Action):
     def __call__(self, parser, namespace, values, option_string=None):
         setattr(namespace, self.dest, dict())
         for value in values:
-            key, value = value.split('=')
+            key, value = value.split('=', 1)
             getattr(namespace, self.dest)[key] = value
 
 
 class EnvDefault(argparse.Action):
     def __init__(self, envvar, required=True, default=None, **kwargs):
+        self.envvar = envvar
         if not default and envvar:
             if envvar in os.environ:
                 default = os.environ[envvar]
@@ -67,6 +55,16 @@ class EnvDefault(argparse.Action):
         setattr(namespace, self.dest, values)
 
 
+def parse_date(value):
+    # Dates of --since and --until, as seconds since the epoch
+    for date_format in [ '%Y-%m-%d', '%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M:%S' ]:
+        try:
+            return time.mktime( time.strptime( value, date_format ))
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError( "invalid date {}, use YYYY-MM-DD or YYYY-MM-DD HH:MM".format( value ))
+
+
 class Password(argparse.Action):
     def __call__(self, parser, namespace, values, option_string):
         if values is None:
@@ -82,7 +80,21 @@ def make_parser():
 
 
     parser.add_argument( "--livy-url", action=EnvDefault, envvar='LIVY_SUBMIT_URL', 
-                    help="Specify the LIVY URL to process (Can also be specifed by setting the LIVY_SUBMIT_URL environment variable)")
+                    help="Specify the LIVY URL to process, or a comma separated list of urls of Livy servers over which new sessions are spread "
+                         "(Can also be specifed by setting the LIVY_SUBMIT_URL environment variable)")
+
+    parser.add_argument( "--server", dest='server', metavar='URL',
+                    help="Only use this one of the Livy servers given with --livy-url, e.g. to address a session id that exists on several servers")
+
+    parser.add_argument( "--profile", dest='profile', metavar='PROFILE',
+                    help="Use the settings of this profile in the config file as defaults, e.g. the livy url, auth, resources, conf and polling settings "
+                         "(Can also be specified by setting the LIVY_SUBMIT_PROFILE environment variable or default_profile in the config file)")
+
+    parser.add_argument( "--config", dest='config', metavar='CONFIG_FILE', default=DEFAULT_CONFIG_FILE,
+                    help="Config file with the profiles (Default: {})".format( DEFAULT_CONFIG_FILE.replace('%', '%%') ))
+
+    # Spark conf of the profile, which is extended by --conf
+    parser.set_defaults( profile_conf=None )
 
 
     group0_b = parser.add_argument_group('Livy Settings', 'Livy specific settings')
@@ -93,6 +105,21 @@ def make_parser():
     group0_b.add_argument('-p', '--password', action=Password, nargs='?', dest='password',
                     help='The password used when connecting to livy. If not provided on the commandline, you will be asked to type the password (hidden)')
 
+    group0_b.add_argument('--auth', dest='auth', choices=['basic', 'kerberos', 'token'], default='basic',
+                    help='How to authenticate with livy: username and password, the kerberos ticket of the current user (needs requests_kerberos or requests_gssapi) or a bearer token (Default: basic)')
+
+    group0_b.add_argument('--token', action=EnvDefault, envvar='LIVY_SUBMIT_TOKEN', required=False, dest='token',
+                    help='The token used with --auth token (Can also be specified by setting the LIVY_SUBMIT_TOKEN environment variable). If not provided, the token is read from the keyring with "keyring set livysubmit-token USERNAME"')
+
+    group0_b.add_argument('--credential-agent', action='store_true', dest='credential_agent',
+                    help='Share the password or token read from the keyring with other livy_submit processes of the same user through a local agent, so the keyring is only queried once every --credential-ttl seconds')
+
+    group0_b.add_argument('--credential-agent-socket', dest='credential_agent_socket', metavar='SOCKET_FILE', default=DEFAULT_AGENT_SOCKET,
+                    help='Unix socket of the credential agent (Default: {})'.format( DEFAULT_AGENT_SOCKET ))
+
+    group0_b.add_argument('--credential-ttl', dest='credential_ttl', type=int, metavar='SECONDS', default=DEFAULT_AGENT_TTL,
+                    help='Number of seconds the credential agent keeps a password or token (Default: {})'.format( DEFAULT_AGENT_TTL ))
+
 
     group00 = parser.add_argument_group('Workflow settings', 'Determines what you want to do')
     group0 = group00.add_mutually_exclusive_group(required=True)
@@ -100,24 +127,63 @@ def make_parser():
     group0.add_argument('-s' , '--submit', action='store' , type=argparse.FileType('r'), metavar='PYTHON_SCRIPT', 
                     help='Python script that you want to submit to the cluster')
 
+    group0.add_argument('-m' , '--submit-many', dest='submit_many', nargs='+', metavar='PYTHON_SCRIPT',
+                    help='Python scripts that you want to submit concurrently to the cluster, see also --workers and --session-pool')
+
+    group0.add_argument('--pipeline', dest='pipeline', nargs='+', metavar='PYTHON_SCRIPT',
+                    help='Python scripts that you want to execute one after the other in the same session. The remaining scripts are skipped when a script fails')
+
+    group0.add_argument('--manifest', dest='manifest', metavar='MANIFEST_FILE',
+                    help='File with one python script per line (optionally followed by the output file for that script) that you want to submit concurrently to the cluster')
+
+    group0.add_argument('--attach', dest='attach', metavar='STATE_FILE',
+                    help='Continue waiting for a submission that was detached or interrupted, using the state file of that submission (see --state-file)')
+
+    group0.add_argument('--prewarm', type=int, dest='prewarm', metavar='NUM_SESSIONS',
+                    help='Start this many sessions ahead of time that can be reused by later submissions with --reuse-session')
+
+    group0.add_argument('--reap-sessions', action='store_true', dest='reap_sessions',
+                    help='Delete the reusable sessions that have been idle for more than --session-ttl seconds. Run it regularly, e.g. from cron, when sessions are started with --prewarm or --reuse-session')
+
     group0.add_argument('-l', '--list-sessions', action='store_true' , dest='list_sessions',
                     help='Get list of all running sessions')
 
     group0.add_argument('-i', '--information', type=int, dest='id_information', metavar=('SESSION_ID'), 
                     help='Get information about a currently running session')
 
+    group0.add_argument('--batch', dest='batch', metavar='PYTHON_SCRIPT',
+                    help='Submit the python script as a batch job and return immediately with the id of the batch. A local script is uploaded with --upload-store first, other paths have to be accessible by the cluster')
+
+    group0.add_argument('--batch-status', type=int, dest='batch_status', metavar='BATCH_ID',
+                    help='Get information about a batch job')
+
+    group0.add_argument('--batch-log', type=int, dest='batch_log', metavar='BATCH_ID',
+                    help='Show the log of a batch job, use --follow to keep showing new lines until the batch has finished')
+
+    group0.add_argument('--batch-kill', type=int, dest='batch_kill', metavar='BATCH_ID',
+                    help='Kill a batch job')
+
+    group0.add_argument('--cleanup', action='store_true', dest='cleanup',
+                    help='Delete all sessions selected with --filter-user, --filter-state, --filter-name and --idle-for, see also --parallel and --dry-run')
+
     group0.add_argument('-d', '--delete', type=int, dest='id_delete', metavar=('SESSION_ID'),
                     help='Delete a currently running session')
 
     group0.add_argument('-t', '--task-status', type=int, nargs=2, dest='statement_information', metavar=('SESSION_ID' , 'STATEMENT_ID'), 
                     help='Display progress for given statement in given session')
 
+    group0.add_argument('--watch', type=int, nargs='+', dest='watch', metavar='ID',
+                    help='Display progress for multiple statements at the same time, given as pairs of SESSION_ID STATEMENT_ID')
+
     group0.add_argument('-q', '--retrieve-statement', type=int, nargs=2, dest='retrieve_statement', metavar=('SESSION_ID' , 'STATEMENT_ID'), 
                     help='Display the the contents of a given statement')
 
     group0.add_argument('-r', '--retrieve-statement-output', type=int, nargs=2, dest='retrieve_statement_output', metavar=('SESSION_ID' , 'STATEMENT_ID'), 
                     help='Display the output for the given statement in the given session')
 
+    group0.add_argument('--cache-search', action='store_true', dest='cache_search',
+                    help='List the statements in the local cache, selected with --filter-name (task name), --filter-state (e.g. available, error or ok), --since and --until')
+
 
 
     group1 = parser.add_argument_group('Submit settings', 'Settings that deal with the different items regarding the submission of a python script')
@@ -128,6 +194,24 @@ def make_parser():
     group1.add_argument('--py-files', dest='py_files', metavar='python_files', nargs='+', default=[],
                     help='Files to be placed on the PYTHONPATH')
 
+    group1.add_argument('--bundle', action='store_true', dest='bundle',
+                    help='Pack the local modules imported by the script (and by those modules) into the statement, so they do not have to be shipped with --py-files. '
+                         'Modules are looked for in the directory of the script and in the directories given with --bundle-path')
+
+    group1.add_argument('--bundle-path', dest='bundle_path', metavar='DIRECTORY', nargs='+', default=[],
+                    help='Other directories in which local modules are looked for (used with --bundle)')
+
+    group1.add_argument('--bundle-dir', dest='bundle_dir', metavar='DIRECTORY', default=DEFAULT_BUNDLE_DIRECTORY,
+                    help='Directory in which the bundles are cached by the hash of their sources (default: %(default)s)')
+
+    group1.add_argument('--upload-store', dest='upload_store', metavar='STORE_URL',
+                    help='Upload local files given with --files and --py-files (directories are zipped) to this location before submitting, '
+                         'either a WebHDFS url like https://namenode:9871/user/me/livysubmit or a local directory. '
+                         'Files are stored by the hash of their contents, so unchanged files are only uploaded once')
+
+    group1.add_argument('--upload-credentials', action='store_true', dest='upload_credentials',
+                    help='Also send the Livy credentials to the WebHDFS url of --upload-store. Without it, only the user name is passed to WebHDFS')
+
     group1.add_argument('-n', '--nowait', action='store_true' , dest='nowait' ,
                     help='Do not wait for the execution of the program to finish on the spark cluster')
 
@@ -140,6 +224,13 @@ def make_parser():
     group1.add_argument('-w', '--write-session-id', dest='filename_session_id' , metavar='SESSION_ID_FILE',
                     help='Write the session id used/created for this task to the given file')
 
+    group1.add_argument('--state-file', dest='state_file', metavar='STATE_FILE',
+                    help='Store the state of the submission (session, statement, output file, cleanup and log position) in this file, so it can be finished with --attach. '
+                         'By default the state is stored in {} until the submission has finished'.format( DEFAULT_STATE_DIRECTORY.replace('%', '%%') ))
+
+    group1.add_argument('--detach', action='store_true', dest='detach',
+                    help='Return as soon as the script has been sent to the session, use --attach with the state file to wait for it later')
+
     group1.add_argument('--task-name' , dest='task_name', metavar='TASK_NAME',
                     help='Specify the name to be used for this spark job. Defaults to the filename of the script you are submitting')
 
@@ -147,6 +238,61 @@ def make_parser():
     group1.add_argument('-o', '--output'  , dest='output_file', metavar='OUTPUT_FILE',
                     help='Write the output of the driver to the given file')
 
+    group1.add_argument('--gzip-output', action='store_true', dest='gzip_output',
+                    help='Compress the output written to the file given with --output with gzip')
+
+    group1.add_argument('--tail-log', action='store_true', dest='tail_log',
+                    help='Show the new lines of the session log while the script is executing')
+
+    group1.add_argument('--log-output', dest='log_output', metavar='LOG_FILE',
+                    help='Append the new lines of the session log to the given file instead of showing them (used with --tail-log)')
+
+    group1.add_argument('-f', '--follow', action='store_true', dest='follow',
+                    help='Keep showing new lines of the session log until the session has finished (used with --information and --batch-log)')
+
+    group1.add_argument('--batch-args', dest='batch_args', nargs='+', metavar='ARG',
+                    help='Command line arguments passed to the script submitted with --batch')
+
+
+    group1_d = parser.add_argument_group('Session selection settings', 'Settings used to select the sessions for --list-sessions and --cleanup, and the cached statements for --cache-search')
+
+    group1_d.add_argument('--filter-user', dest='filter_user', metavar='USER',
+                    help='Only select the sessions of this (proxy) user')
+    group1_d.add_argument('--filter-state', dest='filter_state', nargs='+', metavar='STATE',
+                    help='Only select the sessions in one of these states, e.g. idle dead')
+    group1_d.add_argument('--filter-name', dest='filter_name', metavar='PATTERN',
+                    help='Only select the sessions whose name matches this pattern, e.g. "LivySubmit - *"')
+    group1_d.add_argument('--idle-for', dest='idle_for', type=float, metavar='SECONDS',
+                    help='Only select the sessions whose last statement completed more than this many seconds ago (used with --cleanup). Sessions that never completed a statement are not selected')
+    group1_d.add_argument('--parallel', dest='parallel', type=int, metavar='NUM_REQUESTS', default=8,
+                    help='Number of sessions that are checked and deleted concurrently with --cleanup (Default: 8)')
+    group1_d.add_argument('--dry-run', action='store_true', dest='dry_run',
+                    help='Only show which sessions --cleanup would delete')
+    group1_d.add_argument('--json', action='store_true', dest='json',
+                    help='Print every session as a json object on its own line')
+    group1_d.add_argument('--page-size', dest='page_size', type=int, metavar='NUM_SESSIONS', default=100,
+                    help='Number of sessions requested from Livy at once (Default: 100)')
+
+
+    group1_c = parser.add_argument_group('Session reuse settings', 'Settings for reusing idle sessions that were created earlier by livy_submit')
+
+    group1_c.add_argument('--reuse-session', action='store_true', dest='reuse_session',
+                    help='Execute the script in an idle session created earlier with the same resource settings if there is one, and keep the session available for reuse afterwards')
+    group1_c.add_argument('--session-ttl', dest='session_ttl', type=float, metavar='SECONDS', default=1800,
+                    help='Delete reusable sessions that have been idle for more than this many seconds (Default: 1800)')
+    group1_c.add_argument('--session-registry', dest='session_registry', metavar='REGISTRY_FILE', default=DEFAULT_REGISTRY_FILE,
+                    help='File in which the reusable sessions are stored (Default: {})'.format( DEFAULT_REGISTRY_FILE.replace('%', '%%') ))
+
+
+    group1_b = parser.add_argument_group('Multiple submission settings', 'Settings used when submitting multiple scripts with --submit-many, --manifest or --pipeline')
+
+    group1_b.add_argument('--workers', dest='workers', type=int, metavar='NUM_WORKERS', default=4,
+                    help='Number of scripts that are executed concurrently, each in their own session (Default: 4)')
+    group1_b.add_argument('--session-pool', dest='session_pool', type=int, metavar='NUM_SESSIONS', default=0,
+                    help='Execute the scripts in a pool of this many sessions that are reused between scripts, instead of one new session per script')
+    group1_b.add_argument('--output-dir', dest='output_dir', metavar='OUTPUT_DIR',
+                    help='Write the output of the driver for each script to a file in this directory')
+
 
     group2 = parser.add_argument_group('Driver settings', 'All options related to driver settings')
 
@@ -170,63 +316,325 @@ def make_parser():
                     help='Specify the memory for each executor (Default: 32g)')
     group3.add_argument('--dynamic-max-executors' ,  dest='dynamic_max_executors', metavar='NUM_EXECUTORS', default='50',
                     help='Specify the maximum number of dynamic executors (Default: 50)')
+    group3.add_argument('--dynamic-min-executors' ,  dest='dynamic_min_executors', type=int, metavar='NUM_EXECUTORS', default=6,
+                    help='Specify the minimum number of dynamic executors (Default: 6)')
+    group3.add_argument('--no-dynamic-allocation' ,  action='store_false', dest='dynamic_allocation',
+                    help='Use a fixed number of executors (see --num-executors) instead of dynamic allocation')
     group3.add_argument('--spark-yarn-executor-memoryoverhead' ,  dest='spark_yarn_executor_memoryoverhead', metavar='MEMORY',
                     help='Specify the spark.yarn.executor.memoryOverhead value in megabytes')
+    group3.add_argument('--conf', dest='spark_conf', metavar='KEY=VALUE',
+                        help='Spark configuration settings, e.g. spark.sql.shuffle.partitions=200. These override the settings of other options',
+                        nargs='*', action=AssignKeyValue, default=None)
+
+    group4 = parser.add_argument_group('Connection settings', 'Settings for the connections to the Livy server')
+
+    group4.add_argument('--pool-size', dest='pool_size', type=int, metavar='POOL_SIZE', default=10,
+                    help='Number of keep-alive connections to the Livy server kept in the pool (Default: 10)')
+    group4.add_argument('--retries', dest='retries', type=int, metavar='RETRIES', default=3,
+                    help='Number of times a failed request to the Livy server is retried (Default: 3)')
+    group4.add_argument('--retry-backoff', dest='retry_backoff', type=float, metavar='SECONDS', default=0.5,
+                    help='Backoff factor in seconds between retries of a failed request (Default: 0.5)')
+    group4.add_argument('--connect-timeout', dest='connect_timeout', type=float, metavar='SECONDS', default=10,
+                    help='Timeout in seconds for connecting to the Livy server (Default: 10)')
+    group4.add_argument('--timeout', dest='read_timeout', type=float, metavar='SECONDS', default=60,
+                    help='Timeout in seconds for waiting on a response of the Livy server (Default: 60)')
+
+    group4.add_argument('--max-concurrent-requests', dest='max_concurrent_requests', type=int, metavar='NUM_REQUESTS', default=10,
+                    help='Maximum number of requests that are sent concurrently when watching multiple statements (Default: 10)')
+    group4.add_argument('--poll-min-interval', dest='poll_min_interval', type=float, metavar='SECONDS', default=1,
+                    help='Minimum number of seconds between two status requests while waiting (Default: 1)')
+    group4.add_argument('--poll-max-interval', dest='poll_max_interval', type=float, metavar='SECONDS', default=15,
+                    help='Maximum number of seconds between two status requests while waiting. The interval grows towards this value as long as nothing changes (Default: 15)')
+
+    group4.add_argument('--max-rps', dest='max_rps', type=float, metavar='REQUESTS', default=None,
+                    help='Maximum number of requests per second to a Livy server, shared by all livy_submit processes of the user that use the same --rate-limit-file. '
+                         'Busy processes get an equal share of the rate (Default: no limit)')
+    group4.add_argument('--rate-limit-file', dest='rate_limit_file', metavar='FILE', default=DEFAULT_RATE_LIMIT_FILE,
+                    help='File in which the processes share their use of --max-rps (Default: {})'.format( DEFAULT_RATE_LIMIT_FILE.replace('%', '%%') ))
+
+    group4.add_argument('--progress-mode', dest='progress_mode', choices=['auto', 'tty', 'plain', 'events'], default='auto',
+                    help='How progress is shown: a progress bar that is rewritten in place (tty), a line per change (plain) or a json line per change (events, all other output goes to stderr). auto uses tty when the output is a terminal and plain otherwise (Default: auto)')
+    group4.add_argument('--progress-step', dest='progress_step', type=float, metavar='PERCENTAGE', default=10,
+                    help='With --progress-mode plain or events, only report the progress of a statement when it passes a multiple of this percentage, 0 to only report changes of state (Default: 10)')
+
+    group4_b = parser.add_argument_group('Cache settings', 'Settings for the local cache of finished statements, which is used by --retrieve-statement, --retrieve-statement-output and while waiting for a statement')
+
+    group4_b.add_argument('--no-cache', action='store_false', dest='use_cache',
+                    help='Always fetch statements from Livy and do not store them in the cache')
+    group4_b.add_argument('--cache-dir', dest='cache_dir', metavar='DIRECTORY', default=DEFAULT_CACHE_DIRECTORY,
+                    help='Directory of the cache (Default: {})'.format( DEFAULT_CACHE_DIRECTORY.replace('%', '%%') ))
+    group4_b.add_argument('--cache-size', dest='cache_size', type=float, metavar='MEGABYTES', default=DEFAULT_CACHE_SIZE,
+                    help='Maximum size of the cache, the least recently used statements are removed first (Default: {})'.format( DEFAULT_CACHE_SIZE ))
+    group4_b.add_argument('--since', dest='since', type=parse_date, metavar='DATE',
+                    help='With --cache-search, only list the statements that completed on or after this date (YYYY-MM-DD or "YYYY-MM-DD HH:MM")')
+    group4_b.add_argument('--until', dest='until', type=parse_date, metavar='DATE',
+                    help='With --cache-search, only list the statements that completed before this date')
+
+    group4_c = parser.add_argument_group('Telemetry settings', 'Settings for sampling the Spark UI of the session while a script executes, to find out which resources it needs')
+
+    group4_c.add_argument('--telemetry', action='store_true', dest='telemetry',
+                    help='Sample the executors, cores, memory, tasks, shuffle bytes and stages of the Spark application while the script executes and summarise them at the end')
+    group4_c.add_argument('--telemetry-interval', dest='telemetry_interval', type=float, metavar='SECONDS', default=10,
+                    help='Seconds between two samples (Default: 10)')
+    group4_c.add_argument('--telemetry-file', dest='telemetry_file', metavar='FILE',
+                    help='Append every sample to this file as a json line, implies --telemetry')
+    group4_c.add_argument('--telemetry-credentials', action='store_true', dest='telemetry_credentials',
+                    help='Also send the Livy credentials to the Spark UI, e.g. when the YARN proxy asks for the same login. '
+                         'By default the Spark UI is asked without credentials, as it is often reached over plain http')
+
+    group5 = parser.add_argument_group('Trace settings', 'Settings for recording where the time of a command is spent')
+
+    group5.add_argument('--trace', dest='trace', metavar='TRACE_FILE',
+                    help='Record every request to Livy (method, url, status, latency and size) and the phases of the sessions and statements (create, idle, running, available, deleted) in this file. Use - to write json lines to stderr')
+    group5.add_argument('--trace-format', dest='trace_format', choices=['jsonl', 'prometheus'], default='jsonl',
+                    help='Format of the trace file: json lines that are appended to the file, or a Prometheus textfile with the totals of all commands (Default: jsonl)')
 
     return parser
 
 
+def make_poller(parsed_arguments, timeout):
+    return PollScheduler( min_interval=parsed_arguments['poll_min_interval']
+                        , max_interval=parsed_arguments['poll_max_interval']
+                        , timeout=timeout)
+
+
+def print_request_count(parsed_arguments):
+    print("Number of requests sent to Livy: {}".format( parsed_arguments['client'].request_count ))
+
+    rate_limiter = parsed_arguments['client'].rate_limiter
+    if rate_limiter is not None and rate_limiter.waited > 0:
+        print("Time spent waiting for the rate limit: {:.1f}s".format( rate_limiter.waited ))
+
+
+def trace_phase(parsed_arguments, phase, session_id, statement_id=None):
+    if parsed_arguments.get('tracer') is not None:
+        parsed_arguments['tracer'].record_phase( phase, session_id, statement_id )
+
+
+def command_name(parsed_arguments):
+    # Name of the command in the trace
+    for key, name in [ ('submit', 'submit'), ('attach', 'attach'), ('pipeline', 'pipeline'), ('submit_many', 'submit-many'), ('manifest', 'submit-many'), ('prewarm', 'prewarm'), ('reap_sessions', 'reap-sessions')
+                       , ('batch', 'batch'), ('batch_status', 'batch-status'), ('batch_log', 'batch-log'), ('batch_kill', 'batch-kill')
+                       , ('list_sessions', 'list'), ('id_information', 'information'), ('id_delete', 'delete'), ('cleanup', 'cleanup')
+                       , ('statement_information', 'task-status'), ('watch', 'watch'), ('retrieve_statement', 'retrieve')
+                       , ('retrieve_statement_output', 'retrieve-output'), ('cache_search', 'cache-search') ]:
+        if parsed_arguments.get(key) not in [ None, False ]:
+            return name
+    return 'unknown'
+
+
+def make_client(parsed_arguments):
+    return LivyClient( parsed_arguments['livy_url']
+                        , auth=make_auth( parsed_arguments )
+                        , headers=parsed_arguments['headers']
+                        , pool_size=parsed_arguments['pool_size']
+                        , retries=parsed_arguments['retries']
+                        , backoff_factor=parsed_arguments['retry_backoff']
+                        , timeout=(parsed_arguments['connect_timeout'], parsed_arguments['read_timeout'])
+                        , tracer=parsed_arguments.get('tracer')
+                        , rate_limiter=make_rate_limiter( parsed_arguments ))
+
+
+def make_rate_limiter(parsed_arguments):
+    if parsed_arguments['max_rps'] is None:
+        return None
+    return RateLimiter( parsed_arguments['max_rps'], filename=parsed_arguments['rate_limit_file'] )
+
+
+def session_matches(parsed_arguments, session):
+    # Livy cannot filter the sessions itself, so the filters are applied to
+    # every page as it arrives
+    if parsed_arguments['filter_user'] is not None and session.get('proxyUser') != parsed_arguments['filter_user']:
+        return False
+    if parsed_arguments['filter_state'] is not None and session.get('state') not in parsed_arguments['filter_state']:
+        return False
+    if parsed_arguments['filter_name'] is not None and not fnmatch.fnmatchcase( session.get('name') or '', parsed_arguments['filter_name'] ):
+        return False
+    return True
+
+
 def session_list(parsed_arguments):
-    sessions = get_sessions( parsed_arguments) 
-    
-    num_sessions = len( sessions.get('sessions' , []))
+    num_sessions = 0
+    print_format = '{:<6} {:<15} {:<14} {}'
+    if len( parsed_arguments['client'].endpoints ) > 1:
+        print_format = '{:<6} {:<15} {:<14} {:<40} {}'
+
+    for s in iter_sessions( parsed_arguments ):
+        if not session_matches( parsed_arguments, s ):
+            continue
+
+        if parsed_arguments['json']:
+            print( json.dumps( { key : value for key, value in s.items() if key != 'log' } ))
+        else:
+            if num_sessions == 0:
+                print( print_format.format( 'ID' , 'USER' , 'STATE', 'NAME', 'SERVER' ))
+                print('------------------------------------------------------------')
+            print( print_format.format( s['id'] , '' if s['proxyUser'] is None else s['proxyUser'] , s['state'], s.get('name') or '', s.get('endpoint') ))
+        num_sessions += 1
+
+    if parsed_arguments['json']:
+        return
 
     if num_sessions == 0:
         print("Currently no active livy sessions")
-    else:
-        print_format = '{:<5} {:<15} {:<10}'
-
-        print( print_format.format( 'ID' , 'USER' , 'STATE' ))
-        print('------------------------------')
-        for s in sessions.get('sessions'):
-            print( print_format.format( s['id'] , '' if s['proxyUser'] is None else s['proxyUser'] , s['state'] ))
     print()            
     
 
+def keyring_available():
+    # Checks whether keyring is installed without importing it, which can take
+    # long because of its backends
+    return importlib.util.find_spec('keyring') is not None
+
+
+def get_credential( parsed_arguments, service ):
+    # Read from the keyring at most once per process, and with --credential-agent
+    # at most once per --credential-ttl seconds for all processes of the user
+    def lookup():
+        if not keyring_available():
+            return None
+        import keyring
+        return keyring.get_password( service, parsed_arguments['username'] )
+
+    agent_socket = parsed_arguments['credential_agent_socket'] if parsed_arguments['credential_agent'] else None
+    return resolve_credential( '{}:{}'.format( service, parsed_arguments['username'] ), lookup
+                               , agent_socket=agent_socket, ttl=parsed_arguments['credential_ttl'] )
+
+
 def get_password( parsed_arguments ):
     if parsed_arguments['password'] is not None:
         return parsed_arguments['password']
     else:
-        return keyring.get_password( 'livysubmit' , parsed_arguments['username'])
+        return get_credential( parsed_arguments, 'livysubmit' )
 
 
-def get_statement(parsed_arguments, session_id, statement_id):
-    result = requests.get( '{}/sessions/{}/statements/{}'.format(parsed_arguments['livy_url'], session_id, statement_id)
-                            , auth=(parsed_arguments['username'], get_password( parsed_arguments ))
-                            , headers=parsed_arguments['headers'], verify=False)
-    return result.json()
+def make_auth( parsed_arguments ):
+    if parsed_arguments['auth'] == 'kerberos':
+        return kerberos_auth()
 
+    if parsed_arguments['auth'] == 'token':
+        token = parsed_arguments['token']
+        if token is None:
+            token = get_credential( parsed_arguments, 'livysubmit-token' )
+        if token is None:
+            raise Exception("No token provided for user {}. Please use --token, the LIVY_SUBMIT_TOKEN environment variable or command \"keyring set livysubmit-token {}\" to store the token".format( parsed_arguments['username'], parsed_arguments['username']) )
+        return BearerAuth( token )
 
+    return (parsed_arguments['username'], get_password( parsed_arguments ))
 
-def get_session(parsed_arguments, session_id):
-    found_session = False
 
-    sessions = get_sessions( parsed_arguments) 
-    for s in sessions.get('sessions'):
-        if s['id'] == session_id:
-            found_session = True
+def get_statement(parsed_arguments, session_id, statement_id, data_writer=None, from_cache=False):
+    # If a data_writer is given, the output data of the statement is passed to
+    # it instead of being kept in memory. Finished statements are stored in
+    # the statement cache, and with from_cache (-r and -t) a cached statement
+    # is returned instead of asking Livy (see resources.fetch_statement)
+    status_code, statement_status = fetch_statement( parsed_arguments['client'], session_id, statement_id, data_writer=data_writer
+                                                     , cache=parsed_arguments.get('statement_cache')
+                                                     , identities=parsed_arguments.setdefault( 'session_identities', {} )
+                                                     , task_name=parsed_arguments['task_name'], from_cache=from_cache )
+    return statement_status
+
+
+def make_statement_cache(parsed_arguments):
+    if not parsed_arguments['use_cache'] or parsed_arguments['cache_size'] <= 0:
+        return None
+    return StatementCache( parsed_arguments['cache_dir'], max_size=int( parsed_arguments['cache_size'] * 1024 * 1024 ))
+
+
+def cache_search(parsed_arguments):
+    cache = StatementCache( parsed_arguments['cache_dir'] )
+    entries = cache.search( name=parsed_arguments['filter_name'], states=parsed_arguments['filter_state']
+                            , since=parsed_arguments['since'], until=parsed_arguments['until'] )
+
+    if parsed_arguments['json']:
+        for entry in entries:
+            print( json.dumps( entry ))
+        return
+
+    if len(entries) == 0:
+        print("No cached statements match the filters")
+        return
+
+    print_format = '{:<8} {:<10} {:<10} {:<7} {:<17} {:<30} {}'
+    print( print_format.format( 'SESSION', 'STATEMENT', 'STATE', 'STATUS', 'COMPLETED', 'TASK', 'LIVY URL' ))
+    print('-' * 100)
+    for entry in entries:
+        print( print_format.format( entry['session_id'], entry['statement_id'], entry['state'], entry['status'] or ''
+                                    , time.strftime( '%Y-%m-%d %H:%M', time.localtime( entry['completed'] ))
+                                    , entry['task_name'] or '', entry['livy_url'] ))
+
+
+def make_upload_store(parsed_arguments):
+    from .storage import make_store
+
+    # The Livy credentials are only sent to WebHDFS when asked for, the
+    # namenode and datanodes are other hosts than Livy
+    client = parsed_arguments['client']
+    return make_store( parsed_arguments['upload_store']
+                       , auth=client.session.auth if parsed_arguments['upload_credentials'] else None
+                       , verify=client.session.verify
+                       , username=parsed_arguments['username'] )
+
 
+def stage_dependencies(parsed_arguments):
+    # Replace the local files in py_files and files by their uploaded versions
+    from .storage import stage_files
 
-    if found_session:
-        result = requests.get( '{}/sessions/{}'.format(parsed_arguments['livy_url'], session_id)
-                                , auth=(parsed_arguments['username'], get_password( parsed_arguments ))
-                                , headers=parsed_arguments['headers'], verify=False)
+    store = make_upload_store( parsed_arguments )
+    parsed_arguments['py_files'] = stage_files( store, parsed_arguments['py_files'] )
+    parsed_arguments['files'] = stage_files( store, parsed_arguments['files'] )
 
+
+def script_code(parsed_arguments, script, code):
+    # The code to submit for script: with --bundle the local modules it imports
+    # are prepended as a compressed zip
+    if not parsed_arguments['bundle']:
+        return code
+
+    from .bundle import make_preamble, prepend
+
+    roots = [ os.path.dirname( os.path.abspath( script )) ] + parsed_arguments['bundle_path']
+    preamble, info = make_preamble( script, roots, directory=parsed_arguments['bundle_dir'] )
+    if preamble is None:
+        print("No local modules imported by {}, nothing to bundle".format( script ))
+        return code
+
+    try:
+        code = prepend( preamble, code )
+    except ValueError as e:
+        print("ERROR: cannot bundle the local modules with {}: {}".format( script, e ))
+        sys.exit(1)
+
+    print("Bundled {} local modules with {} ({:.1f} KB{})".format( info['modules'], script, info['size'] / 1024.0, ', cached' if info['cached'] else '' ))
+    return code
+
+
+def make_output_writer(parsed_arguments, output_file):
+    if output_file is None:
+        return None
+
+    return OutputWriter( output_file, compress=parsed_arguments['gzip_output'] )
+
+
+
+def get_session_state(parsed_arguments, session_id, resource='sessions'):
+    # Lightweight lookup used while polling: only returns the state of the
+    # session (or None if it does not exist) and does not print anything.
+    # Use resource='batches' for a batch
+    result = parsed_arguments['client'].get( '/{}/{}/state'.format(resource, session_id))
+
+    if result.status_code == 404:
+        return None
+
+    return result.json()['state']
+
+
+def get_session(parsed_arguments, session_id):
+    result = parsed_arguments['client'].get( '/sessions/{}'.format(session_id))
+
+    if result.status_code != 404:
         result_object = result.json()
 
-        result_statements = requests.get( '{}/sessions/{}/statements'.format(parsed_arguments['livy_url'], session_id)
-                                , auth=(parsed_arguments['username'], get_password( parsed_arguments ))
-                                , headers=parsed_arguments['headers'], verify=False)
+        result_statements = parsed_arguments['client'].get( '/sessions/{}/statements'.format(session_id))
 
         if result_statements.status_code == 200:
             result_statements_object = result_statements.json()
@@ -242,16 +650,13 @@ def get_session(parsed_arguments, session_id):
 
 
 
-def get_sessions(parsed_arguments):
-    result = requests.get( '{}/sessions'.format(parsed_arguments['livy_url'])
-                            , auth=(parsed_arguments['username'], get_password( parsed_arguments ))
-                            , headers=parsed_arguments['headers'], verify=False)
-    return result.json()
+def iter_sessions(parsed_arguments):
+    return iter_session_pages( parsed_arguments['client'], parsed_arguments['page_size'] )
 
 
 def print_statement(parsed_arguments):
     session_id, statement_id = parsed_arguments['retrieve_statement']
-    statement_status = get_statement(parsed_arguments, session_id, statement_id )
+    statement_status = get_statement(parsed_arguments, session_id, statement_id, from_cache=True )
 
 
 
@@ -270,40 +675,10 @@ def print_statement(parsed_arguments):
 
 def print_statement_output(parsed_arguments):
     session_id, statement_id = parsed_arguments['retrieve_statement_output']
-    statement_status = get_statement(parsed_arguments, session_id, statement_id )
-
-
-
-    if statement_status['output'] is not None:
-        # Check if there was an error or whether it was successful
-
-        if statement_status['output']['status'] == 'error':
-            print()
-            print( 'ERROR {} while executing application on the driver:'.format( statement_status['output']['ename']))
-            print()
-            print( statement_status['output']['evalue'])
-            print()
-            print("Traceback:")
-            print( ''.join( statement_status['output']['traceback'] ) )
-            
-        elif statement_status['output']['status'] == 'ok':
+    output_writer = make_output_writer( parsed_arguments, parsed_arguments['output_file'] )
+    statement_status = get_statement(parsed_arguments, session_id, statement_id, data_writer=output_writer, from_cache=True )
 
-            if parsed_arguments['output_file'] is not None:
-                print()
-                print('Storing output in file {}'.format( parsed_arguments['output_file'] ))
-                with open( parsed_arguments['output_file'], 'w') as f:
-                    for i in statement_status['output'].get('data', {}).keys():
-                        f.write( statement_status['output']['data'][i])
-                        f.write('\n')
-            else:
-
-                print()
-                print( 'Output of the application on the driver:')
-                for i in statement_status['output'].get('data', {}).keys():
-                    print("--------------- {} ---------------".format(i))
-                    print( statement_status['output']['data'][i])
-        else:
-            print("Unknown output status...")
+    print_statement_result( statement_status, parsed_arguments['output_file'], output_writer )
 
 
 
@@ -312,14 +687,11 @@ def print_statement_progress(parsed_arguments):
 
     print("Statement progress for statement {} in session {}".format( statement_id, session_id))
 
-    for i in range(17200):
-        time.sleep(1)
-        statement_status = get_statement(parsed_arguments, session_id, statement_id )
-        print_progress( 100*statement_status['progress'], prefix=statement_status['state'], suffix='Complete' , bar_length=50)
-        if statement_status['state'] not in [ 'running', 'waiting'] :
-            break
-
-    print_progress( 100*statement_status['progress'],finished=True, prefix=statement_status['state'], suffix='Complete' , bar_length=50)
+    renderer = parsed_arguments['renderer']
+    statement_status = wait_for_statement( parsed_arguments, session_id, statement_id
+                                            , callback=lambda statement_status: renderer.statement_wait( session_id, statement_status ))
+    renderer.statement_done( session_id, statement_status )
+    print_request_count( parsed_arguments )
 
 
 
@@ -346,28 +718,112 @@ def session_information(parsed_arguments):
         print()
         print()
         print("log:")
-        for i in result['log']:
-            print(i)
+        if parsed_arguments['follow']:
+            follow_session_log( parsed_arguments, parsed_arguments['id_information'] )
+        else:
+            for i in result['log']:
+                print(i)
         
 
+def get_session_log(parsed_arguments, session_id, offset, size=LOG_PAGE_SIZE, resource='sessions'):
+    result = parsed_arguments['client'].get( '/{}/{}/log'.format(resource, session_id), params={ 'from' : offset, 'size' : size })
+
+    if result.status_code == 404:
+        return None
+
+    return result.json()
+
+
+def read_session_log(parsed_arguments, session_id, size=LOG_PAGE_SIZE, resource='sessions'):
+    # All lines of the log window of the session, or None if the session does
+    # not exist. size is the expected number of lines, so the window is
+    # usually read in one request
+    lines = []
+    while True:
+        log = get_session_log( parsed_arguments, session_id, len(lines), size=max( size - len(lines), LOG_PAGE_SIZE ), resource=resource )
+        if log is None:
+            return None if len(lines) == 0 else lines
+
+        lines.extend( log['log'] )
+        if len( log['log'] ) == 0 or len(lines) >= log['total']:
+            return lines
+
+
+def new_log_lines(seen, lines):
+    # Livy does not return a growing log but a window of the last lines of
+    # stdout (livy.cache-log.size), followed by the last lines of stderr and
+    # the YARN diagnostics. Lines disappear from the start of both parts and
+    # new stdout lines appear in the middle of the window, so the new lines are
+    # found by comparing the window with the one that was seen before
+    import difflib
+
+    if lines[:len(seen)] == seen:
+        return lines[len(seen):]
+
+    new = []
+    matcher = difflib.SequenceMatcher( None, seen, lines, autojunk=False )
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag in [ 'insert', 'replace' ]:
+            new.extend( lines[j1:j2] )
+    return new
+
+
+def tail_session_log(parsed_arguments, session_id, seen, output, first_line='', resource='sessions'):
+    # Write the lines of the log window of the session that are not in seen
+    # (the window returned by the previous call) to output, and return the
+    # current window. first_line is written before the first new line (if
+    # there is one)
+    lines = read_session_log( parsed_arguments, session_id, size=len(seen) + LOG_PAGE_SIZE, resource=resource )
+    if lines is None:
+        return seen
+
+    new = new_log_lines( seen, lines )
+    if len(new) > 0:
+        output.write( first_line )
+        for line in new:
+            output.write( line )
+            output.write( '\n' )
+
+    output.flush()
+    return lines
+
+
+def follow_session_log(parsed_arguments, session_id, resource='sessions'):
+    # Print new log lines as they arrive until the session is finished
+    seen = []
+    poller = make_poller( parsed_arguments, timeout=None )
+    try:
+        for i in poller:
+            seen = tail_session_log( parsed_arguments, session_id, seen, sys.stdout, resource=resource )
+            session_state = get_session_state( parsed_arguments, session_id, resource=resource )
+            poller.observe( seen )
+
+            if session_state in [ 'shutting_down', 'error', 'dead', 'killed', 'success', None ]:
+                break
+    except KeyboardInterrupt:
+        pass
+
+
+def delete_session(parsed_arguments, session_id):
+    # Quiet version of session_delete, returns None if the session does not exist
+    result = parsed_arguments['client'].delete( '/sessions/{}'.format(session_id))
+
+    if result.status_code == 404:
+        return None
+
+    trace_phase( parsed_arguments, 'deleted', session_id )
+    return result.json()
+
+
 def session_delete(parsed_arguments, id_to_delete=None):
     if id_to_delete is None:
         id_to_delete = parsed_arguments['id_delete']
 
-    found_session = False
+    result = delete_session( parsed_arguments, id_to_delete )
 
-    sessions = get_sessions( parsed_arguments) 
-    for s in sessions.get('sessions'):
-        if s['id'] == id_to_delete:
-            found_session = True
-
-   
-    if found_session: 
-        result = requests.delete( '{}/sessions/{}'.format(parsed_arguments['livy_url'], id_to_delete)
-                                , auth=(parsed_arguments['username'], get_password( parsed_arguments ))
-                                , headers=parsed_arguments['headers'], verify=False)
-        
-        pprint.pprint(result.json()) 
+    if result is not None:
+        import pprint
+        pprint.pprint(result) 
 
     else:
         print('Cannot delete session {} because it does not exist'.format( id_to_delete))
@@ -375,106 +831,282 @@ def session_delete(parsed_arguments, id_to_delete=None):
 
 
 
-def submit_script(parsed_arguments):
+def make_session_data(parsed_arguments, task_name):
+    data = {
+        'proxyUser' : parsed_arguments['username']
+        , 'name' : task_name
+        , 'kind' : 'pyspark'
+        , 'numExecutors' : parsed_arguments['num_executors']
+        , 'executorCores' : parsed_arguments['executor_cores']
+        , 'executorMemory' : parsed_arguments['executor_memory']
+        , 'driverCores' : parsed_arguments['driver_cores']
+        , 'driverMemory' : parsed_arguments['driver_memory']
+        , 'conf': {
+                 'spark.dynamicAllocation.enabled' :'true'
+                ,'spark.dynamicAllocation.maxExecutors' : parsed_arguments['dynamic_max_executors'] 
+                ,'spark.dynamicAllocation.minExecutors' : parsed_arguments['dynamic_min_executors']
+                ,'spark.shuffle.service.enabled' : 'true'
+            }
+    }
+
+    if not parsed_arguments['dynamic_allocation']:
+        data['conf'] = { 'spark.dynamicAllocation.enabled' : 'false' }
+
+    if parsed_arguments['spark_executor_var']:
+        exe_env = {'spark.executorEnv.{}'.format(key): value for key, value in parsed_arguments['spark_executor_var'].items()}
+        data['conf'].update(exe_env)
+    if parsed_arguments['spark_yarn_executor_memoryoverhead']:
+        data['conf']['spark.yarn.executor.memoryOverhead'] = parsed_arguments['spark_yarn_executor_memoryoverhead']
+    if parsed_arguments['py_files']:
+        data['pyFiles'] = parsed_arguments['py_files']
+    if parsed_arguments['files']:
+        data['files'] = parsed_arguments['files']
+
+    for conf in [ parsed_arguments['profile_conf'], parsed_arguments['spark_conf'] ]:
+        if conf:
+            data['conf'].update( { key : str(value) if not isinstance( value, str ) else value for key, value in conf.items() } )
+
+    return data
+
+
+def create_session(parsed_arguments, task_name):
+    session_result = parsed_arguments['client'].post( '/sessions', make_session_data( parsed_arguments, task_name ))
+    session_id = session_result.json()['id']
+    trace_phase( parsed_arguments, 'create', session_id )
+
+    # Cached statements of an earlier session with the same id belong to a
+    # session that no longer exists
+    if parsed_arguments.get('statement_cache') is not None:
+        livy_url = session_endpoint( parsed_arguments, session_id )
+        parsed_arguments['statement_cache'].forget_session( livy_url, session_id )
+        parsed_arguments.setdefault( 'session_identities', {} ).pop( ( livy_url, session_id ), None )
+    return session_id
+
+
+def submit_statement(parsed_arguments, session_id, code):
+    statement_result = parsed_arguments['client'].post( '/sessions/{}/statements'.format(session_id), { 'code' : code })
+    statement_id = statement_result.json()['id']
+    trace_phase( parsed_arguments, 'submitted', session_id, statement_id )
+    return statement_id
+
+
+def cancel_statement(parsed_arguments, session_id, statement_id):
+    result = parsed_arguments['client'].post( '/sessions/{}/statements/{}/cancel'.format(session_id, statement_id))
+    trace_phase( parsed_arguments, 'cancelled', session_id, statement_id )
+    return result.status_code == 200
+
+
+def wait_for_session(parsed_arguments, session_id, callback=None):
+    # Wait until the session is no longer starting. Returns the last known state
+    # of the session, callback is called with (iteration, state) for every poll
+    session_state = None
+
+    poller = make_poller( parsed_arguments, timeout=3600 )
+    for i in poller:
+        previous_state = session_state
+        session_state = get_session_state( parsed_arguments , session_id )
+        poller.observe( session_state )
+        if session_state != previous_state and session_state is not None:
+            trace_phase( parsed_arguments, session_state, session_id )
+        if callback is not None:
+            callback( i, session_state )
+
+        if session_state in [ 'idle', 'dead', None ]:
+            break
+
+    return session_state
+
+
+def wait_for_statement(parsed_arguments, session_id, statement_id, callback=None, data_writer=None):
+    # Wait until the statement is no longer waiting or running. Returns the last
+    # statement status, callback is called with the status for every poll. The
+    # output data is passed to the data_writer if one is given (see get_statement)
+    statement_status = None
+
+    poller = make_poller( parsed_arguments, timeout=17200 )
+    for i in poller:
+        previous_state = None if statement_status is None else statement_status['state']
+        statement_status = get_statement(parsed_arguments, session_id, statement_id, data_writer=data_writer )
+        poller.observe( (statement_status['state'], statement_status['progress']) )
+        if statement_status['state'] != previous_state:
+            trace_phase( parsed_arguments, statement_status['state'], session_id, statement_id )
+        if callback is not None:
+            callback( statement_status )
+
+        if statement_status['state'] not in [ 'running', 'waiting'] :
+            break
+
+    return statement_status
 
-    if parsed_arguments['connect_existing_session'] is None:
-        data = {
-            'proxyUser' : parsed_arguments['username']
-            , 'name' : parsed_arguments['task_name']
-            , 'kind' : 'pyspark'
-            , 'numExecutors' : parsed_arguments['num_executors']
-            , 'executorCores' : parsed_arguments['executor_cores']
-            , 'executorMemory' : parsed_arguments['executor_memory']
-            , 'driverCores' : parsed_arguments['driver_cores']
-            , 'driverMemory' : parsed_arguments['driver_memory']
-            , 'conf': {
-                     'spark.dynamicAllocation.enabled' :'true'
-                    ,'spark.dynamicAllocation.maxExecutors' : parsed_arguments['dynamic_max_executors'] 
-                    ,'spark.dynamicAllocation.minExecutors' : 6
-                    ,'spark.shuffle.service.enabled' : 'true'
-                }
-        }
-
-        if parsed_arguments['spark_executor_var']:
-            exe_env = {'spark.executorEnv.{}'.format(key): value for key, value in parsed_arguments['spark_executor_var'].items()}
-            data['conf'].update(exe_env)
-        if parsed_arguments['spark_yarn_executor_memoryoverhead']:
-            data['conf']['spark.yarn.executor.memoryOverhead'] = parsed_arguments['spark_yarn_executor_memoryoverhead']
-        if parsed_arguments['py_files']:
-            data['pyFiles'] = parsed_arguments['py_files']
-        if parsed_arguments['files']:
-            data['files'] = parsed_arguments['files']
-
-
-        # Create the session
-        session_result = requests.post( '{}/sessions'.format(parsed_arguments['livy_url'])
-                                , auth=(parsed_arguments['username'], get_password( parsed_arguments ))
-                                , headers=parsed_arguments['headers'], verify=False, data=json.dumps(data))
-
-        session_id = session_result.json()['id']
 
+def get_registry(parsed_arguments):
+    return SessionRegistry( parsed_arguments['session_registry'] )
+
+
+def session_profile(parsed_arguments):
+    return profile_key( make_session_data( parsed_arguments, None ))
+
+
+def session_endpoint(parsed_arguments, session_id):
+    # The Livy server that owns the session, which is what the registry and
+    # the state of a submission refer to
+    return parsed_arguments['client'].owner( 'sessions', session_id )
+
+
+def expire_idle_sessions(parsed_arguments):
+    # Returns the number of sessions that were deleted
+    client = parsed_arguments['client']
+    count = 0
+    for endpoint in client.endpoints:
+        for session_id in get_registry( parsed_arguments ).expire( endpoint, parsed_arguments['session_ttl'] ):
+            print("Removing session {} because it has not been used for more than {} seconds".format( session_id, parsed_arguments['session_ttl'] ))
+            client.set_owner( 'sessions', session_id, endpoint )
+            delete_session( parsed_arguments, session_id )
+            count += 1
+    return count
+
+
+def session_reap(parsed_arguments):
+    # The ttl is otherwise only checked when a session is claimed or
+    # prewarmed, so idle sessions stay alive until the next submission
+    count = expire_idle_sessions( parsed_arguments )
+    print("Deleted {} idle sessions".format( count ))
+    print_request_count( parsed_arguments )
+
+
+def claim_idle_session(parsed_arguments):
+    # Returns the id of an idle session created earlier by livy_submit with the
+    # same resource profile, or None if there is no such session
+    expire_idle_sessions( parsed_arguments )
+
+    client = parsed_arguments['client']
+    registry = get_registry( parsed_arguments )
+    profile = session_profile( parsed_arguments )
+
+    for endpoint in client.live_endpoints():
+        while True:
+            session_id = registry.claim( endpoint, profile )
+            if session_id is None:
+                break
+
+            client.set_owner( 'sessions', session_id, endpoint )
+            session_state = get_session_state( parsed_arguments, session_id )
+            if session_state == 'idle':
+                return session_id
+
+            # The session is gone or cannot be used anymore, so forget about it
+            registry.remove( endpoint, session_id )
+            if session_state in [ 'dead', 'error', 'killed' ]:
+                delete_session( parsed_arguments, session_id )
+
+    return None
+
+
+def session_prewarm(parsed_arguments):
+    expire_idle_sessions( parsed_arguments )
+
+    session_ids = []
+    for i in range( parsed_arguments['prewarm'] ):
+        session_id = create_session( parsed_arguments, 'LivySubmit - warm {}-{}'.format( os.getpid(), i ))
         print("Started session with id = {}".format(session_id))
+        session_ids.append( session_id )
+
+    registry = get_registry( parsed_arguments )
+    profile = session_profile( parsed_arguments )
+    for session_id in session_ids:
+        session_state = wait_for_session( parsed_arguments, session_id )
+        if session_state == 'idle':
+            print("Session {} is idle and available for reuse".format(session_id))
+            registry.add( session_endpoint( parsed_arguments, session_id ), session_id, profile, state='idle' )
+        else:
+            print("Session {} ended up in state {}, cleaning up stale session".format( session_id, session_state ))
+            delete_session( parsed_arguments, session_id )
 
-        sys.stdout.write("Waiting for session to become idle before sending statements |")
+    print_request_count( parsed_arguments )
 
-        for i in range(3600):
-            time.sleep(1)
-            sys.stdout.write("\rWaiting for session to become idle before sending statements {}".format( ROTATING_CURSOR[ i% len(ROTATING_CURSOR) ] ))
-            sys.stdout.flush()
 
-            session = get_session( parsed_arguments , session_id )
-            if session['state'] == 'idle':
-                sys.stdout.write("\rWaiting for session to become idle before sending statements DONE")
-                sys.stdout.write('\n')
-                sys.stdout.flush()
-                break 
+def make_statement_wait_callback(parsed_arguments, session_id, state=None):
+    # With the state of a submission, the log window that was seen last is
+    # stored in it, so --attach continues where it stopped
+    renderer = parsed_arguments['renderer']
+    if not parsed_arguments['tail_log']:
+        return lambda statement_status: renderer.statement_wait( session_id, statement_status )
 
+    if state is not None and state.get('log_seen') is not None:
+        position = { 'seen' : state['log_seen'] }
+    else:
+        # Only show the log lines that are written while the statement executes
+        position = { 'seen' : read_session_log( parsed_arguments, session_id ) or [] }
+
+    def callback(statement_status):
+        seen = position['seen']
+        if parsed_arguments['log_output'] is not None:
+            with open( parsed_arguments['log_output'], 'a' ) as f:
+                position['seen'] = tail_session_log( parsed_arguments, session_id, position['seen'], f )
+        else:
+            # Make sure the log lines do not end up behind the progress bar
+            first_line = '\n' if renderer.inline else ''
+            position['seen'] = tail_session_log( parsed_arguments, session_id, position['seen'], sys.stdout, first_line=first_line )
+
+        if state is not None and position['seen'] != seen:
+            state['log_seen'] = position['seen']
+            save_state( parsed_arguments['state_file'], state )
+
+        renderer.statement_wait( session_id, statement_status )
+
+    return callback
+
+
+def acquire_session(parsed_arguments):
+    # Returns the id of the session in which the script(s) will be executed:
+    # an existing session (-c), an idle session that can be reused or a new one
+
+    if parsed_arguments['connect_existing_session'] is None:
+        session_id = None
+        if parsed_arguments['reuse_session']:
+            session_id = claim_idle_session( parsed_arguments )
 
-            if session['state'] == 'dead':
-                sys.stdout.write("\rWaiting for session to become idle before sending statements DONE")
-                sys.stdout.write('\n')
-                sys.stdout.flush()
+        if session_id is not None:
+            print("Reusing idle session with id = {}".format(session_id))
+
+        else:
+            # Create the session
+            session_id = create_session( parsed_arguments, parsed_arguments['task_name'] )
+
+            print("Started session with id = {}".format(session_id))
+
+            renderer = parsed_arguments['renderer']
+            session_state = wait_for_session( parsed_arguments, session_id
+                                              , callback=lambda i, session_state: renderer.session_wait( session_id, i, session_state ))
+
+            if session_state == 'dead':
                 print()
                 print("Session ended up in DEAD state, cleaning up stale session")
                 session_delete( parsed_arguments, session_id) 
                 sys.exit(1)
-                break 
+
+            if session_state is None:
+                print()
+                print("Session {} no longer exists".format(session_id))
+                sys.exit(1)
+
+            if parsed_arguments['reuse_session']:
+                get_registry( parsed_arguments ).add( session_endpoint( parsed_arguments, session_id ), session_id, session_profile( parsed_arguments ))
 
     else:
         # Connect to existing session
-        result = get_session(parsed_arguments , parsed_arguments['connect_existing_session'])
+        result = get_session_state(parsed_arguments , parsed_arguments['connect_existing_session'])
         if result is None: 
             print("Cannot connect to session {} because it does not exist".format( parsed_arguments['connect_existing_session'] ))
             sys.exit(1)
         else:
             print("Connecting to existing session {}".format( parsed_arguments['connect_existing_session'] ))
             session_id = parsed_arguments['connect_existing_session']  
-        
-
-    file_contents = parsed_arguments['submit'].read()
-    data_code = {
-        'code' : file_contents 
-    }
-    statement_result = requests.post( '{}/sessions/{}/statements'.format(parsed_arguments['livy_url'], session_id)
-                            , auth=(parsed_arguments['username'], get_password( parsed_arguments ))
-                            , headers=parsed_arguments['headers'], verify=False, data=json.dumps(data_code))
-
-    statement_id = statement_result.json()['id']
 
-    print("Now executing the contents of the script {} (statement id={})".format( parsed_arguments['task_name'], statement_id ))
-    for i in range(17200):
-        time.sleep(1)
-        statement_status = get_statement(parsed_arguments, session_id, statement_id )
-        #print()        
-        #print( 'State   : {}'.format(statement_status['state'] ))
-        #print( 'Progress: {}'.format(statement_status['progress'] ))
-        print_progress( 100*statement_status['progress'], prefix=statement_status['state'], suffix='Complete' , bar_length=50)
+    return session_id
 
-        if statement_status['state'] not in [ 'running', 'waiting'] :
-            break
-
-    print_progress( 100*statement_status['progress'],finished=True, prefix=statement_status['state'], suffix='Complete' , bar_length=50)
 
+def print_statement_result(statement_status, output_file, output_writer):
     if statement_status['output'] is not None:
         # Check if there was an error or whether it was successful
 
@@ -489,13 +1121,10 @@ def submit_script(parsed_arguments):
             
         elif statement_status['output']['status'] == 'ok':
 
-            if parsed_arguments['output_file'] is not None:
+            if output_file is not None:
                 print()
-                print('Storing output in file {}'.format( parsed_arguments['output_file'] ))
-                with open( parsed_arguments['output_file'], 'w') as f:
-                    for i in statement_status['output'].get('data', {}).keys():
-                        f.write( statement_status['output']['data'][i])
-                        f.write('\n')
+                print('Storing output in file {}'.format( output_file ))
+                output_writer.close()
             else:
 
                 print()
@@ -510,16 +1139,190 @@ def submit_script(parsed_arguments):
             print("Unknown output status...")
 
 
+def release_session(parsed_arguments, session_id):
     if not parsed_arguments['filename_session_id'] is None:
         with open( parsed_arguments['filename_session_id'], 'w' ) as f:
             f.write( str(session_id) )
 
-    if not parsed_arguments['keep_session_alive']:
+    if parsed_arguments['reuse_session'] and parsed_arguments['connect_existing_session'] is None:
+        print()
+        print("Finished executing script, keeping session {} available for reuse".format(session_id))
+        registry = get_registry( parsed_arguments )
+        livy_url = session_endpoint( parsed_arguments, session_id )
+        if not registry.release( livy_url, session_id ):
+            # Taken out of the registry in the meantime (e.g. while the
+            # submission was detached), so it is registered again
+            profile = parsed_arguments.get('registry_profile') or session_profile( parsed_arguments )
+            registry.add( livy_url, session_id, profile, state='idle' )
+        trace_phase( parsed_arguments, 'released', session_id )
+
+    elif not parsed_arguments['keep_session_alive']:
         print()
         print("Finished executing script, now removing the spark session")
         session_delete( parsed_arguments, session_id) 
 
 
+def make_submission_state(parsed_arguments, session_id, statement_id):
+    # Everything needed to finish the submission from another process
+    if parsed_arguments['reuse_session'] and parsed_arguments['connect_existing_session'] is None:
+        cleanup = 'release'
+    elif parsed_arguments['keep_session_alive']:
+        cleanup = 'keep'
+    else:
+        cleanup = 'delete'
+
+    return {
+        'livy_url' : session_endpoint( parsed_arguments, session_id )
+        , 'session_id' : session_id
+        , 'statement_id' : statement_id
+        , 'task_name' : parsed_arguments['task_name']
+        , 'output_file' : None if parsed_arguments['output_file'] is None else os.path.abspath( parsed_arguments['output_file'] )
+        , 'gzip_output' : parsed_arguments['gzip_output']
+        , 'cleanup' : cleanup
+        , 'session_registry' : parsed_arguments['session_registry']
+        , 'profile' : session_profile( parsed_arguments ) if cleanup == 'release' else None
+        , 'tail_log' : parsed_arguments['tail_log']
+        , 'log_output' : None if parsed_arguments['log_output'] is None else os.path.abspath( parsed_arguments['log_output'] )
+        , 'log_seen' : None
+        , 'state' : 'waiting'
+    }
+
+
+def apply_submission_state(parsed_arguments, state):
+    # Finish an attached submission the way it was started
+    for key in [ 'output_file', 'gzip_output', 'session_registry', 'tail_log', 'log_output', 'task_name' ]:
+        parsed_arguments[key] = state[key]
+
+    parsed_arguments['connect_existing_session'] = None
+    parsed_arguments['reuse_session'] = state['cleanup'] == 'release'
+    parsed_arguments['keep_session_alive'] = state['cleanup'] == 'keep'
+    parsed_arguments['registry_profile'] = state.get('profile')
+
+
+def print_detach_message(parsed_arguments, state):
+    print()
+    print("Detached from statement {} of session {}, use --attach {} to continue waiting for it".format(
+        state['statement_id'], state['session_id'], parsed_arguments['state_file'] ))
+
+
+def detach_submission(parsed_arguments, state):
+    # A reused session stays busy until the submission is finished with
+    # --attach, so the registry entry is handed over to the state file
+    if state['cleanup'] == 'release':
+        get_registry( parsed_arguments ).set_owner( state['livy_url'], state['session_id']
+                                                    , state_file=os.path.abspath( parsed_arguments['state_file'] ))
+    print_detach_message( parsed_arguments, state )
+
+
+def start_telemetry(parsed_arguments, session_id):
+    # Returns the running TelemetrySampler, or None if no telemetry is asked
+    # for or the session has no Spark UI (yet)
+    if not parsed_arguments['telemetry']:
+        return None
+
+    result = parsed_arguments['client'].get( '/sessions/{}'.format(session_id))
+    session = result.json() if result.status_code == 200 else {}
+    spark_ui_url = ( session.get('appInfo') or {} ).get('sparkUiUrl')
+    if spark_ui_url is None or session.get('appId') is None:
+        print("Session {} has no Spark UI url, no telemetry is collected".format(session_id))
+        return None
+
+    # The Livy credentials are only sent to the Spark UI when asked for, it is
+    # usually another host (the YARN proxy) reached over plain http
+    client = parsed_arguments['client']
+    from .telemetry import TelemetrySampler
+    return TelemetrySampler( spark_ui_url, session['appId']
+                             , interval=parsed_arguments['telemetry_interval']
+                             , timeout=parsed_arguments['read_timeout']
+                             , filename=parsed_arguments['telemetry_file']
+                             , auth=client.session.auth if parsed_arguments['telemetry_credentials'] else None
+                             , verify=client.session.verify
+                             , rate_limiter=client.rate_limiter
+                             , tracer=client.tracer ).start()
+
+
+def finish_submission(parsed_arguments, state):
+    # Wait for the statement of the submission, show or store its output and
+    # clean up the session. If livy_submit is interrupted, the state file is
+    # kept so the submission can be finished with --attach
+    session_id = state['session_id']
+    statement_id = state['statement_id']
+
+    output_writer = make_output_writer( parsed_arguments, parsed_arguments['output_file'] )
+    sampler = start_telemetry( parsed_arguments, session_id )
+    try:
+        statement_status = wait_for_statement( parsed_arguments, session_id, statement_id
+                                                , callback=make_statement_wait_callback( parsed_arguments, session_id, state )
+                                                , data_writer=output_writer )
+    except KeyboardInterrupt:
+        detach_submission( parsed_arguments, state )
+        sys.exit(1)
+    except Exception:
+        detach_submission( parsed_arguments, state )
+        raise
+    finally:
+        if sampler is not None:
+            sampler.stop()
+
+    parsed_arguments['renderer'].statement_done( session_id, statement_status )
+
+    print_statement_result( statement_status, parsed_arguments['output_file'], output_writer )
+
+    if sampler is not None:
+        from .telemetry import print_telemetry_summary
+        print_telemetry_summary( sampler )
+
+    release_session( parsed_arguments, session_id )
+
+    # State files that were not asked for are only kept while they are needed
+    if os.path.dirname( os.path.abspath( parsed_arguments['state_file'] )) == DEFAULT_STATE_DIRECTORY:
+        remove_state( parsed_arguments['state_file'] )
+    else:
+        state['state'] = statement_status['state']
+        state['finished'] = True
+        save_state( parsed_arguments['state_file'], state )
+
+    print_request_count( parsed_arguments )
+
+
+def submit_script(parsed_arguments):
+    session_id = acquire_session( parsed_arguments )
+
+    file_contents = script_code( parsed_arguments, parsed_arguments['submit'].name, parsed_arguments['submit'].read() )
+    statement_id = submit_statement( parsed_arguments, session_id, file_contents )
+
+    print("Now executing the contents of the script {} (statement id={})".format( parsed_arguments['task_name'], statement_id ))
+
+    if parsed_arguments['state_file'] is None:
+        parsed_arguments['state_file'] = default_state_file( session_id, statement_id )
+    state = make_submission_state( parsed_arguments, session_id, statement_id )
+    save_state( parsed_arguments['state_file'], state )
+
+    if parsed_arguments['detach']:
+        detach_submission( parsed_arguments, state )
+        print_request_count( parsed_arguments )
+        return
+
+    finish_submission( parsed_arguments, state )
+
+
+def submission_attach(parsed_arguments):
+    state = parsed_arguments['attach_state']
+    if state.get('finished'):
+        print("Statement {} of session {} has already finished with state {}".format( state['statement_id'], state['session_id'], state['state'] ))
+        return
+
+    if get_session_state( parsed_arguments, state['session_id'] ) is None:
+        print("Cannot attach to session {} because it does not exist anymore".format( state['session_id'] ))
+        sys.exit(1)
+
+    print("Attaching to statement {} of session {} ({})".format( state['statement_id'], state['session_id'], state['task_name'] ))
+    apply_submission_state( parsed_arguments, state )
+    if state['cleanup'] == 'release':
+        get_registry( parsed_arguments ).set_owner( state['livy_url'], state['session_id'] )
+    finish_submission( parsed_arguments, state )
+
+
 def parse_arguments( args ):
     args_dict = vars( args )
 
@@ -539,6 +1342,18 @@ def parse_arguments( args ):
 
         args_dict['task_name'] = 'LivySubmit - ' + args_dict['task_name']
 
+    if args_dict['batch'] is not None:
+        if args_dict['task_name'] is None:
+            args_dict['task_name']  = os.path.basename( args_dict['batch'] )
+
+        args_dict['task_name'] = 'LivySubmit - ' + args_dict['task_name']
+
+    if args_dict['pipeline'] is not None:
+        if args_dict['task_name'] is None:
+            args_dict['task_name']  = os.path.basename( args_dict['pipeline'][0] ) + ' (pipeline)'
+
+        args_dict['task_name'] = 'LivySubmit - ' + args_dict['task_name']
+
     
 
 
@@ -546,11 +1361,36 @@ def parse_arguments( args ):
     if args_dict['connect_existing_session'] is not None:
         args_dict[ 'keep_session_alive'] = True
 
+    if args_dict['server'] is not None:
+        server = args_dict['server'].strip().rstrip('/')
+        livy_urls = [ url.strip().rstrip('/') for url in ( args_dict['livy_url'] or '' ).split(',') ]
+        if server not in livy_urls:
+            print('ERROR: --server {} is not one of the Livy servers {}'.format( server, ', '.join( livy_urls )))
+            sys.exit(1)
+        args_dict['livy_url'] = server
+
+    # The submission is finished on the Livy server it was started on
+    if args_dict['attach'] is not None:
+        args_dict['attach_state'] = load_state( args_dict['attach'] )
+        args_dict['livy_url'] = args_dict['attach_state']['livy_url']
+        args_dict['state_file'] = args_dict['attach']
+
+    # Make sure every concurrently running script can keep its own connection
+    if args_dict['submit_many'] is not None or args_dict['manifest'] is not None:
+        args_dict['pool_size'] = max( args_dict['pool_size'], args_dict['workers'], args_dict['session_pool'] )
+    if args_dict['watch'] is not None:
+        args_dict['pool_size'] = max( args_dict['pool_size'], args_dict['max_concurrent_requests'] )
+    if args_dict['cleanup']:
+        args_dict['pool_size'] = max( args_dict['pool_size'], args_dict['parallel'] )
+
+    if args_dict['telemetry_file'] is not None:
+        args_dict['telemetry'] = True
+
 
     args_dict['headers'] = {'Content-Type': 'application/json' , 'X-Requested-By' : args_dict['username'] }
 
     if args_dict['username'] is None:
-        _password = keyring.get_password( 'livysubmit' , args_dict['username'] )
+        _password = get_credential( args_dict, 'livysubmit' )
         if _password is None:
             raise Exception("No password stored for user {}. Please use command \"keyring set livysubmit {}\" to store password".format( args_dict['username'], args_dict['username']) )
 
@@ -558,18 +1398,95 @@ def parse_arguments( args ):
     return args_dict
           
 
+def apply_profile(parser, argv):
+    # The profile is read before the arguments are parsed, so its settings
+    # become the defaults of the options and the command line still wins.
+    # Options that are set through their environment variable keep that value
+    pre_parser = argparse.ArgumentParser( add_help=False, allow_abbrev=False )
+    pre_parser.add_argument( '--profile', default=os.environ.get('LIVY_SUBMIT_PROFILE') )
+    pre_parser.add_argument( '--config', default=DEFAULT_CONFIG_FILE )
+    known_arguments, _ = pre_parser.parse_known_args( argv )
+
+    try:
+        config = load_config( known_arguments.config )
+    except ValueError as e:
+        parser.error( 'cannot read {}: {}'.format( known_arguments.config, e ))
+    profile_name = known_arguments.profile or config.get('default_profile')
+    if profile_name is None:
+        return
+
+    if config == {}:
+        parser.error( 'profile {} given, but there is no config file {}'.format( profile_name, known_arguments.config ))
+
+    try:
+        settings = get_profile( config, profile_name, filename=known_arguments.config )
+    except ValueError as e:
+        parser.error( str(e) )
+
+    actions = { action.dest : action for action in parser._actions }
+    for key in settings:
+        if key not in actions and key != 'profile_conf':
+            parser.error( 'unknown setting {} in profile {} of {}'.format( key, profile_name, known_arguments.config ))
+        if key in actions:
+            actions[key].required = False
+
+    settings = { key : value for key, value in settings.items()
+                 if not (isinstance( actions.get(key), EnvDefault ) and actions[key].envvar in os.environ) }
+    parser.set_defaults( **settings )
+
+
 def main():
     parser = make_parser();
+    apply_profile( parser, sys.argv[1:] )
     args = parser.parse_args()
 
     parsed_arguments = parse_arguments(args)
 
 
-    if 'keyring' not in sys.modules:
+    # The cache can be searched without contacting Livy
+    if parsed_arguments['cache_search']:
+        cache_search( parsed_arguments )
+        return
+
+    if not keyring_available() and parsed_arguments['auth'] == 'basic':
         if parsed_arguments['password'] is None:
             print('ERROR: keyring library is not available and you did not provide a password')
             sys.exit(1)
 
+    parsed_arguments['tracer'] = Tracer() if parsed_arguments['trace'] is not None else None
+    # In events mode the events keep the real stdout and all other output of
+    # the command goes to stderr (see below), so a program can read the events
+    events = parsed_arguments['progress_mode'] == 'events'
+    parsed_arguments['renderer'] = make_renderer( parsed_arguments['progress_mode'], parsed_arguments['progress_step'], output=sys.stdout if events else None )
+    parsed_arguments['statement_cache'] = make_statement_cache( parsed_arguments )
+
+    # All commands share one pooled client, so the connection to Livy is
+    # reused and the password is only resolved once
+    parsed_arguments['client'] = make_client( parsed_arguments )
+
+    output = contextlib.redirect_stdout( sys.stderr ) if events else contextlib.nullcontext()
+    try:
+        with output:
+            try:
+                run_command( parsed_arguments )
+            except AmbiguousOwnerError as e:
+                # Session ids are only unique per server, so rather do nothing than
+                # act on the session of another server
+                print('ERROR: {} {} exists on several Livy servers:'.format( e.resource[:-1].capitalize(), e.object_id ))
+                for endpoint, info in e.matches:
+                    print('    {}  (user {}, state {}, name {})'.format( endpoint, info.get('proxyUser'), info.get('state'), info.get('name') ))
+                print('Use --server URL to choose one of them')
+                sys.exit(1)
+    finally:
+        # Also write the trace when the command fails or exits early
+        if parsed_arguments['tracer'] is not None:
+            parsed_arguments['tracer'].write( parsed_arguments['trace'], parsed_arguments['trace_format'], command_name( parsed_arguments ))
+
+
+def run_command(parsed_arguments):
+    if parsed_arguments['upload_store'] is not None:
+        stage_dependencies( parsed_arguments )
+
     if parsed_arguments['list_sessions']:
         session_list( parsed_arguments )
 
@@ -579,10 +1496,18 @@ def main():
     elif parsed_arguments['id_delete'] is not None:
         session_delete( parsed_arguments )
 
+    elif parsed_arguments['cleanup']:
+        from .cleanup import session_cleanup
+        session_cleanup( parsed_arguments )
+
     elif parsed_arguments['statement_information'] is not None:
         print_statement_progress( parsed_arguments )
 
 
+    elif parsed_arguments['watch'] is not None:
+        from .asyncclient import watch_statements
+        watch_statements( parsed_arguments )
+
     elif parsed_arguments['retrieve_statement'] is not None:
         print_statement( parsed_arguments )
 
@@ -591,3 +1516,36 @@ def main():
     
     elif parsed_arguments['submit'] is not None:
         submit_script( parsed_arguments )
+
+    elif parsed_arguments['attach'] is not None:
+        submission_attach( parsed_arguments )
+
+    elif parsed_arguments['batch'] is not None:
+        from .batch import batch_submit
+        batch_submit( parsed_arguments )
+
+    elif parsed_arguments['batch_status'] is not None:
+        from .batch import batch_status
+        batch_status( parsed_arguments )
+
+    elif parsed_arguments['batch_log'] is not None:
+        from .batch import batch_log
+        batch_log( parsed_arguments )
+
+    elif parsed_arguments['batch_kill'] is not None:
+        from .batch import batch_kill
+        batch_kill( parsed_arguments )
+
+    elif parsed_arguments['pipeline'] is not None:
+        from .pipeline import submit_pipeline
+        submit_pipeline( parsed_arguments )
+
+    elif parsed_arguments['prewarm'] is not None:
+        session_prewarm( parsed_arguments )
+
+    elif parsed_arguments['reap_sessions']:
+        session_reap( parsed_arguments )
+
+    elif parsed_arguments['submit_many'] is not None or parsed_arguments['manifest'] is not None:
+        from .multisubmit import submit_many
+        submit_many( parsed_arguments )
@@ -0,0 +1,57 @@
+import contextlib
+import json
+import os
+
+try:
+    import fcntl
+except ModuleNotFoundError:
+    fcntl = None
+
+
+@contextlib.contextmanager
+def locked_file(filename):
+    # Holds an exclusive lock on filename.lock while the block runs, so the
+    # livy_submit processes of the user can share filename. Without fcntl
+    # (Windows) the file is not locked.
+    directory = os.path.dirname( filename )
+    if directory != '' and not os.path.isdir( directory ):
+        os.makedirs( directory, mode=0o700 )
+
+    with open( filename + '.lock', 'a' ) as lock_file:
+        if fcntl is not None:
+            fcntl.flock( lock_file, fcntl.LOCK_EX )
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock( lock_file, fcntl.LOCK_UN )
+
+
+def replace_file(filename, write):
+    # Writes the file through write(f) next to it and then replaces it at
+    # once, so a reader never sees a half written file
+    with open( filename + '.tmp', 'w' ) as f:
+        write( f )
+    os.replace( filename + '.tmp', filename )
+
+
+@contextlib.contextmanager
+def locked_json(filename, default=dict, indent=None):
+    """
+    Loads the json in filename while holding its lock, yields it to be changed
+    in place and writes it back when the block ends without an exception.
+    @params:
+        filename    - Required  : json file shared between processes (Str)
+        default     - Optional  : called for the content if the file does not exist or is empty (Function)
+        indent      - Optional  : indent of the written json (Int)
+    """
+    with locked_file( filename ):
+        content = ''
+        if os.path.exists( filename ):
+            with open( filename, 'r' ) as f:
+                content = f.read()
+        data = json.loads( content ) if content.strip() != '' else default()
+
+        yield data
+
+        replace_file( filename, lambda f: json.dump( data, f, indent=indent ))
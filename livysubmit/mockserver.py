@@ -0,0 +1,573 @@
+import collections
+import json
+import re
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs, urlencode
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class MockLog(object):
+    """
+    Log of a session or batch the way Livy keeps it: only the last size lines
+    of stdout and of stderr (livy.cache-log.size), returned as one window of
+    the stdout lines, the stderr lines and the YARN diagnostics. Once a part
+    is full, its oldest line disappears for every new line, so the total
+    number of lines stops growing.
+    @params:
+        size    - Optional  : number of lines kept of stdout and of stderr (Int)
+    """
+    def __init__(self, size=200):
+        self.stdout = collections.deque( maxlen=size )
+        self.stderr = collections.deque( maxlen=size )
+        self.diagnostics = []
+
+    def lines(self):
+        return [ 'stdout: ' ] + list( self.stdout ) + [ '\nstderr: ' ] + list( self.stderr ) + [ '\nYARN Diagnostics: ' ] + self.diagnostics
+
+    def page(self, query):
+        # Response of GET /log, by default the last size lines
+        lines = self.lines()
+        size = int( query.get( 'size', [100] )[0] )
+        offset = int( query.get( 'from', [max( 0, len(lines) - size )] )[0] )
+        return { 'from' : offset, 'total' : len(lines), 'log' : lines[offset:offset + size] }
+
+
+class MockSession(object):
+    def __init__(self, session_id, data, created, server_url=None, log_size=200):
+        self.id = session_id
+        self.data = data
+        self.created = created
+        self.server_url = server_url
+        self.state = 'starting'
+        self.statements = []
+        self.log = MockLog( log_size )
+        self.log.stderr.append( 'Session {} created'.format(session_id) )
+
+    @property
+    def app_id(self):
+        return 'application_{}_{:04d}'.format( int(self.created), self.id )
+
+    def to_json(self):
+        spark_ui_url = None
+        if self.server_url is not None and self.state != 'starting':
+            spark_ui_url = '{}/sparkui/{}/'.format( self.server_url, self.id )
+
+        return {
+            'id' : self.id
+            , 'name' : self.data.get('name')
+            , 'appId' : self.app_id
+            , 'owner' : self.data.get('proxyUser')
+            , 'proxyUser' : self.data.get('proxyUser')
+            , 'state' : self.state
+            , 'kind' : self.data.get('kind', 'pyspark')
+            , 'appInfo' : { 'driverLogUrl' : None, 'sparkUiUrl' : spark_ui_url }
+            , 'log' : self.log.lines()[-100:]
+        }
+
+    def spark_executors(self):
+        # Two executors while idle, four while a statement runs. Every
+        # statement runs 10 tasks that read and write 1 MB of shuffle data
+        # each and use memory while they run
+        running = [ s for s in self.statements if s.state == 'running' ]
+        finished = [ s for s in self.statements if s.state == 'available' ]
+        num_executors = 4 if len(running) > 0 else 2
+        progress = sum( s.progress for s in running )
+        tasks = 10 * len(finished) + int( 10 * progress )
+
+        executors = [ { 'id' : 'driver', 'isActive' : True, 'totalCores' : 0, 'memoryUsed' : 0, 'maxMemory' : 2 * 1024**3 } ]
+        for i in range( num_executors ):
+            executors.append({
+                'id' : str( i + 1 )
+                , 'isActive' : True
+                , 'totalCores' : 4
+                , 'memoryUsed' : int( progress * 512 * 1024**2 )
+                , 'maxMemory' : 4 * 1024**3
+                , 'activeTasks' : 0 if len(running) == 0 else 2
+                , 'completedTasks' : tasks // num_executors
+                , 'failedTasks' : 0
+                , 'totalShuffleRead' : tasks * 1024**2 // num_executors
+                , 'totalShuffleWrite' : tasks * 1024**2 // num_executors
+                , 'peakMemoryMetrics' : { 'JVMHeapMemory' : int( (1 + progress) * 1024**3 ) }
+            })
+        return executors
+
+    def spark_stages(self, status=None):
+        stages = []
+        for statement in self.statements:
+            if statement.state == 'running':
+                stage_status = 'ACTIVE'
+            elif statement.state == 'available':
+                stage_status = 'COMPLETE'
+            else:
+                continue
+            stages.append({
+                'stageId' : statement.id
+                , 'status' : stage_status
+                , 'numTasks' : 10
+                , 'numCompleteTasks' : int( 10 * statement.progress )
+                , 'inputBytes' : 10 * 1024**2
+                , 'memoryBytesSpilled' : 0
+                , 'diskBytesSpilled' : 0
+            })
+        if status is not None:
+            stages = [ s for s in stages if s['status'] == status.upper() ]
+        return stages
+
+
+class MockBatch(object):
+    def __init__(self, batch_id, data, created, log_size=200):
+        self.id = batch_id
+        self.data = data
+        self.created = created
+        self.state = 'starting'
+        self.log = MockLog( log_size )
+        self.log.stderr.append( 'Batch {} submitted, executing {}'.format( batch_id, data.get('file') ))
+
+    def to_json(self):
+        return {
+            'id' : self.id
+            , 'name' : self.data.get('name')
+            , 'appId' : 'application_{}_{:04d}'.format( int(self.created), 5000 + self.id )
+            , 'owner' : self.data.get('proxyUser')
+            , 'proxyUser' : self.data.get('proxyUser')
+            , 'state' : self.state
+            , 'appInfo' : { 'driverLogUrl' : None, 'sparkUiUrl' : None }
+            , 'log' : self.log.lines()[-100:]
+        }
+
+
+class MockStatement(object):
+    def __init__(self, statement_id, code, created):
+        self.id = statement_id
+        self.code = code
+        self.created = created
+        self.state = 'waiting'
+        self.progress = 0.0
+        self.output = None
+        self.started = None
+        self.completed = None
+
+    def to_json(self):
+        return {
+            'id' : self.id
+            , 'code' : self.code
+            , 'state' : self.state
+            , 'output' : self.output
+            , 'progress' : self.progress
+            , 'started' : 0 if self.started is None else int(self.started * 1000)
+            , 'completed' : 0 if self.completed is None else int(self.completed * 1000)
+        }
+
+
+class MockLivyServer(object):
+    """
+    In-process fake Livy REST server for trying out and benchmarking
+    livy_submit without a cluster. Sessions become idle after startup_time
+    seconds, statements run one after the other in their session and take
+    statement_time seconds each. A statement whose code contains 'raise'
+    ends with an error, all others produce output_size bytes of output (or
+    echo their code if output_size is None). Batches start running after
+    startup_time seconds and end after another statement_time seconds, as
+    dead if the name of their file contains 'raise'. The sparkUiUrl of a
+    session points to a small part of the Spark REST API on the same server,
+    and /webhdfs/v1 is a small WebHDFS that keeps its files in memory. The
+    next interrupted_uploads uploads to it stop halfway.
+    @params:
+        host            - Optional  : host to listen on (Str)
+        port            - Optional  : port to listen on, 0 picks a free port (Int)
+        latency         - Optional  : seconds added to every response (Float)
+        startup_time    - Optional  : seconds before a new session becomes idle (Float)
+        statement_time  - Optional  : seconds a statement runs (Float)
+        output_size     - Optional  : number of bytes of output of a statement (Int)
+        log_size        - Optional  : number of lines of stdout and of stderr kept in a log (Int)
+    """
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, startup_time=2.0, statement_time=3.0, output_size=None, log_size=200):
+        self.latency = latency
+        self.log_size = log_size
+        self.startup_time = startup_time
+        self.statement_time = statement_time
+        self.output_size = output_size
+
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.next_session_id = 0
+        self.batches = {}
+        self.next_batch_id = 0
+        self.files = {}
+        self.interrupted_uploads = 0
+        self.reset_stats()
+
+        self.server = ThreadingHTTPServer( (host, port), make_handler(self) )
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return 'http://{}:{}'.format( host, port )
+
+    def start(self):
+        self.thread = threading.Thread( target=self.server.serve_forever )
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def reset_stats(self):
+        with self.lock:
+            self.request_count = 0
+            self.bytes_sent = 0
+            self.bytes_received = 0
+            self.requests = {}
+            # (method, path) of the requests that carried an Authorization header
+            self.authorized = []
+
+    def record(self, method, path, bytes_received, bytes_sent):
+        # Requests are counted per url template, e.g. GET /sessions/{id}/state
+        template = '{} {}'.format( method, re.sub( r'/\d+', '/{id}', path ))
+        with self.lock:
+            self.request_count += 1
+            self.bytes_received += bytes_received
+            self.bytes_sent += bytes_sent
+            self.requests[template] = self.requests.get( template, 0 ) + 1
+
+    def add_session(self, data, state='idle'):
+        # Create a session directly, e.g. to fill the server before a benchmark
+        with self.lock:
+            session = MockSession( self.next_session_id, data, time.time() - self.startup_time, self.url, self.log_size )
+            session.state = state
+            self.sessions[session.id] = session
+            self.next_session_id += 1
+            return session.id
+
+    def add_statement(self, session_id, code, completed=False):
+        # Create a statement directly, either waiting to be executed or completed
+        with self.lock:
+            session = self.sessions[session_id]
+            statement = MockStatement( len(session.statements), code, time.time() )
+            if completed:
+                statement.started = statement.completed = statement.created
+                statement.state = 'available'
+                statement.progress = 1.0
+                statement.output = self.make_output( statement )
+            session.statements.append( statement )
+            return statement.id
+
+    def make_output(self, statement):
+        if 'raise' in statement.code:
+            return {
+                'status' : 'error'
+                , 'execution_count' : statement.id
+                , 'ename' : 'Exception'
+                , 'evalue' : 'Statement {} failed'.format( statement.id )
+                , 'traceback' : [ 'Traceback (most recent call last):\n', '  File "<stdin>", line 1, in <module>\n' ]
+            }
+
+        if self.output_size is None:
+            text = statement.code
+        else:
+            line = 'output line of the mock livy server\n'
+            text = (line * (self.output_size // len(line) + 1))[:self.output_size]
+
+        return { 'status' : 'ok', 'execution_count' : statement.id, 'data' : { 'text/plain' : text }}
+
+    def update(self):
+        # Advance the state of all sessions and statements to the current time
+        now = time.time()
+        with self.lock:
+            for batch in self.batches.values():
+                if batch.state == 'starting' and now - batch.created >= self.startup_time:
+                    batch.state = 'running'
+                    batch.log.stderr.append( 'Batch {} is running'.format( batch.id ))
+                if batch.state == 'running' and now - batch.created >= self.startup_time + self.statement_time:
+                    batch.state = 'dead' if 'raise' in (batch.data.get('file') or '') else 'success'
+                    batch.log.stdout.append( 'Batch {} finished with state {}'.format( batch.id, batch.state ))
+
+            for session in self.sessions.values():
+                if session.state == 'starting' and now - session.created >= self.startup_time:
+                    session.state = 'idle'
+                    session.log.stderr.append( 'Session {} is idle'.format( session.id ))
+
+                if session.state not in [ 'idle', 'busy' ]:
+                    continue
+
+                # Statements run one after the other, starting when the session
+                # became idle
+                previous_end = session.created + self.startup_time
+                session.state = 'idle'
+                for statement in session.statements:
+                    if statement.state not in [ 'waiting', 'running' ]:
+                        previous_end = max( previous_end, statement.completed or previous_end )
+                        continue
+
+                    start = max( statement.created, previous_end )
+                    if now < start:
+                        break
+
+                    statement.started = start
+                    statement.state = 'running'
+                    session.state = 'busy'
+                    statement.progress = min( 1.0, (now - start) / self.statement_time ) if self.statement_time > 0 else 1.0
+                    session.log.stderr.append( 'Statement {} progress {:.2f}'.format( statement.id, statement.progress ))
+                    if statement.progress < 1.0:
+                        break
+
+                    statement.completed = start + self.statement_time
+                    statement.output = self.make_output( statement )
+                    statement.state = 'available'
+                    session.log.stdout.append( 'Statement {} finished'.format( statement.id ))
+                    session.state = 'idle'
+                    previous_end = statement.completed
+
+    def handle(self, method, path, query, body):
+        # Returns (status code, json response)
+        self.update()
+
+        if path == '/sessions':
+            if method == 'GET':
+                with self.lock:
+                    sessions = [ s.to_json() for s in sorted( self.sessions.values(), key=lambda s: s.id ) ]
+                offset = int( query.get( 'from', [0] )[0] )
+                size = int( query.get( 'size', [100] )[0] )
+                return 200, { 'from' : offset, 'total' : len(sessions), 'sessions' : sessions[offset:offset + size] }
+            if method == 'POST':
+                with self.lock:
+                    session = MockSession( self.next_session_id, body, time.time(), self.url, self.log_size )
+                    self.sessions[session.id] = session
+                    self.next_session_id += 1
+                    return 201, session.to_json()
+
+        if path.startswith('/batches'):
+            return self.handle_batches( method, path, query, body )
+
+        if path.startswith('/sparkui/'):
+            return self.handle_spark_ui( method, path, query )
+
+        match = re.match( r'^/sessions/(\d+)(/.*)?$', path )
+        if match is None:
+            return 404, 'Not found'
+
+        with self.lock:
+            session = self.sessions.get( int( match.group(1) ))
+        if session is None:
+            return 404, "Session '{}' not found.".format( match.group(1) )
+
+        rest = match.group(2) or ''
+        with self.lock:
+            if rest == '' and method == 'GET':
+                return 200, session.to_json()
+
+            if rest == '' and method == 'DELETE':
+                del self.sessions[session.id]
+                return 200, { 'msg' : 'deleted' }
+
+            if rest == '/state' and method == 'GET':
+                return 200, { 'id' : session.id, 'state' : session.state }
+
+            if rest == '/log' and method == 'GET':
+                return 200, dict( session.log.page( query ), id=session.id )
+
+            if rest == '/statements' and method == 'GET':
+                return 200, { 'total_statements' : len(session.statements), 'statements' : [ s.to_json() for s in session.statements ] }
+
+            if rest == '/statements' and method == 'POST':
+                if session.state not in [ 'idle', 'busy' ]:
+                    return 400, 'Session is in state {}'.format( session.state )
+                statement = MockStatement( len(session.statements), body.get('code', ''), time.time() )
+                session.statements.append( statement )
+                return 201, statement.to_json()
+
+            match = re.match( r'^/statements/(\d+)(/cancel)?$', rest )
+            if match is not None and int( match.group(1) ) < len( session.statements ):
+                statement = session.statements[ int( match.group(1) ) ]
+                if match.group(2) is None and method == 'GET':
+                    return 200, statement.to_json()
+                if match.group(2) is not None and method == 'POST':
+                    if statement.state in [ 'waiting', 'running' ]:
+                        statement.state = 'cancelled'
+                        statement.completed = time.time()
+                    return 200, { 'msg' : 'canceled' }
+
+        return 404, 'Not found'
+
+
+    def handle_spark_ui(self, method, path, query):
+        # A small part of the REST API of the Spark UI of a session
+        match = re.match( r'^/sparkui/(\d+)/api/v1/applications/([^/]+)/(allexecutors|executors|stages)$', path )
+        if match is None or method != 'GET':
+            return 404, 'Not found'
+
+        with self.lock:
+            session = self.sessions.get( int( match.group(1) ))
+            if session is None or session.app_id != match.group(2):
+                return 404, 'no such app: {}'.format( match.group(2) )
+
+            if match.group(3) == 'stages':
+                return 200, session.spark_stages( query.get( 'status', [None] )[0] )
+            return 200, session.spark_executors()
+
+    def handle_webhdfs(self, method, path, query, data):
+        # Returns (status code, json response, headers). CREATE without data
+        # redirects to the same url with data=true, like the namenode does to a
+        # datanode
+        name = path[len('/webhdfs/v1'):]
+        op = query.get( 'op', [''] )[0]
+        with self.lock:
+            if op == 'GETFILESTATUS' and method == 'GET':
+                if name not in self.files:
+                    return 404, { 'RemoteException' : { 'exception' : 'FileNotFoundException', 'message' : 'File does not exist: ' + name } }, {}
+                return 200, { 'FileStatus' : { 'type' : 'FILE', 'length' : len( self.files[name] ) } }, {}
+
+            if op == 'CREATE' and method == 'PUT':
+                if query.get( 'data', [''] )[0] != 'true':
+                    location = '{}{}?{}'.format( self.url, path, urlencode( dict( query, data=['true'] ), doseq=True ))
+                    return 307, None, { 'Location' : location }
+                if name in self.files and query.get( 'overwrite', ['false'] )[0] != 'true':
+                    return 403, { 'RemoteException' : { 'exception' : 'FileAlreadyExistsException', 'message' : name } }, {}
+                if self.interrupted_uploads > 0:
+                    self.interrupted_uploads -= 1
+                    self.files[name] = data[:len(data) // 2]
+                    return 500, { 'RemoteException' : { 'exception' : 'IOException', 'message' : 'Connection reset' } }, {}
+                self.files[name] = data
+                return 201, None, { 'Location' : 'hdfs://' + name }
+
+            if op == 'RENAME' and method == 'PUT':
+                destination = query.get( 'destination', [''] )[0]
+                if name not in self.files or destination in self.files:
+                    return 200, { 'boolean' : False }, {}
+                self.files[destination] = self.files.pop( name )
+                return 200, { 'boolean' : True }, {}
+
+            if op == 'DELETE' and method == 'DELETE':
+                return 200, { 'boolean' : self.files.pop( name, None ) is not None }, {}
+
+        return 400, { 'RemoteException' : { 'exception' : 'IllegalArgumentException', 'message' : 'Invalid operation ' + op } }, {}
+
+    def handle_batches(self, method, path, query, body):
+        if path == '/batches':
+            if method == 'GET':
+                with self.lock:
+                    batches = [ b.to_json() for b in sorted( self.batches.values(), key=lambda b: b.id ) ]
+                offset = int( query.get( 'from', [0] )[0] )
+                size = int( query.get( 'size', [100] )[0] )
+                return 200, { 'from' : offset, 'total' : len(batches), 'sessions' : batches[offset:offset + size] }
+            if method == 'POST':
+                if 'file' not in body:
+                    return 400, 'Missing file'
+                with self.lock:
+                    batch = MockBatch( self.next_batch_id, body, time.time(), self.log_size )
+                    self.batches[batch.id] = batch
+                    self.next_batch_id += 1
+                    return 201, batch.to_json()
+
+        match = re.match( r'^/batches/(\d+)(/.*)?$', path )
+        if match is None:
+            return 404, 'Not found'
+
+        with self.lock:
+            batch = self.batches.get( int( match.group(1) ))
+            if batch is None:
+                return 404, "Batch '{}' not found.".format( match.group(1) )
+
+            rest = match.group(2) or ''
+            if rest == '' and method == 'GET':
+                return 200, batch.to_json()
+
+            if rest == '' and method == 'DELETE':
+                del self.batches[batch.id]
+                return 200, { 'msg' : 'deleted' }
+
+            if rest == '/state' and method == 'GET':
+                return 200, { 'id' : batch.id, 'state' : batch.state }
+
+            if rest == '/log' and method == 'GET':
+                return 200, dict( batch.log.page( query ), id=batch.id )
+
+        return 404, 'Not found'
+
+
+def make_handler(server):
+    class MockLivyHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def respond(self):
+            length = int( self.headers.get( 'Content-Length', 0 ))
+            raw_body = self.rfile.read( length ) if length > 0 else b''
+
+            if server.latency > 0:
+                time.sleep( server.latency )
+
+            url = urlparse( self.path )
+            path = url.path.rstrip('/') or '/'
+            headers = {}
+            if self.headers.get('Authorization') is not None:
+                with server.lock:
+                    server.authorized.append( ( self.command, path ) )
+
+            if path.startswith('/webhdfs/v1/'):
+                status, response, headers = server.handle_webhdfs( self.command, path, parse_qs( url.query ), raw_body )
+            else:
+                body = json.loads( raw_body.decode('utf-8') ) if raw_body.strip() != b'' else {}
+                status, response = server.handle( self.command, path, parse_qs( url.query ), body )
+
+            content = json.dumps( response ).encode('utf-8') if response is not None else b''
+            self.send_response( status )
+            self.send_header( 'Content-Type', 'application/json' )
+            self.send_header( 'Content-Length', str(len(content)) )
+            for key, value in headers.items():
+                self.send_header( key, value )
+            self.end_headers()
+            self.wfile.write( content )
+
+            server.record( self.command, path, length, len(content) )
+
+        do_GET = respond
+        do_POST = respond
+        do_DELETE = respond
+        do_PUT = respond
+
+    return MockLivyHandler
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser( description='Run a mock Livy server' )
+    parser.add_argument( '--host', default='127.0.0.1' )
+    parser.add_argument( '--port', type=int, default=8998 )
+    parser.add_argument( '--latency', type=float, default=0.0, help='Seconds added to every response (Default: 0)' )
+    parser.add_argument( '--startup-time', type=float, default=2.0, help='Seconds before a new session becomes idle (Default: 2)' )
+    parser.add_argument( '--statement-time', type=float, default=3.0, help='Seconds a statement runs (Default: 3)' )
+    parser.add_argument( '--output-size', type=int, default=None, help='Number of bytes of output of every statement (Default: echo the code)' )
+    parser.add_argument( '--log-size', type=int, default=200, help='Number of lines of stdout and of stderr kept in a log, like livy.cache-log.size (Default: 200)' )
+    args = parser.parse_args()
+
+    server = MockLivyServer( host=args.host, port=args.port, latency=args.latency, startup_time=args.startup_time
+                             , statement_time=args.statement_time, output_size=args.output_size, log_size=args.log_size )
+    print("Mock Livy server listening on {}".format( server.url ))
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+import os
+import queue
+import sys
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .livysubmit import create_session, delete_session, get_session_state, submit_statement, \
+    wait_for_session, wait_for_statement, make_output_writer, script_code, print_request_count
+from .resources import FINISHED_SESSION_STATES
+
+
+def read_manifest(filename):
+    # Every non-empty line holds the path of a script, optionally followed by
+    # the file to which the output of that script has to be written
+    entries = []
+    with open( filename, 'r' ) as f:
+        for line in f:
+            line = line.strip()
+            if line == '' or line.startswith('#'):
+                continue
+
+            fields = line.split()
+            entries.append( ( fields[0], fields[1] if len(fields) > 1 else None ) )
+
+    return entries
+
+
+def make_jobs(parsed_arguments):
+    if parsed_arguments['manifest'] is not None:
+        entries = read_manifest( parsed_arguments['manifest'] )
+    else:
+        entries = [ (script, None) for script in parsed_arguments['submit_many'] ]
+
+    jobs = []
+    task_names = set()
+    for script, output_file in entries:
+        # Livy requires session names to be unique
+        name = os.path.basename( script )
+        if name in task_names:
+            name = '{}.{}'.format( name, len(jobs) )
+        task_names.add( name )
+
+        task_name = 'LivySubmit - ' + name
+        if output_file is None and parsed_arguments['output_dir'] is not None:
+            output_file = os.path.join( parsed_arguments['output_dir'], name + '.out' )
+
+        jobs.append({
+            'script' : script
+            , 'task_name' : task_name
+            , 'output_file' : output_file
+            , 'session_id' : None
+            , 'statement_id' : None
+            , 'state' : 'pending'
+            , 'error' : None
+            , 'duration' : None
+        })
+
+    return jobs
+
+
+def start_session(parsed_arguments, task_name):
+    # Returns the id of a new idle session, or None if the session did not start
+    session_id = create_session( parsed_arguments, task_name )
+    session_state = wait_for_session( parsed_arguments, session_id )
+
+    if session_state != 'idle':
+        delete_session( parsed_arguments, session_id )
+        return None
+
+    return session_id
+
+
+def execute_job(parsed_arguments, job, session_id):
+    with open( job['script'], 'r' ) as f:
+        code = script_code( parsed_arguments, job['script'], f.read() )
+
+    job['session_id'] = session_id
+    job['statement_id'] = submit_statement( parsed_arguments, session_id, code )
+    output_writer = make_output_writer( parsed_arguments, job['output_file'] )
+    statement_status = wait_for_statement( parsed_arguments, session_id, job['statement_id'], data_writer=output_writer )
+
+    job['state'] = statement_status['state']
+
+    output = statement_status['output']
+    if output is not None and output['status'] == 'error':
+        job['state'] = 'error'
+        job['error'] = '{}: {}'.format( output['ename'], output['evalue'] )
+    elif output is not None and output['status'] == 'ok' and job['output_file'] is not None:
+        output_writer.close()
+
+
+def run_job(parsed_arguments, job, reporter, session_id=None):
+    start = time.time()
+    own_session = session_id is None
+
+    try:
+        if own_session:
+            session_id = start_session( parsed_arguments, job['task_name'] )
+            if session_id is None:
+                job['state'] = 'dead'
+                job['error'] = 'Session did not become idle'
+
+        if session_id is not None:
+            execute_job( parsed_arguments, job, session_id )
+
+    except Exception as e:
+        job['state'] = 'failed'
+        job['error'] = str(e)
+
+    finally:
+        if own_session and session_id is not None and not parsed_arguments['keep_session_alive']:
+            delete_session( parsed_arguments, session_id )
+
+        job['duration'] = time.time() - start
+        reporter( job )
+
+
+def run_pool_worker(parsed_arguments, worker_id, job_queue, reporter):
+    # Every worker owns one session in which it executes jobs until there are
+    # no jobs left. If the session dies, it is replaced by a new one.
+    task_name = 'LivySubmit - pool {}-{}'.format( os.getpid(), worker_id )
+    session_id = None
+
+    try:
+        while True:
+            try:
+                job = job_queue.get_nowait()
+            except queue.Empty:
+                break
+
+            if session_id is not None and get_session_state( parsed_arguments, session_id ) in FINISHED_SESSION_STATES + [ None ]:
+                delete_session( parsed_arguments, session_id )
+                session_id = None
+
+            if session_id is None:
+                error = 'Session did not become idle'
+                try:
+                    session_id = start_session( parsed_arguments, task_name )
+                except Exception as e:
+                    error = str(e)
+
+            if session_id is None:
+                job['state'] = 'dead'
+                job['error'] = error
+                job['duration'] = 0.0
+                reporter( job )
+                continue
+
+            run_job( parsed_arguments, job, reporter, session_id=session_id )
+
+    finally:
+        if session_id is not None and not parsed_arguments['keep_session_alive']:
+            delete_session( parsed_arguments, session_id )
+
+
+def print_summary(jobs):
+    print_format = '{:<40} {:<10} {:>10} {:<8} {}'
+
+    print()
+    print( print_format.format( 'JOB', 'STATE', 'DURATION', 'SESSION', 'OUTPUT' ))
+    print('-' * 90)
+    for job in jobs:
+        print( print_format.format( job['task_name'][len('LivySubmit - '):]
+                                    , job['state']
+                                    , '{:.1f}s'.format( job['duration'] ) if job['duration'] is not None else ''
+                                    , '' if job['session_id'] is None else job['session_id']
+                                    , job['output_file'] if job['output_file'] is not None and job['state'] == 'available' else '' ))
+        if job['error'] is not None:
+            print( '    {}'.format( job['error'] ))
+    print()
+
+
+def submit_many(parsed_arguments):
+    jobs = make_jobs( parsed_arguments )
+
+    if parsed_arguments['output_dir'] is not None and not os.path.isdir( parsed_arguments['output_dir'] ):
+        os.makedirs( parsed_arguments['output_dir'] )
+
+    print_lock = threading.Lock()
+    finished = []
+
+    def reporter(job):
+        with print_lock:
+            finished.append( job )
+            print( '[{}/{}] {}: {} ({:.1f}s)'.format( len(finished), len(jobs), job['script'], job['state'], job['duration'] ))
+            sys.stdout.flush()
+
+    start = time.time()
+
+    if parsed_arguments['session_pool'] > 0:
+        print("Executing {} scripts in a pool of {} sessions".format( len(jobs), parsed_arguments['session_pool'] ))
+
+        job_queue = queue.Queue()
+        for job in jobs:
+            job_queue.put( job )
+
+        workers = [ threading.Thread( target=run_pool_worker, args=(parsed_arguments, i, job_queue, reporter) )
+                        for i in range( parsed_arguments['session_pool'] ) ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    else:
+        print("Executing {} scripts with {} concurrent sessions".format( len(jobs), parsed_arguments['workers'] ))
+
+        with ThreadPoolExecutor( max_workers=parsed_arguments['workers'] ) as executor:
+            for job in jobs:
+                executor.submit( run_job, parsed_arguments, job, reporter )
+
+    print_summary( jobs )
+    print("Executed {} scripts in {:.1f}s".format( len(jobs), time.time() - start ))
+    print_request_count( parsed_arguments )
+
+    if any( job['state'] != 'available' for job in jobs ):
+        sys.exit(1)
@@ -0,0 +1,135 @@
+import os
+import sys
+import time
+
+from .livysubmit import acquire_session, release_session, submit_statement, cancel_statement, wait_for_statement, \
+    make_output_writer, make_statement_wait_callback, script_code, print_statement_result, print_request_count
+
+
+def make_steps(parsed_arguments):
+    # All scripts are read before the session is started, so a missing script
+    # does not cost a session
+    steps = []
+    names = set()
+    for script in parsed_arguments['pipeline']:
+        name = os.path.basename( script )
+        if name in names:
+            name = '{}.{}'.format( name, len(steps) )
+        names.add( name )
+
+        with open( script, 'r' ) as f:
+            code = script_code( parsed_arguments, script, f.read() )
+
+        steps.append({
+            'script' : script
+            , 'code' : code
+            , 'output_file' : None if parsed_arguments['output_dir'] is None else os.path.join( parsed_arguments['output_dir'], name + '.out' )
+            , 'statement_id' : None
+            , 'state' : 'skipped'
+            , 'error' : None
+            , 'submitted' : None
+            , 'finished' : None
+            , 'runtime' : None
+        })
+
+    return steps
+
+
+def post_step(parsed_arguments, session_id, step):
+    step['statement_id'] = submit_statement( parsed_arguments, session_id, step['code'] )
+    step['submitted'] = time.time()
+    step['state'] = 'waiting'
+
+
+def statement_runtime(statement_status):
+    # Livy 0.5 and later report when a statement started and completed (in ms)
+    started = statement_status.get('started') or 0
+    completed = statement_status.get('completed') or 0
+    if started > 0 and completed >= started:
+        return (completed - started) / 1000.0
+    return None
+
+
+def cancel_remaining(parsed_arguments, session_id, steps):
+    for step in steps:
+        if step['statement_id'] is not None:
+            cancel_statement( parsed_arguments, session_id, step['statement_id'] )
+            step['state'] = 'cancelled'
+
+
+def run_pipeline(parsed_arguments, session_id, steps):
+    # Returns True if all steps were executed successfully
+    post_step( parsed_arguments, session_id, steps[0] )
+
+    for i, step in enumerate( steps ):
+        # Livy executes the statements of a session one after the other, so
+        # the next statement already waits in the session while this one runs
+        if i + 1 < len(steps):
+            post_step( parsed_arguments, session_id, steps[i + 1] )
+
+        print()
+        print("[{}/{}] Now executing the contents of the script {} (statement id={})".format( i + 1, len(steps), step['script'], step['statement_id'] ))
+        output_writer = make_output_writer( parsed_arguments, step['output_file'] )
+        statement_status = wait_for_statement( parsed_arguments, session_id, step['statement_id']
+                                                , callback=make_statement_wait_callback( parsed_arguments, session_id )
+                                                , data_writer=output_writer )
+
+        step['finished'] = time.time()
+        step['runtime'] = statement_runtime( statement_status )
+        step['state'] = statement_status['state']
+
+        parsed_arguments['renderer'].statement_done( session_id, statement_status )
+        print_statement_result( statement_status, step['output_file'], output_writer )
+
+        output = statement_status['output']
+        if output is not None and output['status'] == 'error':
+            step['state'] = 'error'
+            step['error'] = '{}: {}'.format( output['ename'], output['evalue'] )
+
+        if step['state'] != 'available':
+            print()
+            print("Script {} did not finish successfully, skipping the remaining scripts".format( step['script'] ))
+            cancel_remaining( parsed_arguments, session_id, steps[i + 1:] )
+            return False
+
+    return True
+
+
+def print_summary(steps):
+    print_format = '{:<4} {:<40} {:<10} {:>10} {:>10} {}'
+
+    print()
+    print( print_format.format( '#', 'SCRIPT', 'STATE', 'RUNTIME', 'WALL', 'OUTPUT' ))
+    print('-' * 90)
+    for i, step in enumerate( steps ):
+        print( print_format.format( i + 1
+                                    , step['script']
+                                    , step['state']
+                                    , '{:.1f}s'.format( step['runtime'] ) if step['runtime'] is not None else ''
+                                    , '{:.1f}s'.format( step['finished'] - step['submitted'] ) if step['finished'] is not None else ''
+                                    , step['output_file'] if step['output_file'] is not None and step['state'] == 'available' else '' ))
+        if step['error'] is not None:
+            print( '    {}'.format( step['error'] ))
+    print()
+
+
+def submit_pipeline(parsed_arguments):
+    steps = make_steps( parsed_arguments )
+
+    if parsed_arguments['output_dir'] is not None and not os.path.isdir( parsed_arguments['output_dir'] ):
+        os.makedirs( parsed_arguments['output_dir'] )
+
+    session_id = acquire_session( parsed_arguments )
+
+    start = time.time()
+    success = run_pipeline( parsed_arguments, session_id, steps )
+
+    print_summary( steps )
+    print("Executed {} of {} scripts in {:.1f}s".format( sum( step['state'] == 'available' for step in steps ), len(steps), time.time() - start ))
+
+    release_session( parsed_arguments, session_id )
+
+    print_request_count( parsed_arguments )
+
+    if not success:
+        sys.exit(1)
@@ -0,0 +1,72 @@
+import time
+
+
+class PollScheduler(object):
+    """
+    Iterate over this object to get an adaptive polling loop. The interval
+    between iterations starts at min_interval and grows by the backoff factor
+    up to max_interval for as long as the observed value stays the same. As
+    soon as a different value is observed the interval snaps back to
+    min_interval.
+    @params:
+        min_interval    - Optional  : smallest number of seconds between two polls (Float)
+        max_interval    - Optional  : largest number of seconds between two polls (Float)
+        backoff         - Optional  : factor with which the interval grows (Float)
+        timeout         - Optional  : stop iterating after this many seconds (Float)
+    """
+    def __init__(self, min_interval=1.0, max_interval=15.0, backoff=1.5, timeout=None):
+        self.min_interval = min_interval
+        self.max_interval = max( min_interval, max_interval )
+        self.backoff = backoff
+        self.timeout = timeout
+
+        self.interval = min_interval
+        self.last_observation = None
+        self.has_observation = False
+
+    def observe(self, observation):
+        if self.has_observation and observation == self.last_observation:
+            self.interval = min( self.interval * self.backoff, self.max_interval )
+        else:
+            self.interval = self.min_interval
+
+        self.last_observation = observation
+        self.has_observation = True
+
+    def next_sleep(self, start):
+        # Number of seconds to sleep before the next poll, None once the
+        # timeout has passed
+        sleep_time = self.interval
+        if self.timeout is not None:
+            remaining = self.timeout - ( time.time() - start )
+            if remaining <= 0:
+                return None
+            sleep_time = min( sleep_time, remaining )
+
+        return sleep_time
+
+    def __iter__(self):
+        start = time.time()
+        i = 0
+        while True:
+            sleep_time = self.next_sleep( start )
+            if sleep_time is None:
+                return
+
+            time.sleep( sleep_time )
+            yield i
+            i += 1
+
+    async def __aiter__(self):
+        import asyncio
+
+        start = time.time()
+        i = 0
+        while True:
+            sleep_time = self.next_sleep( start )
+            if sleep_time is None:
+                return
+
+            await asyncio.sleep( sleep_time )
+            yield i
+            i += 1
@@ -0,0 +1,95 @@
+import os
+import time
+
+from urllib.parse import urlsplit
+
+from .locking import locked_json
+from .registry import pid_alive
+
+
+DEFAULT_RATE_LIMIT_FILE = os.path.join( os.path.expanduser('~'), '.livysubmit', 'ratelimit.json' )
+
+# Seconds after its last request that a process no longer counts for the fair share
+ACTIVE_TIME = 10
+
+
+class RateLimiter(object):
+    """
+    Token bucket per Livy host that is shared by all livy_submit processes of
+    the user through a locked file. The file holds the slots that are reserved
+    for the requests that are about to be sent. While several processes are
+    busy, each process gets an equal share of the rate and takes the earliest
+    free slot from its share on: a process that reserves many requests at once
+    (e.g. --cleanup) cannot crowd out the processes that are polling their
+    statements.
+    @params:
+        rate        - Required  : maximum number of requests per second per host (Float)
+        burst       - Optional  : number of requests that can be sent at once after a quiet period (Int, Default: one second of requests)
+        filename    - Optional  : file in which the state of the buckets is shared (Str)
+    """
+    def __init__(self, rate, burst=None, filename=DEFAULT_RATE_LIMIT_FILE):
+        self.rate = float(rate)
+        self.burst = max( 1, burst if burst is not None else int(self.rate) )
+        self.filename = filename
+        self.waited = 0.0
+
+    def conforms(self, tat, slots):
+        # True if the sorted slots keep to the rate and burst, starting from
+        # the theoretical arrival time tat of the requests before them (GCRA)
+        interval = 1.0 / self.rate
+        for slot in slots:
+            if slot < tat - (self.burst - 1) * interval - 1e-9:
+                return False
+            tat = max( tat, slot ) + interval
+        return True
+
+    def reserve(self, host, now):
+        # Returns the time at which this process may send its next request to host
+        with locked_json( self.filename ) as state:
+            bucket = state.setdefault( host, {} )
+            me = str( os.getpid() )
+            clients = { pid : client for pid, client in bucket.get( 'clients', {} ).items()
+                        if now - client['seen'] < ACTIVE_TIME and pid_alive( int(pid) ) }
+            active = len(clients) + (0 if me in clients else 1)
+            interval = 1.0 / self.rate
+
+            # Slots that have passed only count through the arrival time
+            tat = bucket.get( 'tat', 0.0 )
+            slots = []
+            for slot in sorted( bucket.get( 'slots', [] )):
+                if slot <= now:
+                    tat = max( tat, slot ) + interval
+                else:
+                    slots.append( slot )
+
+            # A process on its own can use the whole burst, otherwise its
+            # requests are spread out to its share of the rate
+            earliest = now
+            if me in clients and active > 1:
+                earliest = max( now, clients[me]['next'] )
+
+            # The earliest time in every gap between the reserved slots, the
+            # first of them that leaves the other slots in time is taken
+            candidates = []
+            gap_tat, previous = tat, earliest
+            for slot in slots + [ None ]:
+                candidates.append( max( earliest, previous, gap_tat - (self.burst - 1) * interval ))
+                if slot is not None:
+                    gap_tat, previous = max( gap_tat, slot ) + interval, slot
+            slot = min( t for t in candidates if self.conforms( tat, sorted( slots + [ t ] )))
+
+            bucket['tat'] = tat
+            bucket['slots'] = sorted( slots + [ slot ] )
+            clients[me] = { 'next' : slot + active * interval, 'seen' : now }
+            bucket['clients'] = clients
+            bucket.pop( 'next', None )
+
+        return slot
+
+    def acquire(self, url):
+        # Wait until a request to the host of url may be sent
+        now = time.time()
+        slot = self.reserve( urlsplit( url ).netloc, now )
+        if slot > now:
+            self.waited += slot - now
+            time.sleep( slot - now )
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import time
+
+from .locking import locked_json
+
+
+DEFAULT_REGISTRY_FILE = os.path.join( os.path.expanduser('~'), '.livysubmit', 'sessions.json' )
+
+
+def profile_key(session_data):
+    # Sessions can be shared between scripts if everything except the name of
+    # the session is the same
+    profile = { key : value for key, value in session_data.items() if key != 'name' }
+    return hashlib.sha256( json.dumps( profile, sort_keys=True ).encode('utf-8') ).hexdigest()
+
+
+def pid_alive(pid):
+    if os.name != 'posix':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SessionRegistry(object):
+    """
+    Local registry of the sessions created by livy_submit that can be reused,
+    stored as a json file that is shared by all livy_submit processes of the
+    user. Every entry holds the livy url, session id, profile key, whether the
+    session is idle or busy and the time it was last used. A busy session is
+    owned by the process that uses it, or by the state file of a detached
+    submission until it is finished with --attach.
+    @params:
+        filename    - Optional  : file in which the registry is stored (Str)
+    """
+    def __init__(self, filename=DEFAULT_REGISTRY_FILE):
+        self.filename = filename
+
+    def entries(self):
+        return locked_json( self.filename, default=list, indent=2 )
+
+    def add(self, livy_url, session_id, profile, state='busy'):
+        with self.entries() as entries:
+            entries.append({
+                'livy_url' : livy_url
+                , 'session_id' : session_id
+                , 'profile' : profile
+                , 'state' : state
+                , 'pid' : os.getpid() if state == 'busy' else None
+                , 'state_file' : None
+                , 'created' : time.time()
+                , 'last_used' : time.time()
+            })
+
+    def claim(self, livy_url, profile):
+        # Mark one idle session with the given profile as busy and return its
+        # id, or None if there is no such session. Sessions claimed by a
+        # process that no longer exists are considered idle again, unless a
+        # detached submission still owns them.
+        with self.entries() as entries:
+            for entry in sorted( entries, key=lambda e: -e['last_used'] ):
+                if entry['livy_url'] != livy_url or entry['profile'] != profile:
+                    continue
+
+                if entry['state'] != 'idle':
+                    if entry.get('state_file') is not None:
+                        if os.path.exists( entry['state_file'] ):
+                            continue
+                    elif pid_alive( entry['pid'] ):
+                        continue
+
+                entry['state'] = 'busy'
+                entry['pid'] = os.getpid()
+                entry['state_file'] = None
+                return entry['session_id']
+
+        return None
+
+    def set_owner(self, livy_url, session_id, state_file=None):
+        # Hand a busy session over to the state file of a detached submission,
+        # or take it over in this process (state_file None). Returns False if
+        # the session is no longer in the registry
+        with self.entries() as entries:
+            for entry in entries:
+                if entry['livy_url'] == livy_url and entry['session_id'] == session_id:
+                    entry['state'] = 'busy'
+                    entry['pid'] = None if state_file is not None else os.getpid()
+                    entry['state_file'] = state_file
+                    return True
+
+        return False
+
+    def release(self, livy_url, session_id):
+        # Returns False if the session is no longer in the registry
+        with self.entries() as entries:
+            for entry in entries:
+                if entry['livy_url'] == livy_url and entry['session_id'] == session_id:
+                    entry['state'] = 'idle'
+                    entry['pid'] = None
+                    entry['state_file'] = None
+                    entry['last_used'] = time.time()
+                    return True
+
+        return False
+
+    def remove(self, livy_url, session_id):
+        with self.entries() as entries:
+            entries[:] = [ e for e in entries if not (e['livy_url'] == livy_url and e['session_id'] == session_id) ]
+
+    def expire(self, livy_url, ttl):
+        # Remove and return the ids of the idle sessions that have not been
+        # used for more than ttl seconds
+        expired = []
+        with self.entries() as entries:
+            for entry in entries:
+                if entry['livy_url'] == livy_url and entry['state'] == 'idle' and time.time() - entry['last_used'] > ttl:
+                    expired.append( entry['session_id'] )
+
+            entries[:] = [ e for e in entries if not (e['livy_url'] == livy_url and e['session_id'] in expired) ]
+
+        return expired
@@ -0,0 +1,221 @@
+import json
+import sys
+import time
+
+
+ROTATING_CURSOR = '|/-\\|/-\\'
+
+# States in which livy_submit stops waiting for a session
+SESSION_WAIT_DONE = [ 'idle', 'dead', None ]
+
+
+def format_progress(percentage, prefix='', suffix='', decimals=1, bar_length=100):
+    str_format = "{0:." + str(decimals) + "f}"
+    percents = str_format.format(  percentage )
+    filled_length = int(round(bar_length * (percentage/100.0)))
+    bar = '#' * filled_length + '-' * (bar_length - filled_length)
+
+    return '%s |%s| %s%s %s    ' % (prefix, bar, percents, '%', suffix)
+
+
+class Renderer(object):
+    """
+    Base of the renderers
+    @params:
+        output  - Optional  : stream to write to, sys.stdout at the time of writing if None (File)
+    """
+    def __init__(self, output=None):
+        self.output = output
+
+    @property
+    def stream(self):
+        return self.output if self.output is not None else sys.stdout
+
+
+class TtyRenderer(Renderer):
+    """
+    Shows the progress on a single line of the terminal that is rewritten
+    when the state or the progress changes
+    @params:
+        output  - Optional  : stream to write to, sys.stdout at the time of writing if None (File)
+    """
+    # Other output has to start on a new line while a progress line is shown
+    inline = True
+
+    def __init__(self, output=None):
+        super(TtyRenderer, self).__init__( output )
+        self.last = None
+        self.last_statements = None
+
+    def session_wait(self, session_id, i, session_state):
+        if session_state in SESSION_WAIT_DONE:
+            self.stream.write("\rWaiting for session to become idle before sending statements DONE\n")
+        else:
+            self.stream.write("\rWaiting for session to become idle before sending statements {}".format( ROTATING_CURSOR[ i% len(ROTATING_CURSOR) ] ))
+        self.stream.flush()
+
+    def statement_wait(self, session_id, statement_status):
+        current = ( statement_status['state'], statement_status['progress'] )
+        if current == self.last:
+            return
+        self.last = current
+
+        self.stream.write( '\r' + format_progress( 100*statement_status['progress'], prefix=statement_status['state'], suffix='Complete', bar_length=50 ))
+        self.stream.flush()
+
+    def statement_done(self, session_id, statement_status):
+        self.last = None
+        self.stream.write( '\r' + format_progress( 100*statement_status['progress'], prefix=statement_status['state'], suffix='Complete', bar_length=50 ) + '\n' )
+        self.stream.flush()
+
+    def statements_wait(self, statements):
+        # One line per statement of --watch, the block is redrawn in place
+        # when the state or the progress of one of them changes
+        current = [ ( key, statement_status['state'], statement_status['progress'] ) for key, statement_status in statements.items() ]
+        if current == self.last_statements:
+            return
+
+        if self.last_statements is not None:
+            self.stream.write( '\x1b[{}A'.format( len(self.last_statements) ))
+        self.last_statements = current
+
+        for (session_id, statement_id), statement_status in statements.items():
+            prefix = '{:>6}/{:<6} {:<10}'.format( session_id, statement_id, statement_status['state'] )
+            self.stream.write( '\r' + format_progress( 100*statement_status['progress'], prefix=prefix, suffix='Complete', bar_length=50 ) + '\n' )
+        self.stream.flush()
+
+    def statements_done(self, statements):
+        self.statements_wait( statements )
+        self.last_statements = None
+
+
+class PlainRenderer(Renderer):
+    """
+    Writes a line for every change of state, and for the progress every time
+    it passes a multiple of progress_step percent, so log files stay small
+    @params:
+        progress_step   - Optional  : percentage between two progress lines, 0 for no progress lines (Float)
+        output          - Optional  : stream to write to, sys.stdout at the time of writing if None (File)
+    """
+    inline = False
+
+    def __init__(self, progress_step=10, output=None):
+        super(PlainRenderer, self).__init__( output )
+        self.progress_step = progress_step
+        self.session_state = None
+        self.last_state = None
+        self.last_step = None
+        self.watched = {}
+
+    def write(self, line):
+        self.stream.write( line + '\n' )
+        self.stream.flush()
+
+    def session_wait(self, session_id, i, session_state):
+        if session_state == self.session_state:
+            return
+        if self.session_state is None:
+            self.write( "Waiting for session {} to become idle before sending statements".format( session_id ))
+        self.session_state = session_state
+        self.write( "Session {}: {}".format( session_id, session_state ))
+
+    def statement_wait(self, session_id, statement_status):
+        state = statement_status['state']
+        percentage = 100*statement_status['progress']
+        step = None
+        if self.progress_step > 0:
+            step = int( percentage // self.progress_step )
+
+        if state == self.last_state and step == self.last_step:
+            return
+        self.last_state = state
+        self.last_step = step
+        self.write( "Statement {} in session {}: {} {:.1f}%".format( statement_status['id'], session_id, state, percentage ))
+
+    def statement_done(self, session_id, statement_status):
+        if statement_status['state'] != self.last_state:
+            self.write( "Statement {} in session {}: {} {:.1f}%".format( statement_status['id'], session_id, statement_status['state'], 100*statement_status['progress'] ))
+        self.last_state = None
+        self.last_step = None
+
+    def write_statement(self, session_id, statement_status):
+        self.write( "Statement {} in session {}: {} {:.1f}%".format( statement_status['id'], session_id, statement_status['state'], 100*statement_status['progress'] ))
+
+    def statements_wait(self, statements):
+        # Like statement_wait, for every statement of --watch separately.
+        # Statements that have not been polled yet are left out
+        for key, statement_status in statements.items():
+            if statement_status['state'] == 'unknown':
+                continue
+
+            step = None
+            if self.progress_step > 0:
+                step = int( 100*statement_status['progress'] // self.progress_step )
+
+            current = ( statement_status['state'], step )
+            if current == self.watched.get( key ):
+                continue
+            self.watched[key] = current
+            self.write_statement( key[0], statement_status )
+
+    def statements_done(self, statements):
+        self.statements_wait( statements )
+        self.watched = {}
+
+
+class EventRenderer(PlainRenderer):
+    """
+    Writes the changes as json lines, e.g.
+    {"time": 1700000000.0, "event": "statement", "session_id": 1, "statement_id": 0, "state": "running", "progress": 0.5}
+    """
+    def write_event(self, event, session_id, state, statement_id=None, progress=None):
+        record = { 'time' : round( time.time(), 3 ), 'event' : event, 'session_id' : session_id }
+        if statement_id is not None:
+            record['statement_id'] = statement_id
+        record['state'] = state
+        if progress is not None:
+            record['progress'] = progress
+        self.write( json.dumps( record ))
+
+    def session_wait(self, session_id, i, session_state):
+        if session_state == self.session_state:
+            return
+        self.session_state = session_state
+        self.write_event( 'session', session_id, session_state )
+
+    def statement_wait(self, session_id, statement_status):
+        state = statement_status['state']
+        step = None
+        if self.progress_step > 0:
+            step = int( 100*statement_status['progress'] // self.progress_step )
+
+        if state == self.last_state and step == self.last_step:
+            return
+        self.last_state = state
+        self.last_step = step
+        self.write_event( 'statement', session_id, state, statement_status['id'], statement_status['progress'] )
+
+    def statement_done(self, session_id, statement_status):
+        self.write_event( 'statement_done', session_id, statement_status['state'], statement_status['id'], statement_status['progress'] )
+        self.last_state = None
+        self.last_step = None
+
+    def write_statement(self, session_id, statement_status):
+        self.write_event( 'statement', session_id, statement_status['state'], statement_status['id'], statement_status['progress'] )
+
+    def statements_done(self, statements):
+        for (session_id, statement_id), statement_status in statements.items():
+            self.write_event( 'statement_done', session_id, statement_status['state'], statement_status['id'], statement_status['progress'] )
+        self.watched = {}
+
+
+def make_renderer(mode='auto', progress_step=10, output=None):
+    # auto renders the progress bar on a terminal and plain lines otherwise
+    if mode == 'auto':
+        mode = 'tty' if ( output if output is not None else sys.stdout ).isatty() else 'plain'
+
+    if mode == 'tty':
+        return TtyRenderer( output )
+    if mode == 'events':
+        return EventRenderer( progress_step, output )
+    return PlainRenderer( progress_step, output )
@@ -0,0 +1,133 @@
+from .cache import FINISHED_STATEMENT_STATES, cache_key, session_identity
+from .streaming import StreamingJSONParser, iter_text
+
+
+# States of a session in which it can no longer execute statements
+FINISHED_SESSION_STATES = [ 'shutting_down', 'error', 'dead', 'killed', 'success' ]
+
+
+def iter_sessions(client, page_size=100):
+    # Fetch the sessions one page at a time. Sessions that are created or
+    # deleted in the meantime shift the pages, so a session can show up twice.
+    # With several Livy servers, every session gets the endpoint it belongs to
+    for endpoint in client.live_endpoints():
+        offset = 0
+        seen = set()
+        while True:
+            result = client.get( '/sessions', endpoint=endpoint, params={ 'from' : offset, 'size' : page_size })
+            page = result.json()
+            sessions = page.get( 'sessions', [] )
+
+            for s in sessions:
+                if s['id'] not in seen:
+                    seen.add( s['id'] )
+                    if len( client.endpoints ) > 1:
+                        s['endpoint'] = endpoint
+                        client.set_owner( 'sessions', s['id'], endpoint )
+                    yield s
+
+            offset += len(sessions)
+            if len(sessions) < page_size or ('total' in page and offset >= page['total']):
+                break
+
+
+def get_session_identity(client, session_id, identities):
+    # Identity of the session in the statement cache (see cache.session_identity),
+    # None if the session does not exist. It is remembered in identities, so
+    # it is asked only once per session
+    livy_url = client.owner( 'sessions', session_id )
+    if ( livy_url, session_id ) not in identities:
+        result = client.get( '/sessions/{}'.format(session_id))
+        identities[( livy_url, session_id )] = session_identity( result.json() ) if result.status_code == 200 else None
+    return identities[( livy_url, session_id )]
+
+
+def get_cached_statement(client, cache, identities, session_id, statement_id, data_writer=None):
+    livy_url = client.owner( 'sessions', session_id )
+    identity = get_session_identity( client, session_id, identities )
+    if identity is not None:
+        key = cache_key( livy_url, session_id, statement_id, identity )
+    else:
+        # The session no longer exists, so the statement can only be the most
+        # recent one that was cached with these ids
+        key = cache.latest( cache_key( livy_url, session_id, statement_id ))
+        if key is None:
+            return None
+
+    return cache.get( key, data_writer=data_writer )
+
+
+def cache_statement(client, cache, identities, session_id, statement_id, statement_status, task_name=None, cache_writer=None):
+    # Stores a finished statement in the statement cache, under the identity
+    # of its session
+    identity = None
+    if statement_status.get('state') in FINISHED_STATEMENT_STATES:
+        identity = get_session_identity( client, session_id, identities )
+
+    if identity is None:
+        if cache_writer is not None:
+            cache_writer.discard()
+        return
+
+    livy_url = client.owner( 'sessions', session_id )
+    info = { 'livy_url' : livy_url, 'session_id' : session_id, 'statement_id' : statement_id
+             , 'session' : identity, 'task_name' : task_name }
+    cache.put( cache_key( livy_url, session_id, statement_id, identity ), statement_status, info, cache_writer )
+
+
+def fetch_statement(client, session_id, statement_id, data_writer=None, cache=None, identities=None, task_name=None, from_cache=False):
+    """
+    Returns (status code, statement json) of a statement. If a data_writer is
+    given, the response is parsed while it is being read and the output data
+    of the statement is passed to the data_writer instead of being kept in
+    memory (see StreamingJSONParser). Finished statements are stored in the
+    cache, and with from_cache a cached statement is returned instead of
+    asking Livy.
+    @params:
+        client          - Required  : the client used for the requests (LivyClient)
+        session_id      - Required  : id of the session (Int)
+        statement_id    - Required  : id of the statement (Int)
+        data_writer     - Optional  : function called with the fragments of the output data (Function)
+        cache           - Optional  : the statement cache (StatementCache)
+        identities      - Optional  : the session identities that are already known, updated in place (Dict)
+        task_name       - Optional  : stored with the cached statement (Str)
+        from_cache      - Optional  : return the cached statement if there is one (Bool)
+    """
+    if identities is None:
+        identities = {}
+
+    if cache is not None and from_cache:
+        statement_status = get_cached_statement( client, cache, identities, session_id, statement_id, data_writer )
+        if statement_status is not None:
+            return 200, statement_status
+
+    path = '/sessions/{}/statements/{}'.format(session_id, statement_id)
+    if data_writer is None:
+        result = client.get( path )
+        statement_status = result.json()
+        if cache is not None and result.status_code == 200:
+            cache_statement( client, cache, identities, session_id, statement_id, statement_status, task_name )
+        return result.status_code, statement_status
+
+    cache_writer = None
+    if cache is not None:
+        cache_writer = data_writer = cache.writer( cache_key( client.owner( 'sessions', session_id ), session_id, statement_id ), data_writer )
+
+    result = client.get( path, stream=True )
+    try:
+        chunks = iter_text( result )
+        statement_status = StreamingJSONParser( chunks, ('output', 'data'), data_writer ).parse()
+
+        # Read the rest of the response, so the connection can be reused
+        for chunk in chunks:
+            pass
+    finally:
+        result.close()
+
+    if cache_writer is not None:
+        if result.status_code == 200:
+            cache_statement( client, cache, identities, session_id, statement_id, statement_status, task_name, cache_writer )
+        else:
+            cache_writer.discard()
+
+    return result.status_code, statement_status
@@ -0,0 +1,184 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import zipfile
+
+from urllib.parse import urlparse
+
+
+# Number of bytes read at once when hashing or copying files
+BLOCK_SIZE = 1024 * 1024
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open( path, 'rb' ) as f:
+        for block in iter( lambda: f.read(BLOCK_SIZE), b'' ):
+            h.update( block )
+    return h.hexdigest()
+
+
+def zip_directory(directory, zip_filename):
+    # Files are added in sorted order with a fixed timestamp, so zipping the
+    # same contents twice results in the same hash
+    with zipfile.ZipFile( zip_filename, 'w', zipfile.ZIP_DEFLATED ) as z:
+        for root, dirs, files in os.walk( directory ):
+            dirs.sort()
+            for filename in sorted( files ):
+                if filename.endswith('.pyc'):
+                    continue
+                path = os.path.join( root, filename )
+                info = zipfile.ZipInfo( os.path.relpath( path, os.path.dirname( os.path.abspath( directory ))), date_time=(1980, 1, 1, 0, 0, 0) )
+                info.external_attr = 0o644 << 16
+                info.compress_type = zipfile.ZIP_DEFLATED
+                with open( path, 'rb' ) as f, z.open( info, 'w' ) as target:
+                    shutil.copyfileobj( f, target, BLOCK_SIZE )
+
+
+class LocalDirectoryStore(object):
+    """
+    Store for uploaded files in a local (or mounted) directory. The paths
+    handed to Livy are the absolute paths of the stored files.
+    @params:
+        directory   - Required  : directory in which the files are stored (Str)
+    """
+    def __init__(self, directory):
+        self.directory = os.path.abspath( directory )
+
+    def exists(self, name):
+        return os.path.exists( os.path.join( self.directory, name ))
+
+    def upload(self, local_path, name):
+        target = os.path.join( self.directory, name )
+        if not os.path.isdir( os.path.dirname( target )):
+            os.makedirs( os.path.dirname( target ))
+
+        # Copy to a temporary file first, so a partial upload is never mistaken
+        # for an existing one
+        shutil.copyfile( local_path, target + '.tmp' )
+        os.replace( target + '.tmp', target )
+
+    def remote_path(self, name):
+        return 'file://' + os.path.join( self.directory, name )
+
+
+class WebHDFSStore(object):
+    """
+    Store for uploaded files on HDFS, accessed through the WebHDFS REST api.
+    The namenode and the datanodes are usually other hosts than Livy, so the
+    store has its own http session that does not send the Livy credentials
+    unless they are passed as auth.
+    @params:
+        url         - Required  : http(s) url of the namenode (or gateway) including the HDFS directory,
+                                  e.g. https://namenode:9871/user/me/livysubmit (Str)
+        auth        - Optional  : auth passed to requests for WebHDFS
+        verify      - Optional  : verify the TLS certificate of WebHDFS (Bool)
+        username    - Optional  : user name passed to WebHDFS when it does not use authentication (Str)
+    """
+    def __init__(self, url, auth=None, verify=False, username=None):
+        import requests
+
+        parsed_url = urlparse( url )
+        self.base_url = '{}://{}/webhdfs/v1'.format( parsed_url.scheme, parsed_url.netloc )
+        self.directory = parsed_url.path.rstrip('/')
+        self.username = username
+
+        self.session = requests.Session()
+        self.session.auth = auth
+        self.session.verify = verify
+
+    def params(self, op, **kwargs):
+        kwargs['op'] = op
+        if self.username is not None:
+            kwargs['user.name'] = self.username
+        return kwargs
+
+    def url(self, name):
+        return '{}{}/{}'.format( self.base_url, self.directory, name )
+
+    def exists(self, name):
+        result = self.session.get( self.url( name ), params=self.params('GETFILESTATUS') )
+        if result.status_code == 404:
+            return False
+        result.raise_for_status()
+        return True
+
+    def upload(self, local_path, name):
+        # Upload to a temporary file first and rename it when it is complete,
+        # so an interrupted upload is never mistaken for an existing one.
+        # WebHDFS redirects the CREATE request to the datanode that receives the data
+        temp_name = '{}.tmp.{}'.format( name, os.getpid() )
+        result = self.session.put( self.url( temp_name ), params=self.params('CREATE', overwrite='true'), allow_redirects=False )
+        result.raise_for_status()
+
+        location = result.headers.get( 'Location', self.url( temp_name ))
+        try:
+            with open( local_path, 'rb' ) as f:
+                result = self.session.put( location, data=f, headers={ 'Content-Type' : 'application/octet-stream' } )
+            result.raise_for_status()
+        except Exception:
+            self.session.delete( self.url( temp_name ), params=self.params('DELETE') )
+            raise
+
+        result = self.session.get( self.url( temp_name ), params=self.params('GETFILESTATUS') )
+        result.raise_for_status()
+        if result.json()['FileStatus']['length'] != os.path.getsize( local_path ):
+            self.session.delete( self.url( temp_name ), params=self.params('DELETE') )
+            raise Exception("Upload of {} to {} is incomplete".format( local_path, self.remote_path( name )))
+
+        # RENAME returns false when the file exists, e.g. because another
+        # process uploaded the same file in the meantime
+        result = self.session.put( self.url( temp_name ), params=self.params('RENAME', destination='{}/{}'.format( self.directory, name )))
+        result.raise_for_status()
+        if not result.json().get('boolean', False):
+            self.session.delete( self.url( temp_name ), params=self.params('DELETE') )
+            if not self.exists( name ):
+                raise Exception("Could not rename the upload of {} to {}".format( local_path, self.remote_path( name )))
+
+    def remote_path(self, name):
+        return 'hdfs://{}/{}'.format( self.directory, name )
+
+
+def make_store(url, auth=None, verify=False, username=None):
+    parsed_url = urlparse( url )
+    if parsed_url.scheme in [ 'http', 'https' ]:
+        return WebHDFSStore( url, auth=auth, verify=verify, username=username )
+    if parsed_url.scheme == 'file':
+        return LocalDirectoryStore( parsed_url.path )
+    if parsed_url.scheme == '':
+        return LocalDirectoryStore( url )
+
+    raise Exception("Unsupported upload store {}, use a http(s) WebHDFS url or a local directory".format( url ))
+
+
+def stage_file(store, path, source=None):
+    # Upload the local file (or zipped directory) at path to the store, unless
+    # a file with the same content was uploaded before, and return its remote
+    # path. Files are stored as <sha256>/<filename>, so they keep their name.
+    if os.path.isdir( path ):
+        temp_directory = tempfile.mkdtemp()
+        try:
+            zip_filename = os.path.join( temp_directory, os.path.basename( os.path.abspath( path )) + '.zip' )
+            zip_directory( path, zip_filename )
+            return stage_file( store, zip_filename, source=path )
+        finally:
+            shutil.rmtree( temp_directory )
+
+    name = '{}/{}'.format( file_hash( path ), os.path.basename( path ))
+    if source is None:
+        source = path
+
+    if store.exists( name ):
+        print("Using previously uploaded {} for {}".format( store.remote_path( name ), source ))
+    else:
+        print("Uploading {} to {}".format( source, store.remote_path( name )))
+        store.upload( path, name )
+
+    return store.remote_path( name )
+
+
+def stage_files(store, paths):
+    # Only local files and directories are uploaded, other paths (e.g. files
+    # that are already on HDFS) are returned unchanged
+    return [ stage_file( store, path ) if os.path.exists( path ) else path for path in paths ]
@@ -0,0 +1,248 @@
+import codecs
+import gzip
+import json
+import re
+
+
+WHITESPACE = ' \t\n\r'
+LITERAL_END = ',]}' + WHITESPACE
+# Body of a JSON string up to the closing quote, the end of the buffer or a
+# backslash at the end of the buffer
+STRING_BODY = re.compile( r'[^"\\]*(?:\\.[^"\\]*)*', re.S )
+
+# Number of bytes read from the response at once
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_text(response, chunk_size=CHUNK_SIZE):
+    # Decode the body of a streamed response piece by piece
+    decoder = codecs.getincrementaldecoder( 'utf-8' )()
+    for chunk in response.iter_content( chunk_size=chunk_size ):
+        text = decoder.decode( chunk )
+        if text != '':
+            yield text
+
+    text = decoder.decode( b'', final=True )
+    if text != '':
+        yield text
+
+
+def safe_cut(buffer, start, end):
+    # Position before which buffer[start:end] can be decoded without cutting
+    # an escape sequence (at most \\uXXXX) in half
+    i = buffer.find( '\\', max( start, end - 12 ), end )
+    if i == -1:
+        return end
+
+    while i > start and buffer[i - 1] == '\\':
+        i -= 1
+    return i
+
+
+def join_surrogates(text):
+    # Combine a surrogate pair that was decoded in two separate pieces
+    return text[:2].encode( 'utf-16', 'surrogatepass' ).decode( 'utf-16' ) + text[2:]
+
+
+class StreamingJSONParser(object):
+    """
+    Parses a JSON document that arrives in chunks without keeping the whole
+    document in memory. String values of the object at stream_path are not
+    stored but passed in fragments to write(key, fragment), followed by
+    write(key, None) at the end of every value; in the parsed result these
+    values are None. All other values are parsed as usual.
+    @params:
+        chunks          - Required  : iterable with the text of the document (Iterable of Str)
+        stream_path     - Required  : keys of the object whose values are streamed (Tuple)
+        write           - Required  : function called with the streamed fragments (Function)
+    """
+    def __init__(self, chunks, stream_path, write):
+        self.chunks = iter( chunks )
+        self.stream_path = tuple( stream_path )
+        self.write = write
+
+        self.buffer = ''
+        self.pos = 0
+
+    def fill(self):
+        for chunk in self.chunks:
+            if chunk != '':
+                self.buffer = self.buffer[self.pos:] + chunk
+                self.pos = 0
+                return True
+        return False
+
+    def ensure(self, n):
+        while len(self.buffer) - self.pos < n:
+            if not self.fill():
+                raise ValueError( 'Unexpected end of JSON document' )
+
+    def peek(self):
+        self.ensure( 1 )
+        return self.buffer[self.pos]
+
+    def skip_whitespace(self):
+        while self.peek() in WHITESPACE:
+            self.pos += 1
+
+    def expect(self, c):
+        self.skip_whitespace()
+        if self.peek() != c:
+            raise ValueError( 'Expected {!r} at position {} of JSON chunk'.format( c, self.pos ))
+        self.pos += 1
+
+    def parse(self):
+        return self.parse_value( () )
+
+    def parse_value(self, path):
+        self.skip_whitespace()
+        c = self.peek()
+
+        if c == '{':
+            return self.parse_object( path )
+        if c == '[':
+            return self.parse_array( path )
+        if c == '"':
+            if len(path) == len(self.stream_path) + 1 and path[:-1] == self.stream_path:
+                key = path[-1]
+                self.parse_string( lambda fragment: self.write( key, fragment ))
+                self.write( key, None )
+                return None
+            return self.parse_string()
+
+        return self.parse_literal()
+
+    def parse_object(self, path):
+        self.pos += 1
+        result = {}
+
+        self.skip_whitespace()
+        if self.peek() == '}':
+            self.pos += 1
+            return result
+
+        while True:
+            self.skip_whitespace()
+            if self.peek() != '"':
+                raise ValueError( 'Expected object key at position {} of JSON chunk'.format( self.pos ))
+            key = self.parse_string()
+            self.expect( ':' )
+            result[key] = self.parse_value( path + ( key, ))
+
+            self.skip_whitespace()
+            c = self.peek()
+            self.pos += 1
+            if c == '}':
+                return result
+            if c != ',':
+                raise ValueError( 'Expected , or }} at position {} of JSON chunk'.format( self.pos - 1 ))
+
+    def parse_array(self, path):
+        self.pos += 1
+        result = []
+
+        self.skip_whitespace()
+        if self.peek() == ']':
+            self.pos += 1
+            return result
+
+        while True:
+            result.append( self.parse_value( path + ( len(result), )))
+
+            self.skip_whitespace()
+            c = self.peek()
+            self.pos += 1
+            if c == ']':
+                return result
+            if c != ',':
+                raise ValueError( 'Expected , or ] at position {} of JSON chunk'.format( self.pos - 1 ))
+
+    def parse_literal(self):
+        # Numbers, true, false and null
+        literal = ''
+        while True:
+            if self.pos >= len(self.buffer) and not self.fill():
+                break
+            c = self.buffer[self.pos]
+            if c in LITERAL_END:
+                break
+            literal += c
+            self.pos += 1
+
+        return json.loads( literal )
+
+    def parse_string(self, write=None):
+        # Returns the string, or passes it in fragments to write and returns None.
+        # Every piece of the string that is available in the buffer is decoded
+        # at once by the json module
+        self.pos += 1
+        parts = []
+        emit = parts.append if write is None else write
+        pending = ''
+
+        while True:
+            self.ensure( 1 )
+            end = STRING_BODY.match( self.buffer, self.pos ).end()
+            closed = end < len(self.buffer) and self.buffer[end] == '"'
+            if not closed:
+                end = safe_cut( self.buffer, self.pos, end )
+
+            if end > self.pos:
+                text = pending + json.loads( '"' + self.buffer[self.pos:end] + '"' )
+                self.pos = end
+
+                if pending != '' and len(text) > 1 and '\udc00' <= text[1] <= '\udfff':
+                    text = join_surrogates( text )
+                pending = ''
+
+                # The second half of a surrogate pair can be in the next piece
+                if not closed and text != '' and '\ud800' <= text[-1] <= '\udbff':
+                    pending = text[-1]
+                    text = text[:-1]
+
+                if text != '':
+                    emit( text )
+
+            if closed:
+                self.pos += 1
+                if pending != '':
+                    emit( pending )
+                return ''.join( parts ) if write is None else None
+
+            if not self.fill():
+                raise ValueError( 'Unexpected end of JSON document' )
+
+
+class OutputWriter(object):
+    """
+    Writes the output data of a statement to a file as it is being parsed,
+    every data entry followed by a newline. The file is only opened when the
+    first data arrives, so it can be passed along while the statement is
+    still running.
+    @params:
+        filename    - Required  : file to write the output to (Str)
+        compress    - Optional  : gzip the written output (Bool)
+    """
+    def __init__(self, filename, compress=False):
+        self.filename = filename
+        self.compress = compress
+        self.f = None
+
+    def open(self):
+        if self.f is None:
+            if self.compress:
+                self.f = gzip.open( self.filename, 'wt', encoding='utf-8' )
+            else:
+                self.f = open( self.filename, 'w' )
+
+    def __call__(self, key, fragment):
+        self.open()
+        if fragment is None:
+            self.f.write( '\n' )
+        else:
+            self.f.write( fragment )
+
+    def close(self):
+        # Also creates the file if there was no data at all
+        self.open()
+        self.f.close()
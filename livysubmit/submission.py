@@ -0,0 +1,33 @@
+import json
+import os
+import time
+
+from .locking import replace_file
+
+
+DEFAULT_STATE_DIRECTORY = os.path.join( os.path.expanduser('~'), '.livysubmit', 'submissions' )
+
+
+def default_state_file(session_id, statement_id):
+    return os.path.join( DEFAULT_STATE_DIRECTORY, '{}-{}-{}.json'.format( time.strftime('%Y%m%d-%H%M%S'), session_id, statement_id ))
+
+
+def save_state(filename, state):
+    # The file is replaced at once, so it is never left half written when
+    # livy_submit is killed
+    directory = os.path.dirname( filename )
+    if directory != '' and not os.path.isdir( directory ):
+        os.makedirs( directory, mode=0o700 )
+
+    state['updated'] = time.time()
+    replace_file( filename, lambda f: json.dump( state, f, indent=2 ))
+
+
+def load_state(filename):
+    with open( filename, 'r' ) as f:
+        return json.load( f )
+
+
+def remove_state(filename):
+    if os.path.exists( filename ):
+        os.remove( filename )
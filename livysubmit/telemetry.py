@@ -0,0 +1,198 @@
+import json
+import threading
+import time
+
+from urllib.parse import urlsplit
+
+
+def spark_api_url(spark_ui_url, app_id, path):
+    return '{}/api/v1/applications/{}{}'.format( spark_ui_url.rstrip('/'), app_id, path )
+
+
+def format_bytes(value):
+    for unit in [ 'B', 'KB', 'MB', 'GB', 'TB' ]:
+        if abs(value) < 1024 or unit == 'TB':
+            return '{:.1f} {}'.format( value, unit ) if unit != 'B' else '{} B'.format( int(value) )
+        value /= 1024.0
+
+
+class TelemetrySampler(object):
+    """
+    Samples the REST API of the Spark UI of a session in a background thread:
+    the number of executors, their cores and memory, tasks, shuffle bytes and
+    active stages. Every sample is appended to filename as a json line while
+    the statement runs, and the stages are summarised when sampling stops.
+    The Spark UI is usually reached through the YARN proxy, on another host
+    than Livy, so the sampler has its own http session that does not send the
+    Livy credentials unless they are passed as auth.
+    @params:
+        spark_ui_url    - Required  : sparkUiUrl from the appInfo of the session (Str)
+        app_id          - Required  : appId of the session (Str)
+        interval        - Optional  : seconds between two samples (Float)
+        timeout         - Optional  : timeout in seconds of a request to the Spark UI (Float)
+        filename        - Optional  : file to append the samples to (Str)
+        auth            - Optional  : auth passed to requests for the Spark UI
+        verify          - Optional  : verify the TLS certificate of the Spark UI (Bool)
+        rate_limiter    - Optional  : limits the number of requests per second, see ratelimit.RateLimiter (RateLimiter)
+        tracer          - Optional  : records every request, see tracing.Tracer (Tracer)
+    """
+    def __init__(self, spark_ui_url, app_id, interval=10, timeout=10, filename=None, auth=None, verify=False, rate_limiter=None, tracer=None):
+        import requests
+
+        self.spark_ui_url = spark_ui_url
+        self.app_id = app_id
+        self.interval = interval
+        self.timeout = timeout
+        self.filename = filename
+        self.rate_limiter = rate_limiter
+        self.tracer = tracer
+
+        self.http_session = requests.Session()
+        self.http_session.auth = auth
+        self.http_session.verify = verify
+
+        self.samples = []
+        self.stages = None
+        self.errors = 0
+        self.started = None
+        self.stopped = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def get(self, path, params=None):
+        url = spark_api_url( self.spark_ui_url, self.app_id, path )
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire( url )
+
+        start = time.time()
+        try:
+            response = self.http_session.get( url, params=params, timeout=self.timeout )
+        except Exception:
+            if self.tracer is not None:
+                self.tracer.record_request( 'GET', urlsplit( url ).path, None, time.time() - start, 0, None )
+            raise
+
+        if self.tracer is not None:
+            self.tracer.record_request( 'GET', urlsplit( url ).path, response.status_code, time.time() - start, 0, len( response.content ))
+        response.raise_for_status()
+        return response.json()
+
+    def sample(self):
+        # allexecutors also holds the executors that were removed by dynamic
+        # allocation, so the task and shuffle totals never go down
+        executors = [ e for e in self.get('/allexecutors') if e['id'] != 'driver' ]
+        active = [ e for e in executors if e.get('isActive', True) ]
+        active_stages = self.get( '/stages', params={ 'status' : 'active' } )
+
+        return {
+            'time' : round( time.time(), 3 )
+            , 'executors' : len(active)
+            , 'cores' : sum( e.get( 'totalCores', 0 ) for e in active )
+            , 'memory_used' : sum( e.get( 'memoryUsed', 0 ) for e in active )
+            , 'memory_max' : sum( e.get( 'maxMemory', 0 ) for e in active )
+            , 'jvm_heap_peak' : max( [ ( e.get('peakMemoryMetrics') or {} ).get( 'JVMHeapMemory', 0 ) for e in executors ] + [0] )
+            , 'active_tasks' : sum( e.get( 'activeTasks', 0 ) for e in active )
+            , 'completed_tasks' : sum( e.get( 'completedTasks', 0 ) for e in executors )
+            , 'failed_tasks' : sum( e.get( 'failedTasks', 0 ) for e in executors )
+            , 'shuffle_read' : sum( e.get( 'totalShuffleRead', 0 ) for e in executors )
+            , 'shuffle_write' : sum( e.get( 'totalShuffleWrite', 0 ) for e in executors )
+            , 'active_stages' : len(active_stages)
+        }
+
+    def take_sample(self, output):
+        # Telemetry is best effort, it must never make the submission fail
+        try:
+            sample = self.sample()
+        except Exception:
+            self.errors += 1
+            return
+
+        self.samples.append( sample )
+        if output is not None:
+            output.write( json.dumps( sample ) + '\n' )
+            output.flush()
+
+    def run(self):
+        output = open( self.filename, 'a' ) if self.filename is not None else None
+        try:
+            while True:
+                self.take_sample( output )
+                if self.stop_event.wait( self.interval ):
+                    break
+            self.take_sample( output )
+        finally:
+            if output is not None:
+                output.close()
+
+    def start(self):
+        self.started = time.time()
+        self.thread = threading.Thread( target=self.run )
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+        self.stopped = time.time()
+
+        try:
+            self.stages = self.get('/stages')
+        except Exception:
+            self.errors += 1
+        self.http_session.close()
+
+    def summary(self):
+        samples = self.samples
+        summary = {
+            'duration' : ( self.stopped or time.time() ) - self.started
+            , 'samples' : len(samples)
+            , 'errors' : self.errors
+        }
+        if len(samples) > 0:
+            last = samples[-1]
+            summary.update({
+                'executors_max' : max( s['executors'] for s in samples )
+                , 'executors_avg' : sum( s['executors'] for s in samples ) / float( len(samples) )
+                , 'cores_max' : max( s['cores'] for s in samples )
+                , 'memory_used_max' : max( s['memory_used'] for s in samples )
+                , 'memory_max' : max( s['memory_max'] for s in samples )
+                , 'jvm_heap_peak' : max( s['jvm_heap_peak'] for s in samples )
+                , 'completed_tasks' : last['completed_tasks']
+                , 'failed_tasks' : last['failed_tasks']
+                , 'shuffle_read' : last['shuffle_read']
+                , 'shuffle_write' : last['shuffle_write']
+            })
+        if self.stages is not None:
+            summary.update({
+                'stages' : len(self.stages)
+                , 'input_bytes' : sum( s.get( 'inputBytes', 0 ) for s in self.stages )
+                , 'memory_spilled' : sum( s.get( 'memoryBytesSpilled', 0 ) for s in self.stages )
+                , 'disk_spilled' : sum( s.get( 'diskBytesSpilled', 0 ) for s in self.stages )
+            })
+        return summary
+
+
+def print_telemetry_summary(sampler):
+    summary = sampler.summary()
+
+    print()
+    print("Spark telemetry ({} samples in {:.1f}s{}):".format( summary['samples'], summary['duration']
+                                                               , '' if summary['errors'] == 0 else ', {} failed requests'.format( summary['errors'] )))
+    if summary['samples'] == 0:
+        print("    No samples could be taken from the Spark UI at {}".format( sampler.spark_ui_url ))
+        return
+
+    print("    Executors        : {} at most, {:.1f} on average, {} cores at most".format( summary['executors_max'], summary['executors_avg'], summary['cores_max'] ))
+    if summary['memory_max'] > 0:
+        print("    Storage memory   : {} of {} used at most ({:.0f}%)".format( format_bytes( summary['memory_used_max'] ), format_bytes( summary['memory_max'] )
+                                                                          , 100.0 * summary['memory_used_max'] / summary['memory_max'] ))
+    if summary['jvm_heap_peak'] > 0:
+        print("    Peak JVM heap    : {} in a single executor".format( format_bytes( summary['jvm_heap_peak'] )))
+    print("    Tasks            : {} completed, {} failed".format( summary['completed_tasks'], summary['failed_tasks'] ))
+    print("    Shuffle          : {} read, {} written".format( format_bytes( summary['shuffle_read'] ), format_bytes( summary['shuffle_write'] )))
+    if 'stages' in summary:
+        print("    Stages           : {}, {} input, {} spilled from memory, {} spilled to disk".format( summary['stages'], format_bytes( summary['input_bytes'] )
+                                                                                                    , format_bytes( summary['memory_spilled'] ), format_bytes( summary['disk_spilled'] )))
+    if sampler.filename is not None:
+        print("    Samples written to {}".format( sampler.filename ))
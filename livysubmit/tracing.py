@@ -0,0 +1,180 @@
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+from .locking import locked_file, replace_file
+
+
+# name{labels} value
+PROMETHEUS_SAMPLE = re.compile( r'^([a-zA-Z_:][a-zA-Z0-9_:]*)\{(.*)\} (\S+)$' )
+
+
+def url_template(path):
+    # /sessions/12/statements/3?from=0 -> /sessions/{id}/statements/{id}
+    return re.sub( r'/\d+', '/{id}', path.split('?')[0] )
+
+
+class Tracer(object):
+    """
+    Records every request sent to Livy and the moments at which sessions and
+    statements change state, and writes them to a trace file when the command
+    is finished.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.requests = []
+        self.phases = []
+
+    def record_request(self, method, path, status, latency, request_bytes, response_bytes):
+        with self.lock:
+            self.requests.append({
+                'type' : 'request'
+                , 'time' : time.time()
+                , 'method' : method
+                , 'url' : url_template( path )
+                , 'status' : status
+                , 'latency' : latency
+                , 'request_bytes' : request_bytes
+                , 'response_bytes' : response_bytes
+            })
+
+    def record_phase(self, phase, session_id, statement_id=None):
+        with self.lock:
+            self.phases.append({
+                'type' : 'phase'
+                , 'time' : time.time()
+                , 'phase' : phase
+                , 'session_id' : session_id
+                , 'statement_id' : statement_id
+            })
+
+    def spans(self):
+        # Time between two consecutive phases of the same session, e.g.
+        # create -> starting -> idle -> submitted -> waiting -> running -> available -> deleted
+        phases_per_session = {}
+        for phase in self.phases:
+            phases_per_session.setdefault( phase['session_id'], [] ).append( phase )
+
+        spans = []
+        for session_id, phases in phases_per_session.items():
+            phases = sorted( phases, key=lambda p: p['time'] )
+            for previous, current in zip( phases, phases[1:] ):
+                spans.append({
+                    'type' : 'span'
+                    , 'from' : previous['phase']
+                    , 'to' : current['phase']
+                    , 'session_id' : session_id
+                    , 'statement_id' : current['statement_id'] if current['statement_id'] is not None else previous['statement_id']
+                    , 'start' : previous['time']
+                    , 'duration' : current['time'] - previous['time']
+                })
+        return spans
+
+    def summary(self, command):
+        return {
+            'type' : 'summary'
+            , 'command' : command
+            , 'start' : self.start
+            , 'wall_time' : time.time() - self.start
+            , 'requests' : len( self.requests )
+            , 'request_bytes' : sum( r['request_bytes'] or 0 for r in self.requests )
+            , 'response_bytes' : sum( r['response_bytes'] or 0 for r in self.requests )
+        }
+
+    def write_jsonl(self, f, command):
+        with self.lock:
+            for event in sorted( self.requests + self.phases, key=lambda e: e['time'] ):
+                f.write( json.dumps( event ) + '\n' )
+            for span in self.spans():
+                f.write( json.dumps( span ) + '\n' )
+            f.write( json.dumps( self.summary( command )) + '\n' )
+
+    def prometheus_metrics(self, command):
+        # Returns a list of (name, type, help, { labels : value }) with the
+        # totals of this command
+        def labels(**kwargs):
+            return ','.join( '{}="{}"'.format( key, str(value).replace('\\', '\\\\').replace('"', '\\"') ) for key, value in sorted( kwargs.items() ))
+
+        with self.lock:
+            requests = {}
+            for r in self.requests:
+                key = labels( command=command, method=r['method'], url=r['url'], status=r['status'] )
+                count, latency, request_bytes, response_bytes = requests.get( key, (0, 0.0, 0, 0) )
+                requests[key] = ( count + 1, latency + r['latency'], request_bytes + (r['request_bytes'] or 0), response_bytes + (r['response_bytes'] or 0) )
+
+            spans = {}
+            for span in self.spans():
+                key = labels( command=command, **{ 'from' : span['from'], 'to' : span['to'] } )
+                count, duration = spans.get( key, (0, 0.0) )
+                spans[key] = ( count + 1, duration + span['duration'] )
+
+            summary = self.summary( command )
+
+        return [
+            ( 'livysubmit_requests_total', 'counter', 'Number of requests sent to Livy'
+              , { key : values[0] for key, values in requests.items() } )
+            , ( 'livysubmit_request_duration_seconds_total', 'counter', 'Time spent waiting for responses of Livy'
+              , { key : values[1] for key, values in requests.items() } )
+            , ( 'livysubmit_request_bytes_total', 'counter', 'Number of bytes sent to Livy'
+              , { key : values[2] for key, values in requests.items() } )
+            , ( 'livysubmit_response_bytes_total', 'counter', 'Number of bytes received from Livy'
+              , { key : values[3] for key, values in requests.items() } )
+            , ( 'livysubmit_phase_duration_seconds_total', 'counter', 'Time spent between two phases of a session'
+              , { key : values[1] for key, values in spans.items() } )
+            , ( 'livysubmit_phase_transitions_total', 'counter', 'Number of times a session went from one phase to the next'
+              , { key : values[0] for key, values in spans.items() } )
+            , ( 'livysubmit_commands_total', 'counter', 'Number of livy_submit commands'
+              , { labels( command=command ) : 1 } )
+            , ( 'livysubmit_command_duration_seconds_total', 'counter', 'Wall time of the livy_submit commands'
+              , { labels( command=command ) : summary['wall_time'] } )
+        ]
+
+    def write_prometheus(self, filename, command):
+        # The counters of earlier commands in the file are added to, so one
+        # textfile (e.g. for the textfile collector of the node exporter) holds
+        # the totals of all commands. The file is replaced at once, so the
+        # collector never reads a half written file.
+        with locked_file( filename ):
+            previous = {}
+            if os.path.exists( filename ):
+                with open( filename, 'r' ) as f:
+                    for line in f:
+                        match = PROMETHEUS_SAMPLE.match( line )
+                        if match is not None:
+                            previous[ (match.group(1), match.group(2)) ] = float( match.group(3) )
+
+            metrics = self.prometheus_metrics( command )
+            names = set( name for name, _, _, _ in metrics )
+
+            def write_metrics(f):
+                for name, metric_type, description, samples in metrics:
+                    for (previous_name, key), value in previous.items():
+                        if previous_name == name:
+                            samples[key] = samples.get( key, 0 ) + value
+
+                    f.write( '# HELP {} {}\n'.format( name, description ))
+                    f.write( '# TYPE {} {}\n'.format( name, metric_type ))
+                    for key, value in sorted( samples.items() ):
+                        f.write( '{}{{{}}} {}\n'.format( name, key, float(value) ))
+
+                # Keep metrics of other commands that this command did not produce
+                for (name, key), value in sorted( previous.items() ):
+                    if name not in names:
+                        f.write( '{}{{{}}} {}\n'.format( name, key, float(value) ))
+
+            replace_file( filename, write_metrics )
+
+    def write(self, filename, trace_format, command):
+        # Json lines are appended, so the traces of many commands can be
+        # collected in one file
+        if trace_format == 'prometheus':
+            self.write_prometheus( filename, command )
+        elif filename == '-':
+            self.write_jsonl( sys.stderr, command )
+        else:
+            with open( filename, 'a' ) as f:
+                self.write_jsonl( f, command )
@@ -0,0 +1,71 @@
+import pytest
+
+from livysubmit.config import get_profile
+from livysubmit.livysubmit import apply_profile, make_parser
+
+
+CONFIG = '''
+default_profile = "small"
+
+[profiles.base]
+driver-memory = "8g"
+num_executors = 4
+conf = { "spark.sql.shuffle.partitions" = "200" }
+
+[profiles.small]
+extends = "base"
+driver_memory = "2g"
+
+[profiles.typo]
+driver_memroy = "2g"
+
+[profiles.loop1]
+extends = "loop2"
+
+[profiles.loop2]
+extends = "loop1"
+'''
+
+
+@pytest.fixture
+def config_file(tmp_path, monkeypatch):
+    monkeypatch.setenv( 'LIVY_SUBMIT_URL', 'http://livy:8998' )
+    monkeypatch.delenv( 'LIVY_SUBMIT_PROFILE', raising=False )
+    config_file = tmp_path / 'livysubmit.toml'
+    config_file.write_text( CONFIG )
+    return str(config_file)
+
+
+def test_profile_extends():
+    config = { 'profiles' : { 'base' : { 'driver-memory' : '8g', 'exe_env' : [ 'A=1' ] }
+                              , 'small' : { 'extends' : 'base', 'driver_memory' : '2g' } } }
+
+    assert get_profile( config, 'small' ) == { 'driver_memory' : '2g', 'spark_executor_var' : [ 'A=1' ] }
+
+
+@pytest.mark.parametrize( 'name, message', [ ( 'missing', 'not defined' ), ( 'loop1', 'loop1 -> loop2 -> loop1' ) ] )
+def test_unknown_and_cyclic_profiles(name, message):
+    config = { 'profiles' : { 'loop1' : { 'extends' : 'loop2' }, 'loop2' : { 'extends' : 'loop1' } } }
+
+    with pytest.raises( ValueError, match=message ):
+        get_profile( config, name )
+
+
+def test_profile_sets_defaults(config_file):
+    parser = make_parser()
+    apply_profile( parser, [ '--config', config_file ] )
+    args = parser.parse_args([ '--config', config_file, '--driver-memory', '4g', '-l' ])
+
+    # The command line wins over the profile, which wins over the profile it extends
+    assert args.driver_memory == '4g'
+    assert args.num_executors == 4
+    assert args.profile_conf == { 'spark.sql.shuffle.partitions' : '200' }
+
+
+@pytest.mark.parametrize( 'profile, message', [ ( 'typo', 'unknown setting driver_memroy' ), ( 'missing', 'not defined' ), ( 'loop2', 'extends itself' ) ] )
+def test_bad_profiles_exit_with_usage_error(config_file, profile, message, capsys):
+    with pytest.raises( SystemExit ) as e:
+        apply_profile( make_parser(), [ '--config', config_file, '--profile', profile ] )
+
+    assert e.value.code == 2
+    assert message in capsys.readouterr().err
@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+from livysubmit import ratelimit
+from livysubmit.ratelimit import RateLimiter
+
+
+@pytest.fixture
+def processes(monkeypatch):
+    # Every reservation is made as the process whose id is in pid[0]
+    pid = [ 1 ]
+    monkeypatch.setattr( os, 'getpid', lambda: pid[0] )
+    monkeypatch.setattr( ratelimit, 'pid_alive', lambda p: True )
+    return pid
+
+
+def simulate(limiter, processes, threads, duration):
+    # Every thread is a (process id, time of its next request) and reserves
+    # its next request when its previous slot has come. Returns the slots per
+    # process id
+    threads = [ list(thread) for thread in threads ]
+    slots = {}
+    while True:
+        thread = min( threads, key=lambda t: t[1] )
+        processes[0] = thread[0]
+        slot = limiter.reserve( 'livy', thread[1] )
+        if slot >= duration:
+            return slots
+        slots.setdefault( thread[0], [] ).append( slot )
+        thread[1] = slot
+
+
+def test_burst_after_quiet_period(processes, tmp_path):
+    limiter = RateLimiter( 10, burst=3, filename=str( tmp_path / 'ratelimit.json' ))
+
+    slots = [ limiter.reserve( 'livy', 100.0 ) for i in range(5) ]
+
+    assert slots == pytest.approx([ 100.0, 100.0, 100.0, 100.1, 100.2 ])
+
+
+def test_fair_share(processes, tmp_path):
+    limiter = RateLimiter( 10, burst=1, filename=str( tmp_path / 'ratelimit.json' ))
+
+    # Process 1 sends with 8 threads (like --cleanup), process 2 polls
+    slots = simulate( limiter, processes, [ ( 1, 0.0 ) ] * 8 + [ ( 2, 0.0 ) ], 10.0 )
+
+    assert len( slots[2] ) > 0.4 * ( len( slots[1] ) + len( slots[2] ))
+    # Together they keep to the rate
+    assert limiter.conforms( 0.0, sorted( slots[1] + slots[2] ))
+    assert len( slots[1] ) + len( slots[2] ) <= 101
+
+
+def test_hosts_are_limited_separately(processes, tmp_path):
+    limiter = RateLimiter( 1, burst=1, filename=str( tmp_path / 'ratelimit.json' ))
+
+    assert limiter.reserve( 'livy1', 50.0 ) == 50.0
+    assert limiter.reserve( 'livy2', 50.0 ) == 50.0
+    assert limiter.reserve( 'livy1', 50.0 ) == pytest.approx( 51.0 )
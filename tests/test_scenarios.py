@@ -0,0 +1,260 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from livysubmit import benchmark
+from livysubmit.mockserver import MockLivyServer
+
+
+ROOT = os.path.dirname( os.path.dirname( os.path.abspath( __file__ )))
+
+# Requests of the benchmark scenarios against a mock server that starts its
+# sessions and executes its statements at once, so nothing depends on timing
+EXPECTED_REQUESTS = {
+    'list-sessions' : { 'GET /sessions' : 3 }
+    , 'information' : { 'GET /sessions/{id}' : 1, 'GET /sessions/{id}/statements' : 1 }
+    , 'delete' : { 'DELETE /sessions/{id}' : 1 }
+    , 'task-status' : { 'GET /sessions/{id}/statements/{id}' : 1, 'GET /sessions/{id}' : 1 }
+    , 'retrieve-output' : { 'GET /sessions/{id}' : 1, 'GET /sessions/{id}/statements/{id}' : 1 }
+    , 'submit' : { 'POST /sessions' : 1, 'GET /sessions/{id}/state' : 1, 'POST /sessions/{id}/statements' : 1
+                   , 'GET /sessions/{id}/statements/{id}' : 1, 'GET /sessions/{id}' : 1, 'DELETE /sessions/{id}' : 1 }
+}
+
+
+@pytest.fixture(autouse=True)
+def home(tmp_path, monkeypatch):
+    # The statement cache, session registry and state files of livy_submit
+    # end up in a new home directory for every test
+    monkeypatch.setenv( 'HOME', str(tmp_path) )
+    monkeypatch.setenv( 'USER', 'tester' )
+    monkeypatch.setenv( 'PYTHONPATH', ROOT )
+    monkeypatch.delenv( 'LIVY_SUBMIT_PROFILE', raising=False )
+    return tmp_path
+
+
+@pytest.fixture
+def server():
+    with MockLivyServer( startup_time=0, statement_time=0, output_size=1000 ) as server:
+        yield server
+
+
+def livy_submit(server, *arguments, url=None):
+    # url is the comma separated list of Livy servers, server.url by default
+    env = dict( os.environ, LIVY_SUBMIT_URL=url or server.url )
+    return subprocess.run( [ sys.executable, '-m', 'livysubmit', '-u', 'tester', '-p', 'tester'
+                             , '--poll-min-interval', '0.1', '--poll-max-interval', '0.2', '--progress-mode', 'plain' ] + list(arguments)
+                           , env=env, capture_output=True, text=True, timeout=60 )
+
+
+def write_script(directory, name, code):
+    script = os.path.join( str(directory), name )
+    with open( script, 'w' ) as f:
+        f.write( code )
+    return script
+
+
+@pytest.mark.skipif( os.name != 'posix', reason='the benchmark measures the command with os.fork' )
+@pytest.mark.parametrize( 'name', list( benchmark.SCENARIOS.keys() ))
+def test_benchmark_scenario(name, tmp_path):
+    options = benchmark.make_parser().parse_args([ '--sessions', '250', '--startup-time', '0', '--statement-time', '0', '--output-size', '1000'
+                                                   , '--poll-min-interval', '0.1', '--poll-max-interval', '0.2' ])
+    result = benchmark.run_scenario( name, options, str(tmp_path) )
+
+    assert result['returncode'] == 0, result['stderr']
+    assert result['requests_per_url'] == EXPECTED_REQUESTS[name]
+
+
+def test_submit_writes_output(server, tmp_path):
+    script = write_script( tmp_path, 'job.py', 'print(1)\n' )
+    output_file = os.path.join( str(tmp_path), 'output.txt' )
+
+    result = livy_submit( server, '-s', script, '-o', output_file )
+
+    assert result.returncode == 0, result.stderr
+    with open( output_file, 'r' ) as f:
+        assert len( f.read() ) > 0
+    assert len( server.sessions ) == 0
+
+
+def test_retrieve_output_from_cache(server, tmp_path):
+    session_id = server.add_session({ 'name' : 'LivySubmit - cache', 'proxyUser' : 'tester', 'kind' : 'pyspark' })
+    statement_id = server.add_statement( session_id, 'print(1)', completed=True )
+
+    outputs = []
+    for i in range(2):
+        server.reset_stats()
+        outputs.append( os.path.join( str(tmp_path), 'output{}.txt'.format(i) ))
+        result = livy_submit( server, '-r', str(session_id), str(statement_id), '-o', outputs[-1] )
+        assert result.returncode == 0, result.stderr
+
+    # Only the identity of the session is asked the second time
+    assert server.requests == { 'GET /sessions/{id}' : 1 }
+    with open( outputs[0], 'r' ) as f0, open( outputs[1], 'r' ) as f1:
+        assert f0.read() == f1.read()
+
+
+def test_cache_ignores_statements_of_old_session(server, tmp_path):
+    session_id = server.add_session({ 'name' : 'LivySubmit - old', 'proxyUser' : 'tester', 'kind' : 'pyspark' })
+    statement_id = server.add_statement( session_id, 'print("old")', completed=True )
+    # A different appId than the session that replaces it
+    server.sessions[session_id].created -= 3600
+    assert livy_submit( server, '-r', str(session_id), str(statement_id) ).returncode == 0
+
+    # Livy numbers its sessions from 0 again after a restart
+    del server.sessions[session_id]
+    server.next_session_id = session_id
+    server.add_session({ 'name' : 'LivySubmit - new', 'proxyUser' : 'other', 'kind' : 'pyspark' })
+    server.add_statement( session_id, 'print("new")', completed=True )
+
+    result = livy_submit( server, '-q', str(session_id), str(statement_id) )
+
+    assert result.returncode == 0, result.stderr
+    assert 'print("new")' in result.stdout
+    assert 'print("old")' not in result.stdout
+
+
+def test_reuse_session(server, tmp_path):
+    script = write_script( tmp_path, 'job.py', 'print(1)\n' )
+
+    assert livy_submit( server, '-s', script, '--reuse-session' ).returncode == 0
+    server.reset_stats()
+    result = livy_submit( server, '-s', script, '--reuse-session' )
+
+    assert result.returncode == 0, result.stderr
+    assert 'POST /sessions' not in server.requests
+    assert len( server.sessions ) == 1
+
+    server.reset_stats()
+    result = livy_submit( server, '--reap-sessions', '--session-ttl', '0' )
+
+    assert result.returncode == 0, result.stderr
+    assert server.requests == { 'DELETE /sessions/{id}' : 1 }
+    assert len( server.sessions ) == 0
+
+
+def test_watch_events(server):
+    session_id = server.add_session({ 'name' : 'LivySubmit - watch', 'proxyUser' : 'tester', 'kind' : 'pyspark' })
+    statement_id = server.add_statement( session_id, 'print(1)', completed=True )
+
+    result = livy_submit( server, '--watch', str(session_id), str(statement_id), '0', '99', '--progress-mode', 'events' )
+
+    assert result.returncode == 0, result.stderr
+    events = [ json.loads( line ) for line in result.stdout.splitlines() ]
+    done = { ( e['session_id'], e['statement_id'] ) : e['state'] for e in events if e['event'] == 'statement_done' }
+    assert done == { ( session_id, statement_id ) : 'available', ( 0, 99 ) : 'not found' }
+
+
+def test_information_of_missing_session(server):
+    result = livy_submit( server, '-i', '42' )
+
+    assert result.returncode == 0, result.stderr
+    assert 'does not exist' in result.stdout
+    assert server.requests == { 'GET /sessions/{id}' : 1 }
+
+
+def test_cleanup_needs_a_filter(server):
+    server.add_session({ 'name' : 'LivySubmit - a', 'proxyUser' : 'tester', 'kind' : 'pyspark' })
+
+    result = livy_submit( server, '--cleanup' )
+
+    assert result.returncode == 1
+    assert 'needs at least one of' in result.stdout
+    assert server.requests == {}
+    assert len( server.sessions ) == 1
+
+
+def test_cleanup_dry_run(server):
+    for user in [ 'tester', 'other', 'other' ]:
+        server.add_session({ 'name' : 'LivySubmit - ' + user, 'proxyUser' : user, 'kind' : 'pyspark' })
+
+    result = livy_submit( server, '--cleanup', '--filter-user', 'other', '--dry-run' )
+
+    assert result.returncode == 0, result.stderr
+    assert 'Would delete 2 of 2 matching sessions' in result.stdout
+    assert 'DELETE /sessions/{id}' not in server.requests
+    assert len( server.sessions ) == 3
+
+    server.reset_stats()
+    result = livy_submit( server, '--cleanup', '--filter-user', 'other' )
+
+    assert result.returncode == 0, result.stderr
+    assert server.requests['DELETE /sessions/{id}'] == 2
+    assert [ s.data['proxyUser'] for s in server.sessions.values() ] == [ 'tester' ]
+
+
+def test_pipeline_stops_at_failed_script(tmp_path):
+    scripts = [ write_script( tmp_path, name, code ) for name, code in [ ( 'a.py', 'print(1)\n' ), ( 'b.py', 'raise Exception()\n' )
+                                                                            , ( 'c.py', 'print(3)\n' ), ( 'd.py', 'print(4)\n' ) ] ]
+
+    # The statements take a while, so c.py is still waiting when b.py fails
+    with MockLivyServer( startup_time=0, statement_time=0.5, output_size=1000 ) as server:
+        result = livy_submit( server, '--pipeline', *scripts )
+
+        assert result.returncode == 1
+        assert 'Script {} did not finish successfully'.format( scripts[1] ) in result.stdout
+        # Only the statement after the failed one had been submitted
+        assert server.requests['POST /sessions/{id}/statements'] == 3
+        assert server.requests['POST /sessions/{id}/statements/{id}/cancel'] == 1
+        assert len( server.sessions ) == 0
+
+    # The rows of the summary: number, script, state, ...
+    rows = [ line.split() for line in result.stdout.splitlines() if line[:1].isdigit() ]
+    assert { row[1] : row[2] for row in rows } == { scripts[0] : 'available', scripts[1] : 'error', scripts[2] : 'cancelled', scripts[3] : 'skipped' }
+
+
+def test_upload_store_after_interrupted_upload(server, tmp_path):
+    script = write_script( tmp_path, 'job.py', 'import dep\n' )
+    dependency = write_script( tmp_path, 'dep.py', 'x = 1\n' * 1000 )
+    store = server.url + '/user/tester/store'
+
+    server.interrupted_uploads = 1
+    result = livy_submit( server, '-s', script, '--py-files', dependency, '--upload-store', store )
+
+    # No half written file is left under the name that marks it as uploaded
+    assert result.returncode == 1
+    assert server.files == {}
+    assert 'POST /sessions' not in server.requests
+
+    result = livy_submit( server, '-s', script, '--py-files', dependency, '--upload-store', store )
+
+    assert result.returncode == 0, result.stderr
+    assert [ len(data) for data in server.files.values() ] == [ os.path.getsize( dependency ) ]
+    # The Livy credentials are not sent to WebHDFS without --upload-credentials
+    assert ( 'POST', '/sessions' ) in server.authorized
+    assert not any( path.startswith('/webhdfs') for method, path in server.authorized )
+
+    server.reset_stats()
+    result = livy_submit( server, '-s', script, '--py-files', dependency, '--upload-store', store )
+
+    assert result.returncode == 0, result.stderr
+    assert 'Using previously uploaded' in result.stdout
+    assert not any( template.startswith('PUT /webhdfs') for template in server.requests )
+
+
+def test_session_on_several_servers(tmp_path):
+    with MockLivyServer( startup_time=0, statement_time=0 ) as a, MockLivyServer( startup_time=0, statement_time=0 ) as b:
+        a.add_session({ 'name' : 'LivySubmit - a', 'proxyUser' : 'tester', 'kind' : 'pyspark' })
+        b.add_session({ 'name' : 'LivySubmit - b', 'proxyUser' : 'tester', 'kind' : 'pyspark' })
+        b.add_session({ 'name' : 'LivySubmit - b', 'proxyUser' : 'tester', 'kind' : 'pyspark' })
+        url = ','.join([ b.url, a.url ])
+
+        # Session 0 exists on both servers, so it is not deleted on either
+        result = livy_submit( a, '-d', '0', url=url )
+
+        assert result.returncode == 1
+        assert a.url in result.stdout and b.url in result.stdout
+        assert '--server' in result.stdout
+        assert len( a.sessions ) == 1 and len( b.sessions ) == 2
+
+        result = livy_submit( a, '-d', '1', url=url )
+
+        assert result.returncode == 0, result.stderr
+        assert list( b.sessions ) == [ 0 ]
+
+        result = livy_submit( a, '-d', '0', '--server', a.url, url=url )
+
+        assert result.returncode == 0, result.stderr
+        assert len( a.sessions ) == 0 and list( b.sessions ) == [ 0 ]
@@ -0,0 +1,102 @@
+import json
+import random
+
+import pytest
+
+from livysubmit.streaming import StreamingJSONParser
+
+
+# Statements as Livy returns them, with escapes, surrogate pairs and non
+# ascii text in the streamed output and elsewhere
+DOCUMENTS = [
+    { 'id' : 0, 'state' : 'available', 'progress' : 1.0, 'code' : 'print(1)'
+      , 'output' : { 'status' : 'ok', 'execution_count' : 0, 'data' : { 'text/plain' : '1' } } }
+    , { 'id' : 1, 'state' : 'available', 'progress' : 1.0, 'code' : 'print("a\\tb")\n'
+        , 'output' : { 'status' : 'ok', 'execution_count' : 1
+                       , 'data' : { 'text/plain' : 'quote " backslash \\ slash / tab \t newline \n end\\'
+                                    , 'application/json' : '{"k": [1, 2.5e-3, true, null]}' } } }
+    , { 'id' : 2, 'state' : 'available', 'progress' : 1.0, 'code' : 'café \U0001F600'
+        , 'output' : { 'status' : 'ok', 'execution_count' : 2
+                       , 'data' : { 'text/plain' : 'café € \U0001F600\U0001F680 \u0000 \u001f' * 20 } } }
+    , { 'id' : 3, 'state' : 'error', 'progress' : 1.0, 'code' : 'raise X'
+        , 'output' : { 'status' : 'error', 'execution_count' : 3, 'ename' : 'NameError', 'evalue' : "name 'X' is not defined"
+                       , 'traceback' : [ 'Traceback (most recent call last):\n', '  File "<stdin>", line 1\n' ] } }
+    , { 'id' : 4, 'state' : 'running', 'progress' : 0.25, 'code' : '', 'output' : None, 'started' : -1, 'completed' : 0 }
+]
+
+
+def encodings(document):
+    # The compact, spaced and ascii-escaped json of a document
+    return [ json.dumps( document ), json.dumps( document, indent=2 ), json.dumps( document, ensure_ascii=False ) ]
+
+
+def parse(chunks):
+    streamed = {}
+    ends = []
+
+    def write(key, fragment):
+        if fragment is None:
+            ends.append( key )
+        else:
+            streamed[key] = streamed.get( key, '' ) + fragment
+
+    result = StreamingJSONParser( chunks, ('output', 'data'), write ).parse()
+    return result, streamed, ends
+
+
+def check(document, chunks):
+    result, streamed, ends = parse( chunks )
+
+    data = ( document.get('output') or {} ).get( 'data', {} )
+    expected = json.loads( json.dumps( document ))
+    if 'data' in ( expected.get('output') or {} ):
+        expected['output']['data'] = { key : None for key in data }
+
+    assert result == expected
+    assert streamed == { key : value for key, value in data.items() if value != '' }
+    assert ends == list( data.keys() )
+
+
+def split(text, positions):
+    positions = [ 0 ] + sorted( positions ) + [ len(text) ]
+    return [ text[a:b] for a, b in zip( positions[:-1], positions[1:] ) ]
+
+
+@pytest.mark.parametrize( 'document', DOCUMENTS )
+def test_whole_document(document):
+    for text in encodings( document ):
+        check( document, [ text ] )
+
+
+@pytest.mark.parametrize( 'document', DOCUMENTS )
+def test_every_single_split(document):
+    for text in encodings( document ):
+        for i in range( len(text) + 1 ):
+            check( document, split( text, [ i ] ))
+
+
+@pytest.mark.parametrize( 'document', DOCUMENTS )
+def test_one_character_chunks(document):
+    for text in encodings( document ):
+        check( document, list( text ))
+
+
+@pytest.mark.parametrize( 'document', DOCUMENTS )
+def test_random_splits(document):
+    rng = random.Random( 1 )
+    for text in encodings( document ):
+        for i in range(200):
+            positions = rng.sample( range( len(text) + 1 ), rng.randint( 1, min( 20, len(text) )))
+            check( document, split( text, positions ))
+
+
+def test_empty_chunks():
+    document = DOCUMENTS[1]
+    text = json.dumps( document )
+    check( document, [ '' ] + [ c for i in range( 0, len(text), 7 ) for c in ( text[i:i + 7], '' ) ] )
+
+
+@pytest.mark.parametrize( 'text', [ '', '{"id": 0', '{"output": {"data": {"text/plain": "abc', '{"id": 0,}', '{"id" 0}' ] )
+def test_invalid_documents(text):
+    with pytest.raises( ValueError ):
+        parse( split( text, [ len(text) // 2 ] ))